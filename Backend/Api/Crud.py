@@ -6,24 +6,45 @@ Assure l'interface entre SQLAlchemy et la logique métier.
 """
 
 import logging
+import numpy as np
 import pandas as pd
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import DateTime, func, select
+from sqlalchemy.dialects.sqlite import insert
 from datetime import datetime, timezone
 from typing import Dict, Any, List, Optional, Union, Tuple
 
 # Import des modèles depuis votre structure Backend.Api
 # from models import ClientData, ClusterProfile, PCAResult
 try:
-    from models import ClientData, ClusterProfile, PCAResult
+    from models import ClientData, ClusterProfile, PCAResult, client_natural_key, client_natural_keys
 except ImportError:
-    from .models import ClientData, ClusterProfile, PCAResult # Le point signifie "dans le même dossier"
+    from .models import ClientData, ClusterProfile, PCAResult, client_natural_key, client_natural_keys # Le point signifie "dans le même dossier"
+
+try:
+    from segments import record_new_clients
+except ImportError:
+    from .segments import record_new_clients
+
+try:
+    from database import begin_immediate
+except ImportError:
+    from .database import begin_immediate
 
 
 
 # Configuration du logger
 logger = logging.getLogger(__name__)
 
+# Lignes par INSERT ... ON CONFLICT DO NOTHING (bulk_upsert_clients)
+_INSERT_CHUNK = 5000
+# Identifiants par requête IN (...) (limite de variables SQLite)
+_ID_CHUNK = 10000
+# Colonnes de clé naturelle (empreinte ClientData.natural_key)
+_NATURAL_KEY = ("income", "year_birth", "dt_customer")
+# Format de stockage des DateTime SQLAlchemy sur SQLite
+_SQLITE_DATETIME = "%Y-%m-%d %H:%M:%S.%f"
+
 # =====================================================================
 #                 CRUD SUR LE MODÈLE CLIENTDATA
 # =====================================================================
@@ -36,10 +57,24 @@ def create_client(db: Session, client_data: Dict[str, Any]) -> ClientData:
     return client
 
 def update_client(db: Session, client: ClientData, updates: Dict[str, Any]) -> ClientData:
-    """Met à jour les attributs d'un client existant."""
+    """
+    Met à jour les attributs d'un client existant.
+
+    Si la clé naturelle change, l'empreinte est recalculée. Quand elle appartient déjà
+    à un autre client (cas des doublons historiques laissés à NULL par la migration 3),
+    natural_key reste NULL : la mise à jour n'échoue pas sur l'index unique.
+    """
     for key, value in updates.items():
         if hasattr(client, key):
             setattr(client, key, value)
+    if any(key in updates for key in _NATURAL_KEY):
+        natural_key = client_natural_key(client.income, client.year_birth, client.dt_customer)
+        taken = db.execute(
+            select(ClientData.id).where(ClientData.natural_key == natural_key, ClientData.id != client.id)
+        ).first()
+        if taken:
+            logger.warning(f"Client {client.id} : clé naturelle déjà portée par le client {taken[0]} (natural_key NULL)")
+        client.natural_key = None if taken else natural_key
     db.flush()
     return client
 
@@ -93,50 +128,94 @@ def get_clients_by_cluster(
 
 
 
+def _existing_ids(db: Session, ids: List[int]) -> set:
+    found = set()
+    for start in range(0, len(ids), _ID_CHUNK):
+        chunk = ids[start:start + _ID_CHUNK]
+        found.update(db.execute(select(ClientData.id).where(ClientData.id.in_(chunk))).scalars())
+    return found
+
+
+def _column_values(series: pd.Series, column) -> List[Any]:
+    """Colonne du DataFrame → valeurs Python natives (None pour NaN/NaT), dates au format SQLite."""
+    if isinstance(column.type, DateTime):
+        # Chaque date distincte n'est formatée qu'une fois ; code -1 (NaT) → None ajouté en dernier
+        codes, uniques = pd.factorize(pd.to_datetime(series, errors="coerce"))
+        formatted = np.append(uniques.strftime(_SQLITE_DATETIME).to_numpy(dtype=object), None)
+        return formatted[codes].tolist()
+    if not series.hasnans:
+        return series.tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _client_values(df: pd.DataFrame) -> Dict[str, List[Any]]:
+    """Colonnes de client_data présentes dans le DataFrame (valeurs natives) + empreinte natural_key."""
+    table = ClientData.__table__
+    columns = [c for c in df.columns if c in set(table.columns.keys()) - {"natural_key"}]
+    values = {c: _column_values(df[c], table.columns[c]) for c in columns}
+    empty = [None] * len(df)
+    values["natural_key"] = client_natural_keys(*(values.get(c, empty) for c in _NATURAL_KEY))
+    return values
+
+
 def bulk_upsert_clients(db: Session, df: pd.DataFrame, id_col: Optional[str] = None) -> Tuple[int, int]:
     """
     Insère ou ignore les doublons.
     Retourne (nombre_insérés, nombre_doublons_ignorés).
+
+    Ensembliste : INSERT ... ON CONFLICT DO NOTHING en executemany, par lots de
+    _INSERT_CHUNK lignes. Doublon = même empreinte de clé naturelle (index unique
+    sur natural_key, y compris à l'intérieur du DataFrame), id déjà pris ou, avec
+    `id_col`, identifiant déjà présent en base.
     """
     if df.empty:
         return 0, 0
-    
-    new_count = 0
-    skip_count = 0
-    
+
     try:
-        for _, row in df.iterrows():
-            data = row.to_dict()
-            existing = None
-
-            # 1. Recherche par ID (si présent)
-            if id_col and id_col in data and pd.notna(data[id_col]):
-                existing = db.get(ClientData, int(data[id_col]))
-            
-            # 2. Recherche par critères métier (si pas d'ID ou ID non trouvé)
-            # Empêche d'insérer 2 fois le même client du CSV lors de plusieurs runs
-            if not existing:
-                existing = db.query(ClientData).filter(
-                    ClientData.income == data.get('income'),
-                    ClientData.year_birth == data.get('year_birth'),
-                    ClientData.dt_customer == data.get('dt_customer')
-                ).first()
-
-            if existing:
-                # Optionnel : Vous pourriez mettre à jour ici. 
-                # Pour l'ingestion initiale, on choisit souvent d'ignorer (skip)
-                skip_count += 1
-                continue 
-            
-            # 3. Création du nouveau client
-            # On ne garde que les clés qui existent vraiment dans le modèle SQLAlchemy
-            clean_data = {k: v for k, v in data.items() if hasattr(ClientData, k)}
-            new_client = ClientData(**clean_data)
-            db.add(new_client)
-            new_count += 1
+        # Verrou d'écriture dès le début : les ids > max_id seront ceux de cet appel
+        begin_immediate(db)
+        max_id = db.execute(select(func.max(ClientData.id))).scalar() or 0
+
+        # 1. Recherche par ID (si présent) : une requête IN par lot d'identifiants
+        frame = df
+        if id_col and id_col in df.columns:
+            ids = pd.to_numeric(df[id_col], errors="coerce")
+            known = _existing_ids(db, ids.dropna().astype(int).unique().tolist())
+            frame = df[~ids.isin(known)]
+
+        # 2. Insertion ; les conflits de clé naturelle (ou d'id) sont ignorés par SQLite
+        values = _client_values(frame)
+        explicit = [int(i) for i in values["id"] if i is not None] if "id" in values else []
+        taken = _existing_ids(db, explicit)
+        stmt = insert(ClientData.__table__).on_conflict_do_nothing().compile(
+            dialect=db.get_bind().dialect, column_keys=list(values)
+        )
+        # Tuples dans l'ordre des paramètres de la requête compilée (executemany du driver)
+        rows = list(zip(*(values[c] for c in stmt.positiontup)))
+        conn = db.connection()
+        for start in range(0, len(rows), _INSERT_CHUNK):
+            conn.exec_driver_sql(str(stmt), rows[start:start + _INSERT_CHUNK])
+
+        # 3. Nouveaux clients : ids attribués après max_id (plage continue en général, sans relecture
+        # des ids), plus les ids explicites insérés sous max_id
+        count, first, last = db.execute(
+            select(func.count(ClientData.id), func.min(ClientData.id), func.max(ClientData.id))
+            .where(ClientData.id > max_id)
+        ).one()
+        if count and count != last - first + 1:
+            above = sorted(db.execute(select(ClientData.__table__.c.id).where(ClientData.id > max_id)).scalars())
+        else:
+            above = range(first, last + 1) if count else range(0)
+        below = _existing_ids(db, [i for i in explicit if i <= max_id]) - taken
+        inserted = len(above) + len(below)
 
+        # Agrégats de segments (segment -1 tant que non clusterisés), même transaction
+        if below:
+            record_new_clients(db, below)
+        if above:
+            record_new_clients(db, above)
         db.commit()
-        return new_count, skip_count
+        return inserted, len(df) - inserted
 
     except Exception as e:
         db.rollback()
@@ -183,7 +262,7 @@ def save_pca_results(
         for _, row in pca_df.iterrows():
             c_id = row[client_id_col] if client_id_col and client_id_col in pca_df.columns else None
             pca = PCAResult(
-                client_id=int(c_id) if c_id not in (None, pd.NA) else None,
+                client_id=int(c_id) if c_id is not None and pd.notna(c_id) else None,
                 pc1=float(row["PC1"]),
                 pc2=float(row["PC2"]),
                 model_type=model_type,
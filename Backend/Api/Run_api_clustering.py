@@ -6,8 +6,10 @@
 #   ✔️ Compatible Windows
 #   ✔️ Affichage propre des logs
 ##################################################################################
+import os
 import subprocess
 import socket
+import sys
 import time
 
 # ------------------------------
@@ -82,7 +84,19 @@ def image_exists(name):
 # ------------------------------
 # SCRIPT PRINCIPAL
 # ------------------------------
+def run_local():
+    """Lance l'API sans Docker avec le lanceur de production (préchargement + fork des workers)"""
+    launcher = os.path.join(os.path.dirname(os.path.abspath(__file__)), "launcher.py")
+    env = dict(os.environ, API_PORT=str(PORT_HOST))
+    print(f"✅ L'API sera accessible sur : http://localhost:{PORT_HOST}/docs")
+    subprocess.run([sys.executable, launcher], env=env)
+
 def main():
+    # Mode local : python Run_api_clustering.py --local
+    if "--local" in sys.argv:
+        run_local()
+        return
+
     # Vérifie le port local
     if is_port_in_use(PORT_HOST):
         raise RuntimeError(f"🚫 Le port {PORT_HOST} est déjà utilisé.")
@@ -6,7 +6,9 @@
 import requests
 import json
 import time
+import sys
 from datetime import datetime
+from pathlib import Path
 
 
 
@@ -90,6 +92,32 @@ def test_predict_single():
     data = response.json()
     print(f"Cluster prédit: {data['cluster']} (Probabilité: {data.get('probability', 'N/A')})")
 
+def test_fast_path_parity():
+    # Comparaison en local : moteur NumPy compilé vs chemin pandas + sklearn
+    import joblib
+    import pandas as pd
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from Api.inference import CompiledInferenceEngine
+
+    data_dir = Path(__file__).resolve().parent.parent.parent / "Data"
+    preprocessor = joblib.load(data_dir / "preprocessor.joblib")
+    classifier = joblib.load(data_dir / "classifier_best.joblib")
+    engine = CompiledInferenceEngine(preprocessor, classifier)
+    print("Mode moteur:", engine.describe())
+
+    client_unknown = dict(client_standard, Education="Autre", Marital_Status="Inconnu")
+    for client in (client_vip, client_standard, client_unknown):
+        X = preprocessor.transform(pd.DataFrame([client]))
+        expected = int(classifier.predict(X)[0])
+        probs = classifier.predict_proba(X)[0]
+        expected_proba = float(probs[list(classifier.classes_).index(expected)])
+
+        cluster, probability = engine.predict_one(client)
+        assert cluster == expected, f"Cluster {cluster} != {expected}"
+        assert abs(probability - expected_proba) < 1e-9, f"Probabilité {probability} != {expected_proba}"
+        assert abs(engine.vectorize([client]) - X).max() < 1e-12, "Vecteur de features divergent"
+    print("Parité moteur compilé / sklearn : OK")
+
 def test_batch_clustering():
     url = f"{BASE_URL}/cluster"
     # Note: embed=True impose d'envelopper la liste dans une clé "clients"
@@ -100,6 +128,42 @@ def test_batch_clustering():
     for res in results:
         print(f"Client {res['client_index']}: Segment '{res['segment']}' | Priorité: {res['priority']}")
 
+def test_columnar_payload():
+    # Même lot envoyé colonne par colonne : {"Age": [...], "Income": [...], ...}
+    url = f"{BASE_URL}/cluster"
+    clients = [client_vip, client_standard]
+    rows = requests.post(url, json={"clients": clients})
+    columns = requests.post(url, json={k: [c[k] for c in clients] for k in client_vip})
+    rows.raise_for_status()
+    columns.raise_for_status()
+    expected = [r["cluster"] for r in rows.json()["results"]]
+    got = [r["cluster"] for r in columns.json()["results"]]
+    assert got == expected, f"Clusters colonne par colonne {got} != {expected}"
+
+    bad = {k: [c[k] for c in clients] for k in client_vip}
+    bad["Age"] = bad["Age"][:1]
+    response = requests.post(url, json=bad)
+    assert response.status_code == 422, f"Longueurs différentes acceptées ({response.status_code})"
+
+    # Tableau à deux dimensions et entier hors des bornes de int64 : 422, pas 500
+    for column, values in (("Age", [[45, 1], [30, 2]]), ("Kidhome", [1e30, 0])):
+        bad = {k: [c[k] for c in clients] for k in client_vip}
+        bad[column] = values
+        response = requests.post(url, json=bad)
+        assert response.status_code == 422, f"{column}={values} accepté ({response.status_code})"
+    print("Corps colonne par colonne : OK")
+
+def test_file_upload():
+    # Export brut (Year_Birth, Dt_Customer) → fichier scoré renvoyé en streaming
+    csv_path = Path(__file__).resolve().parent.parent.parent / "Data" / "marketing_campaign_clean.csv"
+    with open(csv_path, "rb") as f:
+        response = requests.post(f"{BASE_URL}/score/file", files={"file": (csv_path.name, f, "text/csv")})
+    response.raise_for_status()
+    lines = response.text.splitlines()
+    header = lines[0].split(";")
+    assert header[-4:] == ["cluster", "confidence", "PC1", "PC2"], f"Colonnes ajoutées inattendues : {header[-4:]}"
+    print(f"Fichier scoré : {len(lines) - 1} lignes, première : {lines[1][-60:]}")
+
 def test_pca_projection():
     url = f"{BASE_URL}/apply-pca"
     payload = {"clients": [client_vip, client_standard]}
@@ -109,6 +173,35 @@ def test_pca_projection():
     coords = response.json()["pca_components"]
     print(f"Coordonnées PCA (Client 1): {coords[0]}")
 
+    # Lot vide (liste ou colonnes vides) : 400 comme /cluster et /score, pas 500
+    for body in ({"clients": []}, {k: [] for k in client_vip}):
+        response = requests.post(url, json=body, params=params)
+        assert response.status_code == 400, f"Lot vide : {response.status_code}"
+
+def test_pca_nearest_outside():
+    # Requêtes hors de l'étendue des données : résultat exact et sans parcours de toute la grille
+    import numpy as np
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    from Api.pca_store import GridIndex
+
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=200_000).astype(np.float32)
+    y = rng.normal(size=200_000).astype(np.float32)
+    grid = GridIndex(x, y)
+    for qx, qy in [(10.0, 10.0), (-20.0, 0.0), (0.0, -1e3), (x[0], y[0])]:
+        start = time.time()
+        rows = grid.nearest(x, y, qx, qy, 10)
+        elapsed_ms = (time.time() - start) * 1000
+        d2 = (x.astype(np.float64) - qx) ** 2 + (y.astype(np.float64) - qy) ** 2
+        assert np.allclose(d2[rows], np.sort(d2)[:10]), f"Voisins inexacts pour ({qx}, {qy})"
+        print(f"({qx:g}, {qy:g}) : {elapsed_ms:.2f} ms")
+
+    response = requests.get(f"{BASE_URL}/pca/nearest", params={"pc1": 10, "pc2": 10, "k": 5})
+    response.raise_for_status()
+    distances = [p["distance"] for p in response.json()["data"]]
+    assert len(distances) == 5 and distances == sorted(distances), f"Distances inattendues : {distances}"
+    print(f"API (10, 10) → distance min {distances[0]:.3f}")
+
 def test_save_to_sqlite():
     url = f"{BASE_URL}/save-prediction"
     # Simulation d'un retour de prédiction complet pour sauvegarde
@@ -121,14 +214,44 @@ def test_save_to_sqlite():
     }
     response = requests.post(url, json=payload)
     response.raise_for_status()
+    print(f"Mise en file (écriture par lots): {response.json().get('buffered')}")
+    # sync=true : insertion immédiate, l'ID est retourné
+    response = requests.post(url, json=payload, params={"sync": "true"})
+    response.raise_for_status()
     print(f"ID Enregistrement SQLite: {response.json().get('id')}")
 
+def test_predict_and_log():
+    url = f"{BASE_URL}/predict-cluster"
+    response = requests.post(url, json=client_vip, params={"log": "true"})
+    response.raise_for_status()
+    assert response.json()["logged"] is True
+    stats = requests.get(f"{BASE_URL}/metrics/prediction-log").json()["data"]
+    print(f"Journal des prédictions: file={stats['queue_depth']} écrits={stats['written']} lots={stats['batches']}")
+
+def test_predictions_timeseries():
+    rollup = requests.post(f"{BASE_URL}/admin/predictions/rollup")
+    rollup.raise_for_status()
+    print("Cycle d'agrégation:", rollup.json()["data"])
+    response = requests.get(f"{BASE_URL}/predictions/timeseries", params={"granularity": "day"})
+    response.raise_for_status()
+    data = response.json()
+    print(f"Tranches journalières: {len(data['data'])} (en attente: {data['pending']})")
+
 def test_stats():
     url = f"{BASE_URL}/segments/stats"
     response = requests.get(url)
     response.raise_for_status()
     print("Aperçu Stats:", response.json()["data"][:2])
 
+def test_stats_rebuild():
+    url = f"{BASE_URL}/segments/stats"
+    # Recalcul complet : les agrégats incrémentaux ne doivent pas avoir dérivé
+    response = requests.get(url, params={"rebuild": "true"})
+    response.raise_for_status()
+    body = response.json()
+    assert body["drift_cells"] == 0, f"Dérive des agrégats : {body['drift_cells']} cellules"
+    print("Mnt vins (segment 0):", body["data"][0]["features"]["mnt_wines"])
+
 # -------------------------------------------------------------------------
 # EXECUTION
 # -------------------------------------------------------------------------
@@ -140,9 +263,16 @@ if __name__ == "__main__":
 
     run_test("Santé & Base SQLite", test_health_and_db)
     run_test("Prédiction Individuelle", test_predict_single)
+    run_test("Parité chemin rapide NumPy", test_fast_path_parity)
     run_test("Clustering par Lot (Batch)", test_batch_clustering)
+    run_test("Clustering colonne par colonne", test_columnar_payload)
+    run_test("Scoring de fichier CSV", test_file_upload)
     run_test("Projection PCA temps réel", test_pca_projection)
+    run_test("Voisins PCA hors de l'étendue des données", test_pca_nearest_outside)
     run_test("Sauvegarde en Base de Données", test_save_to_sqlite)
+    run_test("Prédiction + journalisation (log=true)", test_predict_and_log)
+    run_test("Série temporelle des prédictions", test_predictions_timeseries)
     run_test("Statistiques des Segments", test_stats)
+    run_test("Agrégats de segments (recalcul)", test_stats_rebuild)
 
     print(f"\n{GREEN}✨ Tous les tests critiques sont terminés !{ENDC}")
\ No newline at end of file
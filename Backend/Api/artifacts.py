@@ -0,0 +1,331 @@
+"""
+artifacts.py
+------------
+Gestion des artefacts ML avec rechargement à chaud.
+
+Les artefacts (préprocesseur, classifieur, KMeans, PCA, métadonnées) sont
+regroupés dans un ArtifactBundle immuable. L'ArtifactManager :
+  - charge une nouvelle version entièrement en arrière-plan,
+  - la valide (dimensions cohérentes, prédiction sur un client sonde),
+  - puis la substitue atomiquement à la version active.
+
+Chaque requête récupère le bundle actif une seule fois à son début : les
+requêtes en cours terminent avec l'ancienne version, les suivantes utilisent
+la nouvelle, sans redémarrer les workers.
+
+Le rechargement est déclenché par POST /admin/reload ou par un thread de
+surveillance qui observe model_metadata.json. clustering.py écrit ce fichier
+en dernier : sa modification signale qu'un jeu complet d'artefacts est prêt.
+
+Avec ARTIFACT_MMAP=1, les artefacts sont chargés avec joblib mmap_mode="r" :
+les tableaux NumPy restent projetés depuis les fichiers .joblib, en lecture
+seule, et leurs pages sont partagées entre les workers uvicorn.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import joblib
+import pandas as pd
+
+from Api.inference import CompiledInferenceEngine
+from Api.memstats import array_footprint, mapped_file_usage, process_memory, read_smaps
+
+logger = logging.getLogger(__name__)
+
+# Intervalle de surveillance de Data/ en secondes (0 = désactivé, rechargement via /admin/reload uniquement)
+ARTIFACT_WATCH_INTERVAL = float(os.getenv("ARTIFACT_WATCH_INTERVAL", "10"))
+# Chargement des tableaux NumPy par projection mémoire (pages partagées entre workers)
+ARTIFACT_MMAP = os.getenv("ARTIFACT_MMAP", "0").lower() in ("1", "true", "yes")
+
+PREPROCESSOR_FILE = "preprocessor.joblib"
+CLASSIFIER_FILE = "classifier_best.joblib"
+KMEANS_FILE = "kmeans_model.joblib"
+PCA_FILE = "pca_model.joblib"
+METADATA_FILE = "model_metadata.json"
+
+ARTIFACT_FILES = [PREPROCESSOR_FILE, CLASSIFIER_FILE, KMEANS_FILE, PCA_FILE, METADATA_FILE]
+
+
+class ArtifactValidationError(Exception):
+    """Un jeu d'artefacts chargé est incohérent : il ne doit pas être activé."""
+
+
+@dataclass(frozen=True)
+class ArtifactBundle:
+    """Version complète et immuable des artefacts servis par l'API."""
+    version: str
+    preprocessor: Any
+    classifier: Any
+    kmeans: Any
+    pca: Any
+    metadata: Dict[str, Any]
+    engine: CompiledInferenceEngine
+    source_dir: Path
+    mmap: bool = False
+    loaded_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+
+    def model_info(self) -> Dict[str, Any]:
+        """Sous-ensemble des métadonnées renvoyé avec chaque prédiction."""
+        info = {k: self.metadata.get(k) for k in ["classifier", "cv_accuracy", "test_accuracy", "kmeans_k", "created_at"]}
+        info["version"] = self.version
+        return info
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "source_dir": str(self.source_dir),
+            "loaded_at": self.loaded_at,
+            "created_at": self.metadata.get("created_at"),
+            "mmap": self.mmap,
+        }
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """
+        Mémoire par artefact : pages projetées depuis le fichier .joblib (résidentes,
+        partagées, privées, en kB) et octets de tableaux NumPy projetés / copiés dans le tas.
+        """
+        mappings = read_smaps()
+        artifacts = {}
+        for name, obj, filename in (
+            ("preprocessor", self.preprocessor, PREPROCESSOR_FILE),
+            ("classifier", self.classifier, CLASSIFIER_FILE),
+            ("kmeans", self.kmeans, KMEANS_FILE),
+            ("pca", self.pca, PCA_FILE),
+        ):
+            path = self.source_dir / filename
+            artifacts[name] = {
+                "file_bytes": path.stat().st_size if path.exists() else None,
+                "mapped": mapped_file_usage(path, mappings),
+                "arrays": array_footprint(obj),
+            }
+        return {"mmap": self.mmap, "artifacts": artifacts, "process": process_memory()}
+
+
+# -------------------------------------------------------------------------
+# Chargement et validation
+# -------------------------------------------------------------------------
+def compute_version(directory: Path, metadata: Dict[str, Any]) -> str:
+    """Version déclarée dans les métadonnées, sinon empreinte courte du contenu des artefacts."""
+    declared = metadata.get("version")
+    if declared:
+        return str(declared)
+    digest = hashlib.sha1()
+    for name in ARTIFACT_FILES:
+        digest.update((directory / name).read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def load_bundle(directory: Path, mmap: bool = ARTIFACT_MMAP) -> ArtifactBundle:
+    """
+    Charge un jeu complet d'artefacts depuis `directory` (sans l'activer).
+    Avec mmap=True, les tableaux des fichiers non compressés sont projetés en lecture seule.
+    """
+    directory = Path(directory)
+    mmap_mode = "r" if mmap else None
+    preprocessor = joblib.load(directory / PREPROCESSOR_FILE, mmap_mode=mmap_mode)
+    classifier = joblib.load(directory / CLASSIFIER_FILE, mmap_mode=mmap_mode)
+    kmeans = joblib.load(directory / KMEANS_FILE, mmap_mode=mmap_mode)
+    pca = joblib.load(directory / PCA_FILE, mmap_mode=mmap_mode)
+    with open(directory / METADATA_FILE, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    return ArtifactBundle(
+        version=compute_version(directory, metadata),
+        preprocessor=preprocessor,
+        classifier=classifier,
+        kmeans=kmeans,
+        pca=pca,
+        metadata=metadata,
+        # Chemin rapide NumPy (retombe sur sklearn si un artefact n'est pas supporté)
+        engine=CompiledInferenceEngine(preprocessor, classifier),
+        source_dir=directory,
+        mmap=mmap,
+    )
+
+
+def _probe_frame(preprocessor) -> pd.DataFrame:
+    """Client sonde : 0 pour les variables numériques, première catégorie connue sinon."""
+    row: Dict[str, Any] = {}
+    for name, transformer, columns in getattr(preprocessor, "transformers_", []):
+        categories = getattr(transformer, "categories_", None)
+        for j, col in enumerate(columns if isinstance(columns, list) else list(columns)):
+            row[col] = categories[j][0] if categories is not None else 0.0
+    if not row:
+        row = {col: 0.0 for col in getattr(preprocessor, "feature_names_in_", [])}
+    return pd.DataFrame([row])
+
+
+def validate_bundle(bundle: ArtifactBundle) -> None:
+    """Vérifie la cohérence du bundle ; lève ArtifactValidationError sinon."""
+    try:
+        X = bundle.preprocessor.transform(_probe_frame(bundle.preprocessor))
+    except Exception as e:
+        raise ArtifactValidationError(f"Préprocesseur inutilisable : {e}")
+
+    n_features = X.shape[1]
+    for name, model in (("classifier", bundle.classifier), ("kmeans", bundle.kmeans), ("pca", bundle.pca)):
+        expected = getattr(model, "n_features_in_", n_features)
+        if expected != n_features:
+            raise ArtifactValidationError(
+                f"{name} attend {expected} features, le préprocesseur en produit {n_features}"
+            )
+
+    k = bundle.metadata.get("kmeans_k")
+    if k is not None and int(k) != bundle.kmeans.n_clusters:
+        raise ArtifactValidationError(f"kmeans_k={k} dans les métadonnées, {bundle.kmeans.n_clusters} dans le modèle")
+
+    try:
+        expected_cluster = int(bundle.classifier.predict(X)[0])
+        bundle.kmeans.predict(X)
+        bundle.pca.transform(X)
+        clusters, _ = bundle.engine.predict_matrix(bundle.engine.transform(_probe_frame(bundle.preprocessor)))
+    except Exception as e:
+        raise ArtifactValidationError(f"Prédiction sonde en échec : {e}")
+
+    if int(clusters[0]) != expected_cluster:
+        raise ArtifactValidationError("Moteur compilé et classifieur sklearn divergent sur le client sonde")
+
+
+# -------------------------------------------------------------------------
+# Gestionnaire : substitution atomique + surveillance
+# -------------------------------------------------------------------------
+class ArtifactManager:
+    """Détient le bundle actif et orchestre son remplacement à chaud."""
+
+    def __init__(self, directory: Path, watch_interval: float = ARTIFACT_WATCH_INTERVAL):
+        self.directory = Path(directory)
+        self.watch_interval = watch_interval
+        self._bundle: Optional[ArtifactBundle] = None
+        self._swap_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[ArtifactBundle, Optional[ArtifactBundle]], None]] = []
+
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._marker_mtime: Optional[int] = None
+
+        self.reload_count = 0
+        self.last_error: Optional[str] = None
+        self.last_reload_at: Optional[str] = None
+
+    @property
+    def current(self) -> Optional[ArtifactBundle]:
+        """Bundle actif (à récupérer une seule fois par requête)."""
+        return self._bundle
+
+    def add_listener(self, callback: Callable[[ArtifactBundle, Optional[ArtifactBundle]], None]) -> None:
+        """callback(nouveau, ancien) est appelé après chaque substitution."""
+        self._listeners.append(callback)
+
+    def _marker_state(self) -> Optional[int]:
+        try:
+            return (self.directory / METADATA_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _install(self, bundle: ArtifactBundle) -> Optional[ArtifactBundle]:
+        with self._swap_lock:
+            previous, self._bundle = self._bundle, bundle
+        for callback in self._listeners:
+            try:
+                callback(bundle, previous)
+            except Exception as e:
+                logger.error(f"Erreur dans un listener de rechargement : {e}")
+        return previous
+
+    def load_initial(self) -> ArtifactBundle:
+        """Chargement synchrone au démarrage (une erreur empêche l'API de démarrer)."""
+        self._marker_mtime = self._marker_state()
+        bundle = load_bundle(self.directory)
+        validate_bundle(bundle)
+        self._install(bundle)
+        self.last_reload_at = bundle.loaded_at
+        logger.info(f"Artefacts chargés (version {bundle.version})")
+        return bundle
+
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Charge et valide une nouvelle version, puis l'active atomiquement.
+        En cas d'échec, la version active reste en place et l'erreur est levée.
+        """
+        with self._reload_lock:
+            marker = self._marker_state()
+            try:
+                bundle = load_bundle(self.directory)
+                validate_bundle(bundle)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"Rechargement refusé, version {self.version} conservée : {e}")
+                raise
+
+            current = self._bundle
+            if current is not None and bundle.version == current.version and not force:
+                self._marker_mtime = marker
+                return {"status": "unchanged", "version": current.version}
+
+            previous = self._install(bundle)
+            self._marker_mtime = marker
+            self.reload_count += 1
+            self.last_error = None
+            self.last_reload_at = bundle.loaded_at
+            logger.info(f"Artefacts rechargés : {previous.version if previous else None} → {bundle.version}")
+            return {
+                "status": "reloaded",
+                "version": bundle.version,
+                "previous_version": previous.version if previous else None,
+            }
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._bundle.version if self._bundle else None
+
+    # ------------------------------------------------------------------
+    # Surveillance de Data/
+    # ------------------------------------------------------------------
+    def start_watcher(self) -> None:
+        if self.watch_interval <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="artifact-watcher", daemon=True)
+        self._watcher.start()
+        logger.info(f"Surveillance de {self.directory / METADATA_FILE} toutes les {self.watch_interval:g} s")
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.watch_interval + 1)
+        self._watcher = None
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.watch_interval):
+            marker = self._marker_state()
+            if marker is None or marker == self._marker_mtime:
+                continue
+            # On attend que le fichier ne bouge plus pendant un intervalle (écriture terminée)
+            time.sleep(min(self.watch_interval, 2.0))
+            if self._marker_state() != marker:
+                continue
+            try:
+                self.reload()
+            except Exception:
+                # Version incohérente : on ne réessaie qu'à la prochaine modification
+                self._marker_mtime = marker
+
+    def describe(self) -> Dict[str, Any]:
+        bundle = self._bundle
+        return {
+            "active": bundle.describe() if bundle else None,
+            "reload_count": self.reload_count,
+            "last_reload_at": self.last_reload_at,
+            "last_error": self.last_error,
+            "watch_interval_s": self.watch_interval,
+        }
@@ -0,0 +1,184 @@
+"""
+batching.py
+-----------
+Coalesceur de requêtes (micro-batching) pour /predict-cluster.
+
+Sous charge concurrente, chaque requête unitaire paie séparément le coût fixe
+de l'appel au modèle. Le coalesceur place les clients dans une file asyncio et
+les envoie au modèle en un seul lot vectorisé dès que :
+  - la taille maximale du lot est atteinte, ou
+  - la fenêtre de temps (ex. 2 ms) depuis le premier client en attente expire.
+
+Chaque requête récupère ensuite son propre résultat. Des histogrammes de
+taille de lot et de temps d'attente permettent d'arbitrer p99 vs débit.
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Histogramme cumulatif à bornes fixes (style Prometheus)."""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[Union[float, str]]:
+        """Borne supérieure du bucket contenant le quantile q (approximation)."""
+        if not self.total:
+            return None
+        target = q * self.total
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return "+Inf"
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [str(b) for b in self.bounds] + ["+Inf"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.total,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.total, 6) if self.total else None,
+            "p50": self.quantile(0.50),
+            "p99": self.quantile(0.99),
+        }
+
+
+class CoalescerFull(Exception):
+    """La file d'attente du coalesceur a atteint sa profondeur maximale."""
+
+
+class PredictionCoalescer:
+    """
+    Regroupe des prédictions unitaires en lots vectorisés.
+
+    `score_batch` reçoit une liste de dictionnaires clients et renvoie une liste
+    de résultats dans le même ordre. Il est exécuté hors de la boucle asyncio par
+    `runner` (ex. ScoringExecutor.run), ou dans un thread par défaut.
+    """
+
+    def __init__(
+        self,
+        score_batch: Callable[[List[Dict[str, Any]]], List[Any]],
+        window_ms: float = 2.0,
+        max_batch_size: int = 64,
+        max_queue_size: int = 1024,
+        runner: Optional[Callable[..., Awaitable[Any]]] = None,
+    ):
+        self.score_batch = score_batch
+        self.runner = runner or asyncio.to_thread
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Lot en cours de constitution ou de scoring : échoué par stop() si la tâche est annulée
+        self._inflight: List[Tuple[Dict[str, Any], asyncio.Future, float]] = []
+
+        self.batch_size_hist = Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256, 512])
+        self.wait_ms_hist = Histogram([0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100])
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Coalesceur démarré (fenêtre={self.window * 1000:.1f} ms, "
+            f"lot max={self.max_batch_size}, file max={self.max_queue_size})"
+        )
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Les requêtes du lot interrompu et celles encore en file ne doivent pas rester suspendues
+        pending = self._inflight
+        self._inflight = []
+        while self._queue and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future, _ in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Coalesceur arrêté"))
+        self._task = None
+
+    async def submit(self, record: Dict[str, Any]) -> Any:
+        """Place un client dans la file et attend son résultat."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((record, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise CoalescerFull(f"File du coalesceur pleine ({self.max_queue_size})")
+        return await future
+
+    async def _collect(self) -> List[Tuple[Dict[str, Any], asyncio.Future, float]]:
+        """Attend un premier client puis remplit le lot jusqu'à la taille ou la fenêtre max."""
+        batch = self._inflight = [await self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            flushed_at = time.perf_counter()
+
+            self.batch_size_hist.observe(len(batch))
+            for _, _, enqueued_at in batch:
+                self.wait_ms_hist.observe((flushed_at - enqueued_at) * 1000.0)
+
+            try:
+                results = await self.runner(self.score_batch, [record for record, _, _ in batch])
+            except Exception as e:
+                logger.error(f"Erreur lors du scoring d'un lot coalescé : {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._inflight = []
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self._inflight = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "running": self.running,
+            "window_ms": self.window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "batch_size": self.batch_size_hist.snapshot(),
+            "wait_ms": self.wait_ms_hist.snapshot(),
+        }
@@ -0,0 +1,94 @@
+"""
+categorical.py
+--------------
+Normalisation unique des variables catégorielles (Education, Marital_Status).
+
+Les catégories de référence sont celles apprises par le OneHotEncoder du
+préprocesseur : c'est la seule liste qui fait foi pour le modèle. Chaque
+valeur brute est ramenée à sa catégorie canonique (espaces superflus et casse
+ignorés, ex. " phd " → "PhD") puis à un code entier, en une passe vectorisée :
+
+  - codes(...)           : codes entiers (-1 = catégorie inconnue), utilisés par
+                           le moteur compilé (inference.py)
+  - normalize_frame(...) : colonnes pd.Categorical à catégories fixes (inconnue
+                           = NaN, encodée à zéro par handle_unknown="ignore"),
+                           pour les chemins qui passent par preprocessor.transform
+
+Tous les endpoints et force_update_db.py utilisent ce même normaliseur.
+"""
+
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# En dessous de cette taille, un dictionnaire est plus rapide que pandas
+_SMALL_BATCH = 32
+
+
+def _fold(value: Any) -> Optional[str]:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return str(value).strip().casefold()
+
+
+class CategoricalNormalizer:
+    """Catégories fixes par colonne et table de correspondance valeur brute → code."""
+
+    def __init__(self, categories: Mapping[str, Sequence[Any]]):
+        self.categories: Dict[str, List[Any]] = {col: list(cats) for col, cats in categories.items()}
+        self._exact: Dict[str, Dict[Any, int]] = {}
+        self._folded: Dict[str, Dict[str, int]] = {}
+        for col, cats in self.categories.items():
+            self._exact[col] = {cat: i for i, cat in enumerate(cats)}
+            folded: Dict[str, int] = {}
+            for i, cat in enumerate(cats):
+                folded.setdefault(_fold(cat), i)
+            self._folded[col] = folded
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor) -> Optional["CategoricalNormalizer"]:
+        """Construit le normaliseur à partir des OneHotEncoder du ColumnTransformer."""
+        categories: Dict[str, Sequence[Any]] = {}
+        for _, transformer, columns in getattr(preprocessor, "transformers_", []):
+            encoder_categories = getattr(transformer, "categories_", None)
+            if encoder_categories is None:
+                continue
+            for col, cats in zip(columns, encoder_categories):
+                categories[col] = cats.tolist()
+        return cls(categories) if categories else None
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.categories)
+
+    def codes(self, column: str, values: Iterable[Any]) -> np.ndarray:
+        """Codes entiers des valeurs (position dans les catégories, -1 si inconnue)."""
+        values = values if isinstance(values, (list, np.ndarray, pd.Series)) else list(values)
+        if len(values) <= _SMALL_BATCH:
+            return np.fromiter((self._code(column, v) for v in values), dtype=np.int64, count=len(values))
+
+        # Une passe de hachage (factorize), puis résolution des seules valeurs distinctes
+        positions, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=True)
+        table = np.fromiter((self._code(column, v) for v in uniques), dtype=np.int64, count=len(uniques))
+        # Sentinelle -1 (valeur manquante) → dernière case, fixée à -1
+        table = np.append(table, -1)
+        return table[positions]
+
+    def _code(self, column: str, value: Any) -> int:
+        code = self._exact[column].get(value) if isinstance(value, str) else None
+        if code is None:
+            code = self._folded[column].get(_fold(value), -1)
+        return code
+
+    def to_categorical(self, column: str, values: Iterable[Any]) -> pd.Categorical:
+        """Colonne pd.Categorical à catégories fixes (NaN pour une valeur inconnue)."""
+        return pd.Categorical.from_codes(self.codes(column, values), categories=self.categories[column])
+
+    def normalize_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Copie du DataFrame avec les colonnes catégorielles normalisées."""
+        out = df.copy()
+        for col in self.categories:
+            if col in out.columns:
+                out[col] = self.to_categorical(col, out[col].to_numpy())
+        return out
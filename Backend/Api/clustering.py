@@ -32,6 +32,7 @@ Sorties :
 
 import os
 import json
+import shutil
 from datetime import datetime
 import joblib
 import numpy as np
@@ -75,6 +76,8 @@ CLASSIFIER_PATH = DATA_DIR / "classifier_best.joblib"
 FEATURES_JSON = DATA_DIR / "features_list.json"
 METADATA_JSON = DATA_DIR / "model_metadata.json"
 PCA_COORDS_CSV = DATA_DIR / "pca_coords.csv"
+# Archive des versions (registre multi-versions de l'API : Data/versions/<version>/)
+VERSIONS_DIR = DATA_DIR / "versions"
 
 
 # -------------------------
@@ -104,21 +107,35 @@ def load_and_prep(path: str) -> pd.DataFrame:
 
     df = pd.read_csv(path, sep=";")
     # Imputation simple
-    df["Income"] = df["Income"].fillna(df["Income"].mean())
-
-    # Date -> ancienneté
-    df["Dt_Customer"] = pd.to_datetime(df["Dt_Customer"], format="%d-%m-%Y", errors="coerce")
-    today = pd.to_datetime("today")
-    df["Customer_Seniority"] = (today - df["Dt_Customer"]).dt.days
-
-    # Age
-    df["Age"] = datetime.now().year - df["Year_Birth"]
+    df = derive_features(df, income_fill=df["Income"].mean())
 
     # On garde seulement les colonnes nécessaires + dropna
     df_sel = df[ALL_FEATURES].copy()
     df_sel = df_sel.dropna().reset_index(drop=True)
     return df_sel
 
+def derive_features(df: pd.DataFrame, income_fill=None, today=None) -> pd.DataFrame:
+    """
+    Variables dérivées de l'export brut (utilisé aussi par l'API pour les fichiers importés) :
+      - Income manquant remplacé par `income_fill`
+      - Dt_Customer (JJ-MM-AAAA) -> Customer_Seniority en jours
+      - Year_Birth -> Age
+    Les colonnes déjà présentes (Age, Customer_Seniority) sont conservées telles quelles.
+    """
+    if income_fill is not None and "Income" in df.columns:
+        df["Income"] = df["Income"].fillna(income_fill)
+
+    today = pd.to_datetime("today") if today is None else pd.Timestamp(today)
+    if "Dt_Customer" in df.columns and "Customer_Seniority" not in df.columns:
+        # Date -> ancienneté
+        df["Dt_Customer"] = pd.to_datetime(df["Dt_Customer"], format="%d-%m-%Y", errors="coerce")
+        df["Customer_Seniority"] = (today - df["Dt_Customer"]).dt.days
+
+    if "Year_Birth" in df.columns and "Age" not in df.columns:
+        # Age
+        df["Age"] = today.year - df["Year_Birth"]
+    return df
+
 def build_preprocessor():
     """
     Construit et retourne un ColumnTransformer :
@@ -138,6 +155,17 @@ def build_preprocessor():
 
     return preprocessor
 
+def dump_artifact(obj, path: Path):
+    """
+    Écriture atomique (fichier temporaire puis os.replace) : une API qui a projeté
+    l'ancien fichier en mémoire (ARTIFACT_MMAP=1) garde son inode intact.
+    Pas de compression, pour que joblib puisse projeter les tableaux.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
 # -------------------------
 # Pipeline d'entraînement
 # -------------------------
@@ -155,7 +183,7 @@ def main():
     print("=== Construction du préprocesseur ===")
     preprocessor = build_preprocessor()
     X_pre = preprocessor.fit_transform(df)  # numpy array
-    joblib.dump(preprocessor, PREPROCESSOR_PATH)
+    dump_artifact(preprocessor, PREPROCESSOR_PATH)
     print("Preprocessor saved ->", PREPROCESSOR_PATH)
     print("Transformed shape:", X_pre.shape)
 
@@ -165,7 +193,7 @@ def main():
     kmeans = KMeans(n_clusters=K, random_state=42, n_init=10)
     kmeans.fit(X_pre)
     labels = kmeans.predict(X_pre)
-    joblib.dump(kmeans, KMEANS_PATH)
+    dump_artifact(kmeans, KMEANS_PATH)
     print(f"KMeans saved -> {KMEANS_PATH} (k={K})")
 
     # Attacher labels au dataframe
@@ -176,7 +204,7 @@ def main():
     pca = PCA(n_components=2, random_state=42)
     pcs = pca.fit_transform(X_pre)
     # sauvegarder PCA et coordonnées (utile pour Streamlit)
-    joblib.dump(pca, PCA_PATH)
+    dump_artifact(pca, PCA_PATH)
     print("PCA model saved ->", PCA_PATH)
     pca_df = pd.DataFrame(pcs, columns=["PC1", "PC2"])
     pca_df["cluster"] = labels
@@ -216,21 +244,32 @@ def main():
     print("Classification report:\n", classification_report(y_test, y_pred))
 
     # Save best classifier
-    joblib.dump(best_model, CLASSIFIER_PATH)
+    dump_artifact(best_model, CLASSIFIER_PATH)
     print("Classifier saved ->", CLASSIFIER_PATH)
 
     # Save metadata
+    created_at = datetime.now()
     metadata = {
+        # Identifiant de version des artefacts (repris dans model_info par l'API)
+        "version": created_at.strftime("%Y%m%d-%H%M%S"),
         "kmeans_k": int(K),
         "classifier": best_name,
         "cv_accuracy": float(best_cv_score),
         "test_accuracy": float(test_acc),
-        "created_at": datetime.now().isoformat()
+        "created_at": created_at.isoformat()
     }
+    # Écrit en dernier : signale à l'API (ARTIFACT_WATCH_INTERVAL) qu'un jeu complet est prêt
     with open(METADATA_JSON, "w") as f:
         json.dump(metadata, f, indent=2, ensure_ascii=False)
     print("Metadata saved ->", METADATA_JSON)
 
+    # Archive de la version (chargeable par l'API comme version primaire ou shadow)
+    version_dir = VERSIONS_DIR / metadata["version"]
+    version_dir.mkdir(parents=True, exist_ok=True)
+    for path in [PREPROCESSOR_PATH, CLASSIFIER_PATH, KMEANS_PATH, PCA_PATH, FEATURES_JSON, METADATA_JSON]:
+        shutil.copy2(path, version_dir / path.name)
+    print("Version archived ->", version_dir)
+
     print("=== FIN du training pipeline ===")
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+"""
+columnar.py
+-----------
+Corps JSON colonne par colonne pour les endpoints de lot (/cluster, /apply-pca, /score).
+
+Au lieu de `{"clients": [{...}, {...}]}` (un objet Pydantic par client), le client
+peut envoyer une liste de valeurs par feature :
+
+    {"Age": [45, 31, ...], "Income": [72000.0, 38000.0, ...], "Education": ["PhD", ...], ...}
+
+La validation se fait tableau par tableau, d'après les champs de ClientSchema :
+colonnes obligatoires présentes, tableaux à une dimension de longueurs identiques,
+type du tableau NumPy (entier, réel, texte), valeurs finies et entiers dans les
+bornes de int64. Les tableaux alimentent directement le DataFrame de
+scoring, sans graphe d'objets par ligne. Les erreurs suivent le format 422 de
+FastAPI (`loc`, `msg`, `type`).
+"""
+
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Type
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+# Types de tableau acceptés par type de champ Pydantic
+_KINDS = {int: "int", float: "float", str: "str"}
+
+# Bornes des colonnes entières (tableaux int64) ; 2**63 n'est pas représentable
+_INT64_MIN = float(np.iinfo(np.int64).min)
+_INT64_LIMIT = 2.0 ** 63
+
+
+class ColumnarValidationError(ValueError):
+    """Corps colonne par colonne invalide (liste d'erreurs au format FastAPI)."""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__(f"{len(errors)} erreur(s) de validation")
+        self.errors = errors
+
+
+def _error(column: Optional[str], msg: str, kind: str) -> Dict[str, Any]:
+    loc = ["body", column] if column else ["body"]
+    return {"loc": loc, "msg": msg, "type": kind}
+
+
+def schema_columns(model: Type[BaseModel]) -> List[Tuple[str, str, bool]]:
+    """(nom, type de tableau, obligatoire) pour chaque champ scalaire du modèle."""
+    columns = []
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        # Optional[X] → X
+        args = [a for a in getattr(annotation, "__args__", ()) if a is not type(None)]
+        if annotation not in _KINDS and len(args) == 1:
+            annotation = args[0]
+        if annotation in _KINDS:
+            columns.append((name, _KINDS[annotation], field.is_required()))
+    return columns
+
+
+def is_columnar(body: Any, model: Type[BaseModel]) -> bool:
+    """True si le corps est un dictionnaire de colonnes (et non {"clients": [...]})."""
+    if not isinstance(body, Mapping) or "clients" in body:
+        return False
+    return any(name in body for name, _, _ in schema_columns(model))
+
+
+def _first_bad(values: List[Any], accept) -> int:
+    """Indice de la première valeur refusée (chemin d'erreur seulement)."""
+    return next((i for i, v in enumerate(values) if not accept(v)), -1)
+
+
+def _to_array(column: str, values: Any, kind: str) -> np.ndarray:
+    """Convertit une liste JSON en tableau NumPy typé, ou lève ColumnarValidationError."""
+    list_error = ColumnarValidationError([_error(column, "Un tableau de valeurs est attendu", "list_type")])
+    if not isinstance(values, list):
+        raise list_error
+
+    if kind == "str":
+        arr = np.array(values, dtype=object)
+        if arr.ndim != 1:
+            raise list_error
+        if len(arr) and pd.api.types.infer_dtype(arr, skipna=False) != "string":
+            i = _first_bad(values, lambda v: isinstance(v, str))
+            raise ColumnarValidationError([_error(column, f"Chaîne attendue (indice {i})", "string_type")])
+        return arr
+
+    try:
+        arr = np.asarray(values)
+    except ValueError:
+        # Listes imbriquées de longueurs différentes
+        raise list_error
+    if arr.ndim != 1:
+        raise list_error
+    if len(arr) and arr.dtype.kind not in "iuf":
+        i = _first_bad(values, lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))
+        if i < 0:
+            # Uniquement des nombres, mais trop grands pour un tableau NumPy (tableau d'objets)
+            raise ColumnarValidationError([_error(column, "Nombre hors limites", "number_too_large")])
+        raise ColumnarValidationError([_error(column, f"Nombre attendu (indice {i})", f"{kind}_type")])
+    if kind == "float":
+        arr = arr.astype(np.float64, copy=False)
+        if not np.isfinite(arr).all():
+            raise ColumnarValidationError([_error(column, "Valeurs finies attendues", "finite_number")])
+        return arr
+    if arr.dtype.kind == "f":
+        # Même tolérance que Pydantic : 3.0 est un entier valide, 3.5 non
+        integral = np.isfinite(arr) & (arr == np.round(arr))
+        if not integral.all():
+            i = int(np.flatnonzero(~integral)[0])
+            raise ColumnarValidationError([_error(column, f"Entier attendu (indice {i})", "int_from_float")])
+    if arr.dtype.kind in "fu":
+        # astype(np.int64) ne signale pas le dépassement : 1e30 deviendrait -2**63
+        in_range = (arr >= _INT64_MIN) & (arr < _INT64_LIMIT) if arr.dtype.kind == "f" else arr < _INT64_LIMIT
+        if not in_range.all():
+            i = int(np.flatnonzero(~in_range)[0])
+            raise ColumnarValidationError([_error(column, f"Entier hors des bornes de int64 (indice {i})", "int_parsing_size")])
+    return arr.astype(np.int64, copy=False)
+
+
+def parse_columns(body: Mapping[str, Any], model: Type[BaseModel]) -> pd.DataFrame:
+    """Valide un corps colonne par colonne et retourne le DataFrame client correspondant."""
+    errors: List[Dict[str, Any]] = []
+    arrays: Dict[str, np.ndarray] = {}
+    for name, kind, required in schema_columns(model):
+        if name not in body or body[name] is None:
+            if required:
+                errors.append(_error(name, "Colonne obligatoire manquante", "missing"))
+            continue
+        try:
+            arrays[name] = _to_array(name, body[name], kind)
+        except ColumnarValidationError as e:
+            errors.extend(e.errors)
+
+    if errors:
+        raise ColumnarValidationError(errors)
+
+    lengths = {name: len(arr) for name, arr in arrays.items()}
+    if len(set(lengths.values())) > 1:
+        expected = max(set(lengths.values()), key=list(lengths.values()).count)
+        raise ColumnarValidationError([
+            _error(name, f"Longueur {n} différente des autres colonnes ({expected})", "length_mismatch")
+            for name, n in lengths.items() if n != expected
+        ])
+    return pd.DataFrame(arrays, copy=False)
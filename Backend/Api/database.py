@@ -6,7 +6,7 @@
 import logging
 import os
 from pathlib import Path
-from sqlalchemy import create_engine, inspect, text, Column, Integer, Float, String
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, Float, String
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 # ------------------------------------------------------------
@@ -19,10 +19,34 @@ logger = logging.getLogger("database")
 # 2. Configuration SQLite
 # ------------------------------------------------------------
 DB_FILE = "clustering_analytics.db"
-# Utilisation de Path pour une gestion propre des chemins (Windows/Linux)
-DB_PATH = Path(__file__).parent / DB_FILE
+# Utilisation de Path pour une gestion propre des chemins (Windows/Linux) ; SQLITE_PATH pour une autre base
+DB_PATH = Path(os.getenv("SQLITE_PATH", str(Path(__file__).parent / DB_FILE)))
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
+# Pragmas appliqués à chaque connexion (voir _configure_sqlite)
+#   WAL : les lectures ne bloquent plus les écritures (et inversement), un seul écrivain à la fois.
+#   Mettre SQLITE_JOURNAL_MODE=DELETE si la base est sur un système de fichiers réseau.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+#   NORMAL en WAL : pas de fsync à chaque commit (durable au checkpoint), base jamais corrompue
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+#   Attente maximale du verrou d'écriture avant "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+#   Cache de pages par connexion (kio) et fenêtre mmap (octets, partagée via le cache de l'OS)
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Pool de connexions par processus (chaque worker uvicorn a le sien)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "16"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+_SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+if SQLITE_JOURNAL_MODE not in _JOURNAL_MODES:
+    raise ValueError(f"SQLITE_JOURNAL_MODE invalide : {SQLITE_JOURNAL_MODE} (attendu : {', '.join(_JOURNAL_MODES)})")
+if SQLITE_SYNCHRONOUS not in _SYNCHRONOUS_MODES:
+    raise ValueError(f"SQLITE_SYNCHRONOUS invalide : {SQLITE_SYNCHRONOUS} (attendu : {', '.join(_SYNCHRONOUS_MODES)})")
+
 # Vérification/Création du fichier physique
 if DB_PATH.exists():
     logger.info(f"✔️ Base SQLite détectée : {DB_PATH}")
@@ -34,11 +58,34 @@ else:
 # ------------------------------------------------------------
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False}, # Requis pour SQLite + FastAPI
+    connect_args={
+        "check_same_thread": False, # Requis pour SQLite + FastAPI
+        "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+    },
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
     echo=False,
     future=True
 )
 
+
+@event.listens_for(engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    """Pragmas de performance et de concurrence, appliqués à chaque nouvelle connexion."""
+    cursor = dbapi_connection.cursor()
+    try:
+        mode = cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}").fetchone()[0]
+        if mode.upper() != SQLITE_JOURNAL_MODE:
+            logger.warning(f"journal_mode={SQLITE_JOURNAL_MODE} refusé par SQLite (mode actuel : {mode})")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    finally:
+        cursor.close()
+
+
 SessionLocal = sessionmaker(
     bind=engine,
     autoflush=False,
@@ -98,6 +145,20 @@ def create_tables():
 # ------------------------------------------------------------
 # 6. Dépendance FastAPI
 # ------------------------------------------------------------
+def begin_immediate(db) -> None:
+    """
+    Ouvre la transaction de la session avec le verrou d'écriture (BEGIN IMMEDIATE).
+
+    À appeler avant une séquence lecture → écriture qui doit être atomique : sinon le
+    module sqlite3 exécute les SELECT hors transaction et n'ouvre celle-ci qu'au
+    premier UPDATE. Le verrou est attendu jusqu'à SQLITE_BUSY_TIMEOUT_MS. Sans effet
+    si une écriture a déjà ouvert la transaction.
+    """
+    conn = db.connection()
+    if not conn.connection.driver_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
 def get_db():
     """Générateur de session pour les endpoints de l'API."""
     db = SessionLocal()
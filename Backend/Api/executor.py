@@ -0,0 +1,88 @@
+"""
+executor.py
+-----------
+Exécution du calcul numérique hors de la boucle asyncio.
+
+Les endpoints `async def` (/cluster, /apply-pca) appelaient directement
+preprocessor.transform, kmeans_model.predict et pca_model.transform sur la
+boucle d'événements : un gros lot gelait toutes les autres requêtes du worker,
+/health compris.
+
+Le ScoringExecutor délègue ce travail à un pool de threads borné (NumPy et
+scikit-learn relâchent le GIL dans leurs noyaux) et découpe les gros lots en
+morceaux traités en parallèle sur plusieurs cœurs.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Concurrence maximale du pool et taille des morceaux (configurables par variables d'environnement)
+SCORING_MAX_WORKERS = int(os.getenv("SCORING_MAX_WORKERS", str(min(8, os.cpu_count() or 2))))
+SCORING_CHUNK_SIZE = int(os.getenv("SCORING_CHUNK_SIZE", "5000"))
+
+
+def _slice_rows(data: Any, start: int, stop: int) -> Any:
+    if isinstance(data, pd.DataFrame):
+        return data.iloc[start:stop]
+    return data[start:stop]
+
+
+def _concat(parts: List[Any]) -> Any:
+    """Recolle les résultats des morceaux (tableaux, listes ou tuples de tableaux)."""
+    first = parts[0]
+    if first is None:
+        return None
+    if isinstance(first, tuple):
+        return tuple(_concat([p[i] for p in parts]) for i in range(len(first)))
+    if isinstance(first, list):
+        return [x for p in parts for x in p]
+    return np.concatenate(parts, axis=0)
+
+
+class ScoringExecutor:
+    """Pool de threads borné pour le scoring, avec découpage des gros lots."""
+
+    def __init__(self, max_workers: int = SCORING_MAX_WORKERS, chunk_size: int = SCORING_CHUNK_SIZE):
+        self.max_workers = max(1, max_workers)
+        self.chunk_size = max(1, chunk_size)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scoring")
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Exécute func(*args, **kwargs) dans le pool sans bloquer la boucle asyncio."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, partial(func, *args, **kwargs))
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """Tâche de fond sans attente du résultat (ex. scoring shadow)."""
+        return self._pool.submit(func, *args, **kwargs)
+
+    async def map_chunks(self, func: Callable, data: Any, *args, **kwargs) -> Any:
+        """
+        Applique func à des morceaux de `data` (DataFrame, ndarray ou liste) en parallèle
+        puis recolle les résultats dans l'ordre d'origine.
+        """
+        n_rows = len(data)
+        if n_rows <= self.chunk_size:
+            return await self.run(func, data, *args, **kwargs)
+
+        bounds = range(0, n_rows, self.chunk_size)
+        parts = await asyncio.gather(*[
+            self.run(func, _slice_rows(data, start, start + self.chunk_size), *args, **kwargs)
+            for start in bounds
+        ])
+        return _concat(list(parts))
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def describe(self) -> dict:
+        return {"max_workers": self.max_workers, "chunk_size": self.chunk_size}
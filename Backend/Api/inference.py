@@ -0,0 +1,223 @@
+"""
+inference.py
+------------
+Moteur d'inférence "compilé" pour la prédiction supervisée.
+
+Au démarrage, le préprocesseur (StandardScaler + OneHotEncoder) et le
+classifieur sont repliés en tableaux NumPy simples :
+  - moyennes / écarts-types du StandardScaler
+  - normaliseur catégoriel partagé (codes entiers) pour le OneHotEncoder
+  - matrice de poids + biais du classifieur linéaire
+
+Un ClientSchema validé devient ainsi un vecteur de features puis un
+(cluster, probabilité) en une seule passe, sans DataFrame pandas.
+Si un artefact n'est pas supporté, le moteur retombe sur les objets sklearn.
+"""
+
+import logging
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from Api.categorical import CategoricalNormalizer
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledInferenceEngine:
+    """
+    Chemin rapide NumPy construit une seule fois à partir des artefacts joblib.
+
+    Attributs publics :
+      - compiled_preprocessing : True si le ColumnTransformer a été replié
+      - compiled_classifier    : True si les poids du classifieur ont été repliés
+    """
+
+    def __init__(self, preprocessor, classifier):
+        self.preprocessor = preprocessor
+        self.classifier = classifier
+
+        self.numeric_features: List[str] = []
+        self.categorical_features: List[str] = []
+        self._mean: Optional[np.ndarray] = None
+        self._scale: Optional[np.ndarray] = None
+        self._cat_offsets: List[int] = []
+        self._cat_offset = 0
+        # Même normalisation catégorielle pour le chemin compilé et le repli sklearn
+        self.normalizer: Optional[CategoricalNormalizer] = CategoricalNormalizer.from_preprocessor(preprocessor)
+        self.n_features = 0
+
+        self._weights: Optional[np.ndarray] = None
+        self._bias: Optional[np.ndarray] = None
+        self._link = None
+        self.classes_ = np.asarray(getattr(classifier, "classes_", []))
+
+        self.compiled_preprocessing = self._compile_preprocessor(preprocessor)
+        self.compiled_classifier = (
+            self.compiled_preprocessing and self._compile_classifier(classifier)
+        )
+        logger.info(
+            f"Moteur d'inférence : préprocessing={'compilé' if self.compiled_preprocessing else 'sklearn'}, "
+            f"classifieur={'compilé' if self.compiled_classifier else 'sklearn'}"
+        )
+
+    # ------------------------------------------------------------------
+    # Compilation
+    # ------------------------------------------------------------------
+    def _compile_preprocessor(self, preprocessor) -> bool:
+        """Replie un ColumnTransformer(StandardScaler, OneHotEncoder) en tableaux NumPy."""
+        from sklearn.compose import ColumnTransformer
+        from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+        if not isinstance(preprocessor, ColumnTransformer):
+            return False
+        if getattr(preprocessor, "sparse_output_", False):
+            return False
+
+        steps = [
+            (name, trans, cols) for name, trans, cols in preprocessor.transformers_
+            if not (name == "remainder" and trans == "drop")
+        ]
+        # On n'accepte que l'ordre produit par clustering.build_preprocessor : num puis cat
+        if len(steps) != 2:
+            return False
+        (_, scaler, num_cols), (_, encoder, cat_cols) = steps
+        if not isinstance(scaler, StandardScaler) or not isinstance(encoder, OneHotEncoder):
+            return False
+        if not all(isinstance(c, str) for c in list(num_cols) + list(cat_cols)):
+            return False
+        if encoder.drop is not None or getattr(encoder, "_infrequent_enabled", False):
+            return False
+        if encoder.handle_unknown != "ignore":
+            return False
+
+        n_num = len(num_cols)
+        self._mean = (
+            np.asarray(scaler.mean_, dtype=np.float64) if scaler.with_mean
+            else np.zeros(n_num)
+        )
+        self._scale = (
+            np.asarray(scaler.scale_, dtype=np.float64) if scaler.with_std and scaler.scale_ is not None
+            else np.ones(n_num)
+        )
+
+        offset = n_num
+        offsets = []
+        for cats in encoder.categories_:
+            offsets.append(offset)
+            offset += len(cats)
+
+        self.numeric_features = list(num_cols)
+        self.categorical_features = list(cat_cols)
+        self.normalizer = CategoricalNormalizer(
+            {col: cats.tolist() for col, cats in zip(cat_cols, encoder.categories_)}
+        )
+        self._cat_offsets = offsets
+        self._cat_offset = n_num
+        self.n_features = offset
+        return True
+
+    def _compile_classifier(self, classifier) -> bool:
+        """Replie une LogisticRegression en (poids, biais, fonction de lien)."""
+        from sklearn.linear_model import LogisticRegression
+
+        if not isinstance(classifier, LogisticRegression):
+            return False
+        coef = np.asarray(classifier.coef_, dtype=np.float64)
+        if coef.shape[1] != self.n_features:
+            return False
+
+        self._weights = coef.T.copy()
+        self._bias = np.asarray(classifier.intercept_, dtype=np.float64)
+        if coef.shape[0] == 1:
+            self._link = "binary"
+        elif getattr(classifier, "multi_class", "auto") == "ovr":
+            self._link = "ovr"
+        else:
+            self._link = "softmax"
+        return True
+
+    # ------------------------------------------------------------------
+    # Vectorisation
+    # ------------------------------------------------------------------
+    def normalize_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Variables catégorielles ramenées aux catégories du modèle (chemins sklearn)."""
+        return self.normalizer.normalize_frame(df) if self.normalizer else df
+
+    def _build_matrix(self, n: int, numeric_column, categorical_column) -> np.ndarray:
+        """Assemble la matrice : numériques standardisées puis blocs one-hot (codes entiers)."""
+        X = np.zeros((n, self.n_features), dtype=np.float64)
+        num = X[:, :self._cat_offset]
+        for j, col in enumerate(self.numeric_features):
+            num[:, j] = numeric_column(col)
+        num -= self._mean
+        num /= self._scale
+
+        rows = np.arange(n)
+        for col, offset in zip(self.categorical_features, self._cat_offsets):
+            # handle_unknown="ignore" : une catégorie inconnue laisse le bloc à zéro
+            codes = self.normalizer.codes(col, categorical_column(col))
+            known = codes >= 0
+            X[rows[known], offset + codes[known]] = 1.0
+        return X
+
+    def vectorize(self, records: Sequence[Mapping[str, Any]]) -> np.ndarray:
+        """Transforme une liste de dictionnaires clients en matrice de features."""
+        if not self.compiled_preprocessing:
+            return self.preprocessor.transform(self.normalize_frame(pd.DataFrame(list(records))))
+        column = lambda col: [r[col] for r in records]
+        return self._build_matrix(len(records), column, column)
+
+    def transform(self, df: pd.DataFrame) -> np.ndarray:
+        """Équivalent de preprocessor.transform(df), sans passer par sklearn si possible."""
+        if not self.compiled_preprocessing:
+            return self.preprocessor.transform(self.normalize_frame(df))
+        return self._build_matrix(
+            len(df),
+            lambda col: df[col].to_numpy(dtype=np.float64),
+            lambda col: df[col].to_numpy(),
+        )
+
+    # ------------------------------------------------------------------
+    # Prédiction
+    # ------------------------------------------------------------------
+    def predict_proba(self, X: np.ndarray) -> Optional[np.ndarray]:
+        """Matrice de probabilités (n_clients × n_classes), ou None si indisponible."""
+        if not self.compiled_classifier:
+            if hasattr(self.classifier, "predict_proba"):
+                return self.classifier.predict_proba(X)
+            return None
+
+        z = X @ self._weights + self._bias
+        if self._link == "binary":
+            p1 = 1.0 / (1.0 + np.exp(-z[:, 0]))
+            return np.column_stack([1.0 - p1, p1])
+        if self._link == "ovr":
+            p = 1.0 / (1.0 + np.exp(-z))
+            return p / p.sum(axis=1, keepdims=True)
+        z -= z.max(axis=1, keepdims=True)
+        np.exp(z, out=z)
+        z /= z.sum(axis=1, keepdims=True)
+        return z
+
+    def predict_matrix(self, X: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Retourne (clusters, probabilités du cluster retenu) pour une matrice transformée."""
+        probs = self.predict_proba(X)
+        if probs is None:
+            return np.asarray(self.classifier.predict(X)), None
+        best = probs.argmax(axis=1)
+        return self.classes_[best], probs[np.arange(len(best)), best]
+
+    def predict_one(self, record: Mapping[str, Any]) -> Tuple[int, Optional[float]]:
+        """Prédit (cluster, probabilité) pour un seul client validé."""
+        clusters, confidences = self.predict_matrix(self.vectorize([record]))
+        probability = float(confidences[0]) if confidences is not None else None
+        return int(clusters[0]), probability
+
+    def describe(self) -> Dict[str, str]:
+        """Résumé du mode d'exécution (pour /health)."""
+        return {
+            "preprocessing": "compiled" if self.compiled_preprocessing else "sklearn",
+            "classifier": "compiled" if self.compiled_classifier else "sklearn",
+        }
@@ -0,0 +1,400 @@
+"""
+jobs.py
+-------
+Jobs de scoring en arrière-plan, sans broker externe.
+
+Un job est une ligne de la table `scoring_jobs` (SQLite) ; il est exécuté par un pool
+de processus locaux (ProcessPoolExecutor, démarrage "spawn") qui chargent eux-mêmes
+les artefacts depuis Data/ :
+
+  - `cluster_clients` : labels KMeans de toute la table client_data (ou des seuls
+    clients sans cluster), lus par lots de `chunk_size` clients dans l'ordre des ID.
+
+Chaque lot est validé dans une seule transaction (labels + agrégats de segments +
+progression + dernier ID traité) : un job interrompu (redémarrage de l'API, crash du worker) reprend exactement
+après le dernier lot validé. L'annulation est prise en compte entre deux lots.
+
+L'API ne fait qu'insérer le job et le confier au pool : la soumission répond
+immédiatement avec l'identifiant du job, la progression (débit, ETA) se consulte
+ensuite par polling.
+"""
+
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import func, or_, select, update
+
+from Api.artifacts import METADATA_FILE, ArtifactBundle, load_bundle
+from Api.database import SessionLocal
+from Api.models import ClientData, ScoringJob
+from Api.segments import track_reassignment
+
+logger = logging.getLogger(__name__)
+
+# Processus de scoring (chaque job est exécuté par un seul processus)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Clients scorés et validés par transaction
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "5000"))
+# Un job "running" sans signe de vie depuis ce délai est considéré comme orphelin
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+KINDS = ("cluster_clients",)
+
+# Features du modèle (ClientSchema) → colonnes de client_data
+CLIENT_DATA_FEATURES = {
+    "Age": ClientData.age,
+    "Customer_Seniority": ClientData.customer_seniority,
+    "Income": ClientData.income,
+    "Kidhome": ClientData.kidhome,
+    "Teenhome": ClientData.teenhome,
+    "Recency": ClientData.recency,
+    "MntWines": ClientData.mnt_wines,
+    "MntFruits": ClientData.mnt_fruits,
+    "MntMeatProducts": ClientData.mnt_meat,
+    "MntFishProducts": ClientData.mnt_fish,
+    "MntSweetProducts": ClientData.mnt_sweets,
+    "MntGoldProds": ClientData.mnt_gold,
+    "NumDealsPurchases": ClientData.num_deals,
+    "NumWebPurchases": ClientData.num_web,
+    "NumCatalogPurchases": ClientData.num_catalog,
+    "NumStorePurchases": ClientData.num_store,
+    "NumWebVisitsMonth": ClientData.num_web_visits,
+    "Education": ClientData.education,
+    "Marital_Status": ClientData.marital_status,
+}
+
+
+def _utcnow() -> datetime:
+    # SQLite ne conserve pas le fuseau : toutes les dates des jobs sont en UTC naïf
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _client_filter(params: Dict[str, Any]):
+    if params.get("only_missing"):
+        return or_(ClientData.cluster_kmeans.is_(None), ClientData.cluster_kmeans == -1)
+    return None
+
+
+# -------------------------------------------------------------------------
+# Côté worker (processus du pool)
+# -------------------------------------------------------------------------
+_worker_bundle: Optional[ArtifactBundle] = None
+_worker_bundle_key: Optional[float] = None
+
+
+def _worker_init() -> None:
+    """Un seul thread BLAS par processus : le parallélisme vient du nombre de workers."""
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=1)
+    except ImportError:
+        pass
+
+
+def _load_worker_bundle(data_dir: Path) -> ArtifactBundle:
+    """Artefacts du processus worker, rechargés si model_metadata.json a changé."""
+    global _worker_bundle, _worker_bundle_key
+    key = (data_dir / METADATA_FILE).stat().st_mtime
+    if _worker_bundle is None or key != _worker_bundle_key:
+        _worker_bundle = load_bundle(data_dir)
+        _worker_bundle_key = key
+    return _worker_bundle
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    """True si un processus de ce PID existe encore sur la machine."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Processus d'un autre utilisateur : il existe
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _claim(db, job_id: str) -> bool:
+    """Passe le job de queued à running ; False si un autre worker l'a déjà pris."""
+    now = _utcnow()
+    result = db.execute(
+        update(ScoringJob)
+        .where(ScoringJob.id == job_id, ScoringJob.status == QUEUED)
+        .values(
+            status=RUNNING, started_at=now, heartbeat_at=now, worker_pid=os.getpid(),
+            start_processed_rows=ScoringJob.processed_rows,
+        )
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def _score_clients_chunk(db, job: ScoringJob, bundle: ArtifactBundle, params: Dict[str, Any]) -> int:
+    """Score et enregistre le lot suivant ; retourne le nombre de clients lus (0 = terminé)."""
+    features = list(CLIENT_DATA_FEATURES)
+    query = (
+        select(ClientData.id, *CLIENT_DATA_FEATURES.values())
+        .where(ClientData.id > job.last_id)
+        .order_by(ClientData.id)
+        .limit(int(params.get("chunk_size") or JOB_CHUNK_SIZE))
+    )
+    condition = _client_filter(params)
+    if condition is not None:
+        query = query.where(condition)
+    rows = db.execute(query).all()
+    if not rows:
+        return 0
+
+    df = pd.DataFrame(rows, columns=["id", *features])
+    valid = df[features].notna().all(axis=1).to_numpy()
+    if valid.any():
+        labels = bundle.kmeans.predict(bundle.engine.transform(df.loc[valid, features]))
+        with track_reassignment(db, df.loc[valid, "id"]):
+            db.execute(
+                update(ClientData),
+                [{"id": int(i), "cluster_kmeans": int(c)} for i, c in zip(df.loc[valid, "id"], labels)],
+            )
+
+    # Même transaction que les labels : point de reprise exact
+    job.processed_rows += len(df)
+    job.skipped_rows += int((~valid).sum())
+    job.last_id = int(df["id"].iloc[-1])
+    job.heartbeat_at = _utcnow()
+    db.commit()
+    return len(df)
+
+
+def run_job(job_id: str, data_dir: str) -> str:
+    """Exécute (ou reprend) un job dans le processus courant ; retourne son statut final."""
+    db = SessionLocal()
+    try:
+        if not _claim(db, job_id):
+            return "skipped"
+        job = db.get(ScoringJob, job_id)
+        params = dict(job.params or {})
+        try:
+            bundle = _load_worker_bundle(Path(data_dir))
+            job.model_version = bundle.version
+            if not job.total_rows:
+                count = select(func.count(ClientData.id))
+                condition = _client_filter(params)
+                if condition is not None:
+                    count = count.where(condition)
+                job.total_rows = db.execute(count).scalar() or 0
+            db.commit()
+
+            while True:
+                db.refresh(job, ["cancel_requested"])
+                if job.cancel_requested:
+                    job.status = CANCELLED
+                    break
+                if not _score_clients_chunk(db, job, bundle, params):
+                    job.status = SUCCEEDED
+                    break
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Job {job_id} en échec : {e}")
+            job = db.get(ScoringJob, job_id)
+            job.status = FAILED
+            job.error = str(e)
+
+        job.finished_at = _utcnow()
+        job.heartbeat_at = job.finished_at
+        db.commit()
+        return job.status
+    finally:
+        db.close()
+
+
+# -------------------------------------------------------------------------
+# Côté API
+# -------------------------------------------------------------------------
+def describe_job(job: ScoringJob) -> Dict[str, Any]:
+    """État d'un job avec progression, débit (lignes/s) et ETA de l'exécution en cours."""
+    total = job.total_rows or 0
+    processed = job.processed_rows or 0
+    rate = None
+    eta = None
+    if job.started_at and job.heartbeat_at:
+        elapsed = (job.heartbeat_at - job.started_at).total_seconds()
+        done_this_run = processed - (job.start_processed_rows or 0)
+        if elapsed > 0 and done_this_run > 0:
+            rate = done_this_run / elapsed
+            if job.status == RUNNING and total:
+                eta = max(0.0, (total - processed) / rate)
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": job.params,
+        "total_rows": total,
+        "processed_rows": processed,
+        "skipped_rows": job.skipped_rows or 0,
+        "progress": round(min(1.0, processed / total), 4) if total else None,
+        "rows_per_second": round(rate, 1) if rate else None,
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+        "cancel_requested": bool(job.cancel_requested),
+        "model_version": job.model_version,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class JobManager:
+    """Soumission, reprise et annulation des jobs ; pool de processus de scoring."""
+
+    def __init__(self, data_dir: Path, max_workers: int = JOB_WORKERS):
+        self.data_dir = Path(data_dir)
+        self.max_workers = max(1, max_workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # "spawn" : pas de fork d'un processus uvicorn multi-threadé
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+            )
+        return self._pool
+
+    def _dispatch(self, job_id: str) -> None:
+        future = self._get_pool().submit(run_job, job_id, str(self.data_dir))
+        future.add_done_callback(lambda f, job_id=job_id: self._on_done(job_id, f))
+
+    def _on_done(self, job_id: str, future: Future) -> None:
+        error = future.exception()
+        if error is None:
+            logger.info(f"Job {job_id} terminé : {future.result()}")
+            return
+        logger.error(f"Job {job_id} interrompu : {error!r}")
+        if isinstance(error, BrokenProcessPool):
+            # Worker tué (ex. mémoire) : pool recréé à la prochaine soumission
+            self._pool = None
+        with SessionLocal() as db:
+            db.execute(
+                update(ScoringJob)
+                .where(ScoringJob.id == job_id, ScoringJob.status.in_((QUEUED, RUNNING)))
+                .values(status=FAILED, error=f"Processus worker interrompu : {error!r}", finished_at=_utcnow())
+            )
+            db.commit()
+
+    # ------------------------------------------------------------------
+    # Cycle de vie
+    # ------------------------------------------------------------------
+    def start(self) -> int:
+        """Relance les jobs en attente et les jobs orphelins (API redémarrée) ; retourne leur nombre."""
+        stale_before = _utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+        with SessionLocal() as db:
+            running = db.execute(
+                select(ScoringJob.id, ScoringJob.worker_pid, ScoringJob.heartbeat_at)
+                .where(ScoringJob.status == RUNNING)
+            ).all()
+            # Orphelin : plus de signe de vie, ou processus worker disparu (redémarrage rapide)
+            orphans = [
+                job_id for job_id, pid, heartbeat_at in running
+                if heartbeat_at is None or heartbeat_at < stale_before or not _pid_alive(pid)
+            ]
+            if orphans:
+                db.execute(
+                    update(ScoringJob)
+                    .where(ScoringJob.id.in_(orphans), ScoringJob.status == RUNNING)
+                    .values(status=QUEUED, worker_pid=None)
+                )
+                db.commit()
+            pending = db.execute(
+                select(ScoringJob.id).where(ScoringJob.status == QUEUED).order_by(ScoringJob.created_at)
+            ).scalars().all()
+        for job_id in pending:
+            self._dispatch(job_id)
+        if pending:
+            logger.info(f"{len(pending)} job(s) de scoring repris")
+        return len(pending)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            # Les jobs en cours seront repris au prochain démarrage (dernier lot validé)
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # ------------------------------------------------------------------
+    # Opérations
+    # ------------------------------------------------------------------
+    def submit(self, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if kind not in KINDS:
+            raise ValueError(f"Type de job inconnu : {kind}")
+        job = ScoringJob(id=uuid.uuid4().hex, kind=kind, status=QUEUED, params=params,
+                         created_at=_utcnow(), processed_rows=0, skipped_rows=0, last_id=0)
+        with SessionLocal() as db:
+            db.add(job)
+            db.commit()
+            info = describe_job(job)
+        self._dispatch(job.id)
+        return info
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with SessionLocal() as db:
+            job = db.get(ScoringJob, job_id)
+            return describe_job(job) if job else None
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with SessionLocal() as db:
+            jobs = db.execute(
+                select(ScoringJob).order_by(ScoringJob.created_at.desc()).limit(limit)
+            ).scalars().all()
+            return [describe_job(job) for job in jobs]
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        """Annule un job en attente, ou demande l'arrêt d'un job en cours après le lot courant."""
+        with SessionLocal() as db:
+            job = db.get(ScoringJob, job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = _utcnow()
+            elif job.status == RUNNING:
+                job.cancel_requested = True
+            else:
+                raise ValueError(f"Le job est déjà terminé ({job.status})")
+            db.commit()
+            return describe_job(job)
+
+    def resume(self, job_id: str) -> Dict[str, Any]:
+        """Relance un job annulé ou en échec à partir du dernier lot validé."""
+        with SessionLocal() as db:
+            job = db.get(ScoringJob, job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if job.status not in (FAILED, CANCELLED):
+                raise ValueError(f"Seul un job annulé ou en échec peut être repris ({job.status})")
+            job.status = QUEUED
+            job.cancel_requested = False
+            job.error = None
+            job.finished_at = None
+            db.commit()
+            info = describe_job(job)
+        self._dispatch(job_id)
+        return info
+
+    def describe(self) -> Dict[str, Any]:
+        return {"workers": self.max_workers, "chunk_size": JOB_CHUNK_SIZE, "pool_started": self._pool is not None}
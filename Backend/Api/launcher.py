@@ -0,0 +1,243 @@
+"""
+launcher.py
+-----------
+Lanceur de production de l'API (remplace `uvicorn ... --workers 2`).
+
+  1. Détermine les CPU réellement disponibles (affinité + quota cgroup du conteneur)
+     et en déduit le nombre de workers et le nombre de threads BLAS / joblib par worker.
+  2. Fixe OMP/OpenBLAS/MKL/LOKY_MAX_CPU_COUNT *avant* l'import de NumPy.
+  3. Charge les artefacts et les points PCA une seule fois dans le processus parent.
+  4. Ouvre la socket d'écoute puis fork les workers : chacun hérite des modèles en
+     copy-on-write et sert la socket partagée avec uvicorn.Server.
+  5. Supervise les workers (redémarrage en cas de crash, arrêt propre sur SIGTERM).
+
+Usage :
+    python launcher.py                         # depuis Backend/Api
+    API_WORKERS=4 API_PORT=8001 python launcher.py
+
+Variables d'environnement :
+    API_HOST, API_PORT, API_LOG_LEVEL
+    API_WORKERS              nombre de workers (défaut : CPU disponibles)
+    API_THREADS_PER_WORKER   threads BLAS / OpenMP / joblib par worker (défaut : CPU / workers)
+"""
+
+import gc
+import logging
+import math
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("launcher")
+
+# Le package "Api" doit être importable (même convention que main.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8001"))
+API_LOG_LEVEL = os.getenv("API_LOG_LEVEL", "info")
+
+# Variables lues par OpenBLAS / MKL / OpenMP / numexpr au chargement de la bibliothèque
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+
+# -------------------------------------------------------------------------
+# Dimensionnement
+# -------------------------------------------------------------------------
+def _cgroup_cpu_limit() -> Optional[float]:
+    """Quota CPU du conteneur (cgroup v2 puis v1), None si illimité."""
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus() -> int:
+    """CPU utilisables par ce processus : affinité, bornée par le quota cgroup."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, math.ceil(limit)))
+    return max(1, cpus)
+
+
+def plan_workers() -> Dict[str, int]:
+    """Nombre de workers et threads par worker (workers × threads ≈ CPU disponibles)."""
+    cpus = available_cpus()
+    workers = int(os.getenv("API_WORKERS", "0")) or cpus
+    threads = int(os.getenv("API_THREADS_PER_WORKER", "0")) or max(1, cpus // workers)
+    return {"cpus": cpus, "workers": max(1, workers), "threads_per_worker": max(1, threads)}
+
+
+def cap_thread_env(threads: int) -> None:
+    """Bride les pools natifs avant l'import de NumPy / scikit-learn (valeurs explicites respectées)."""
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+    # joblib / loky : n_jobs=-1 (RandomForest "rf") se limite à ce nombre de cœurs
+    os.environ.setdefault("LOKY_MAX_CPU_COUNT", str(threads))
+    # Pool de scoring de l'API (executor.py)
+    os.environ.setdefault("SCORING_MAX_WORKERS", str(threads))
+
+
+def apply_threadpool_limits(threads: int) -> None:
+    """Applique la limite aux pools BLAS / OpenMP déjà chargés (threadpoolctl)."""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        logger.warning("threadpoolctl absent : limites appliquées via variables d'environnement uniquement")
+        return
+    threadpool_limits(limits=threads)
+
+
+# -------------------------------------------------------------------------
+# Préchargement (processus parent)
+# -------------------------------------------------------------------------
+def preload():
+    """Importe l'application et charge les artefacts une fois, avant le fork."""
+    from Api import main
+    from Api.database import engine
+
+    # Parent mono-thread pendant le préchargement (pas de pool OpenMP hérité par les enfants)
+    apply_threadpool_limits(1)
+    main.artifact_manager.load_initial()
+    try:
+        main.pca_store.snapshot()
+    except FileNotFoundError:
+        logger.warning("pca_coords.csv introuvable : points PCA chargés à la demande")
+
+    # Aucune connexion SQLite ne doit être héritée par les workers
+    engine.dispose()
+    # Objets préchargés hors du suivi du GC : pas de réécriture des pages partagées
+    gc.collect()
+    gc.freeze()
+    return main.app
+
+
+# -------------------------------------------------------------------------
+# Workers
+# -------------------------------------------------------------------------
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve(app, sock: socket.socket, threads: int) -> None:
+    """Boucle uvicorn d'un worker sur la socket partagée."""
+    import uvicorn
+
+    apply_threadpool_limits(threads)
+    # Chaque worker tire ses propres nombres aléatoires (échantillonnage shadow, etc.)
+    random.seed()
+    config = uvicorn.Config(app, log_level=API_LOG_LEVEL, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn_worker(app, sock: socket.socket, threads: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 0
+        try:
+            serve(app, sock, threads)
+        except Exception as e:
+            logger.error(f"Worker {os.getpid()} arrêté sur erreur : {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def supervise(app, sock: socket.socket, workers: int, threads: int) -> None:
+    """Fork les workers, les redémarre s'ils meurent, et propage l'arrêt."""
+    children = {spawn_worker(app, sock, threads) for _ in range(workers)}
+    logger.info(f"{workers} workers démarrés : {sorted(children)}")
+    stopping = False
+
+    def _shutdown(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} terminé (statut {status}), redémarrage")
+            time.sleep(0.5)
+            children.add(spawn_worker(app, sock, threads))
+    logger.info("Tous les workers sont arrêtés")
+
+
+def main() -> None:
+    plan = plan_workers()
+    cap_thread_env(plan["threads_per_worker"])
+    logger.info(
+        f"CPU disponibles={plan['cpus']} → workers={plan['workers']}, "
+        f"threads BLAS/joblib par worker={plan['threads_per_worker']}"
+    )
+
+    if not hasattr(os, "fork"):
+        # Windows : pas de fork, un seul processus uvicorn
+        import uvicorn
+        from Api.main import app
+        apply_threadpool_limits(plan["threads_per_worker"])
+        uvicorn.run(app, host=API_HOST, port=API_PORT, log_level=API_LOG_LEVEL)
+        return
+
+    app = preload()
+    sock = bind_socket(API_HOST, API_PORT)
+    logger.info(f"Écoute sur http://{API_HOST}:{API_PORT}")
+
+    if plan["workers"] == 1:
+        serve(app, sock, plan["threads_per_worker"])
+    else:
+        supervise(app, sock, plan["workers"], plan["threads_per_worker"])
+
+
+if __name__ == "__main__":
+    main()
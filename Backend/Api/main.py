@@ -15,12 +15,15 @@ API de Clustering Client – Version C (PRO)
 """
 import os
 import json
+import itertools
 import joblib
 import logging
+import time
+import numpy as np
 import pandas as pd
 from typing import List, Dict, Any, Optional
 from pathlib import Path
-from sqlalchemy import inspect, text, func
+from sqlalchemy import inspect, text, func, select
 
 
 import sys
@@ -31,21 +34,44 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(BASE_DIR))
 
 
-from Api.database import engine , Base , get_db
+from Api.database import engine , Base , get_db, SessionLocal
 from sqlalchemy.orm import Session
 from Api.models import Prediction, ClientData, PCAResult
+from Api.artifacts import ArtifactBundle, ArtifactManager, ArtifactValidationError
+from Api.registry import ModelRegistry
+from Api.jobs import JobManager
+from Api.migrations import run_migrations
+from Api.segments import ensure_segment_aggregates, rebuild_segment_aggregates, read_segment_stats, track_reassignment
+from Api.batching import PredictionCoalescer, CoalescerFull
+from Api.executor import ScoringExecutor
+from Api.memstats import process_memory
+from Api.pca_store import PCAPointStore
+from Api.prediction_log import PredictionLogFull, PredictionWriteBuffer, prediction_record
+from Api.prediction_rollups import (
+    GRANULARITIES, TIMESERIES_MAX_BUCKETS, PredictionRollupWorker, bucket_ceil, bucket_floor, get_watermark,
+    read_timeseries,
+)
+from Api.serialization import JSON, negotiate, columnar_response
+from Api.columnar import ColumnarValidationError, is_columnar, parse_columns
+from Api.uploads import MEDIA_TYPES, PARQUET, ChunkWriter, detect_format, feature_frame, iter_chunks, parquet_available
+from Api.clustering import derive_features
+from Api.streaming import NDJSON, BodyStreamingResponse, StreamParseError, is_ndjson, iter_batches, iter_records, ndjson_line
 # router = APIRouter()
 from fastapi.responses import RedirectResponse
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
-from fastapi.responses import JSONResponse
-from fastapi import FastAPI, HTTPException, Request, Query, Body , Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from fastapi import FastAPI, HTTPException, Request, Query, Body , Depends, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timezone
 
 
 # Crée les tables si elles n'existent pas dans le fichier .db
 Base.metadata.create_all(bind=engine)
+# Puis applique les migrations versionnées (index ajoutés aux tables existantes) ;
+# la version obtenue est celle exposée par /health (pas de lecture SQLite par sonde)
+SCHEMA_VERSION = run_migrations(engine)
 
 # -------------------------------------------------------------------------
 # CONFIG LOGGING
@@ -85,6 +111,24 @@ FEATURES_PATH = DATA_DIR / "features_list.json"
 METADATA_PATH = DATA_DIR / "model_metadata.json"
 PCA_COORDS_PATH = DATA_DIR / "pca_coords.csv"
 
+# ---------------------------------------------------
+# Coalesceur de requêtes /predict-cluster (opt-in)
+# ---------------------------------------------------
+COALESCER_ENABLED = os.getenv("COALESCER_ENABLED", "0").lower() in ("1", "true", "yes")
+COALESCER_WINDOW_MS = float(os.getenv("COALESCER_WINDOW_MS", "2"))
+COALESCER_MAX_BATCH = int(os.getenv("COALESCER_MAX_BATCH", "64"))
+COALESCER_MAX_QUEUE = int(os.getenv("COALESCER_MAX_QUEUE", "1024"))
+
+# ---------------------------------------------------
+# /score : seuil d'outlier (multiple du rayon quadratique moyen des clusters KMeans)
+# ---------------------------------------------------
+OUTLIER_FACTOR = float(os.getenv("OUTLIER_FACTOR", "3.0"))
+
+# ---------------------------------------------------
+# /metrics/memory : durée de validité (s) du relevé par artefact (lecture de /proc/self/smaps)
+# ---------------------------------------------------
+MEMORY_STATS_TTL = float(os.getenv("MEMORY_STATS_TTL", "30"))
+
 # -------------------------------------------------------------------------
 # 🚀 INITIALISATION DE L’API FASTAPI
 # -------------------------------------------------------------------------
@@ -250,39 +294,195 @@ class ClientSchema(BaseModel):
 
     NumWebVisitsMonth: int = Field(...,description="Nombre de visites du site web durant le dernier mois")
 
+    # ------------------------------------------------------------------
+    # 🔑 Identifiant (optionnel)
+    # ------------------------------------------------------------------
+    id: Optional[int] = Field(None, description="ID du client dans client_data (requis pour save_to_db)")
+
 
 class PredictClusterResponse(BaseModel):
     """Réponse standardisée pour l'endpoint /predict-cluster"""
     cluster: int
     probability: Optional[float] = None
     model_info: Optional[Dict[str, Any]] = None
+    logged: Optional[bool] = None
 
 # -------------------------------------------------------------------------
 # GLOBALS ARTIFACTS
 # -------------------------------------------------------------------------
-preprocessor = None
-classifier = None
-kmeans_model = None
-pca_model = None
-metadata: Dict[str, Any] = {}
+# Bundle actif (préprocesseur, classifieur, KMeans, PCA, métadonnées, moteur compilé),
+# remplacé atomiquement lors d'un rechargement à chaud
+artifact_manager = ArtifactManager(DATA_DIR)
+# Versions archivées (Data/versions/<version>/), routage primaire / shadow
+model_registry = ModelRegistry(artifact_manager)
+coalescer: Optional[PredictionCoalescer] = None
+# Pool borné pour le calcul numérique des endpoints async (SCORING_MAX_WORKERS, SCORING_CHUNK_SIZE)
+scoring_executor = ScoringExecutor()
+# Points PCA pré-calculés en mémoire (rechargés si pca_coords.csv change)
+pca_store = PCAPointStore(PCA_COORDS_PATH)
+# Jobs de scoring en arrière-plan (table scoring_jobs, pool de processus JOB_WORKERS)
+job_manager = JobManager(DATA_DIR)
+# Journal des prédictions écrit par lots (PREDICTION_LOG_BATCH, PREDICTION_LOG_INTERVAL_MS)
+prediction_log = PredictionWriteBuffer()
+# Agrégats horaires / journaliers des prédictions + rétention (PREDICTION_ROLLUP_INTERVAL)
+prediction_rollup = PredictionRollupWorker()
 
 # -------------------------------------------------------------------------
 # STARTUP EVENT – Chargement des modèles
 # -------------------------------------------------------------------------
 @app.on_event("startup")
 async def load_artifacts():
-    global preprocessor, classifier, kmeans_model, pca_model, metadata
     try:
-        preprocessor = joblib.load(PREPROCESSOR_PATH)
-        classifier = joblib.load(CLASSIFIER_PATH)
-        kmeans_model = joblib.load(KMEANS_PATH)
-        pca_model = joblib.load(PCA_PATH)
-        with open(METADATA_PATH, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
+        # Déjà chargés par launcher.py avant le fork : les workers partagent ces pages
+        if artifact_manager.current is None:
+            artifact_manager.load_initial()
         logger.info("Tous les artefacts chargés avec succès !")
     except Exception as e:
         logger.error(f"Échec du chargement des artefacts : {e}")
         raise RuntimeError(f"Impossible de démarrer l'API : {e}")
+    # Rechargement à chaud quand clustering.py réécrit model_metadata.json (ARTIFACT_WATCH_INTERVAL)
+    artifact_manager.start_watcher()
+
+
+@app.on_event("shutdown")
+def stop_artifact_watcher():
+    artifact_manager.stop_watcher()
+
+
+def get_bundle() -> ArtifactBundle:
+    """Bundle primaire, récupéré une seule fois au début de chaque requête."""
+    bundle = model_registry.primary()
+    if bundle is None:
+        raise HTTPException(status_code=500, detail="Artefacts manquants")
+    return bundle
+
+
+def score_records(records: List[Dict[str, Any]], bundle: ArtifactBundle) -> List[tuple]:
+    """Score un lot de clients → liste de (cluster, probabilité), dans l'ordre d'entrée."""
+    X = bundle.engine.vectorize(records)
+    clusters, confidences = bundle.engine.predict_matrix(X)
+    clusters = clusters.tolist()
+    confidences = confidences.tolist() if confidences is not None else [None] * len(clusters)
+    return [(int(c), p) for c, p in zip(clusters, confidences)]
+
+
+def score_coalesced(records: List[Dict[str, Any]]) -> List[tuple]:
+    """Lot du coalesceur : scoré avec le bundle primaire au moment du flush, renvoyé avec chaque résultat."""
+    bundle = model_registry.primary()
+    started = time.perf_counter()
+    scores = score_records(records, bundle)
+    dispatch_shadow("classifier", records, [c for c, _ in scores], bundle, started)
+    return [(cluster, probability, bundle) for cluster, probability in scores]
+
+
+def score_single(record: Dict[str, Any], bundle: ArtifactBundle) -> tuple:
+    """Un client : vecteur de features + (cluster, probabilité) en une passe, sans DataFrame."""
+    started = time.perf_counter()
+    cluster, probability = bundle.engine.predict_one(record)
+    dispatch_shadow("classifier", [record], [cluster], bundle, started)
+    return cluster, probability
+
+
+def dispatch_shadow(kind: str, payload: Any, primary_labels, bundle: ArtifactBundle, started: float) -> None:
+    """Rejoue le scoring sur la version shadow dans son pool dédié, sans attendre (hors chemin de la requête)."""
+    if not model_registry.wants_shadow():
+        return
+    primary_ms = (time.perf_counter() - started) * 1000.0
+    model_registry.submit_shadow(kind, payload, primary_labels, bundle.version, primary_ms)
+
+
+@app.on_event("startup")
+async def start_coalescer():
+    global coalescer
+    if COALESCER_ENABLED:
+        coalescer = PredictionCoalescer(
+            score_coalesced,
+            window_ms=COALESCER_WINDOW_MS,
+            max_batch_size=COALESCER_MAX_BATCH,
+            max_queue_size=COALESCER_MAX_QUEUE,
+            runner=scoring_executor.run,
+        )
+        await coalescer.start()
+
+
+@app.on_event("shutdown")
+async def stop_coalescer():
+    if coalescer:
+        await coalescer.stop()
+
+
+@app.on_event("shutdown")
+def stop_scoring_executor():
+    scoring_executor.shutdown()
+
+
+@app.on_event("shutdown")
+def stop_shadow_pool():
+    model_registry.shutdown()
+
+
+@app.on_event("startup")
+def init_segment_aggregates():
+    # Base existante sans agrégats : construction initiale (ensuite, deltas uniquement)
+    db = SessionLocal()
+    try:
+        if ensure_segment_aggregates(db):
+            logger.info("Agrégats de segments construits depuis client_data")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Initialisation des agrégats de segments impossible : {e}")
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+def resume_scoring_jobs():
+    # Jobs en attente ou interrompus par un redémarrage : reprise au dernier lot validé
+    try:
+        job_manager.start()
+    except Exception as e:
+        logger.error(f"Reprise des jobs de scoring impossible : {e}")
+
+
+@app.on_event("shutdown")
+def stop_job_manager():
+    job_manager.shutdown()
+
+
+@app.on_event("startup")
+def start_prediction_log():
+    prediction_log.start()
+
+
+@app.on_event("shutdown")
+def drain_prediction_log():
+    # Les prédictions encore en file sont écrites avant l'arrêt du worker
+    prediction_log.stop()
+
+
+@app.on_event("startup")
+def start_prediction_rollup():
+    prediction_rollup.start()
+
+
+@app.on_event("shutdown")
+def stop_prediction_rollup():
+    prediction_rollup.stop()
+
+
+def log_predictions(records: List[Dict[str, Any]]) -> bool:
+    """Journalise des prédictions (write-behind) ; False si la file est saturée."""
+    try:
+        prediction_log.add(records)
+        return True
+    except PredictionLogFull as e:
+        logger.warning(f"Prédictions non journalisées : {e}")
+        return False
+
+
+def get_model_info(bundle: ArtifactBundle) -> Dict[str, Any]:
+    """Sous-ensemble des métadonnées (dont la version active) renvoyé avec chaque réponse."""
+    return bundle.model_info()
 
 # -------------------------------------------------------------------------
 # Gestion globale des erreurs
@@ -327,48 +527,101 @@ def health_check():
         Un objet JSON contenant :
         - `status`: "ok" si tous les artefacts sont chargés, sinon "degraded"
         - `artifacts`: état individuel de chaque composant ML
+        - `memory`: totaux du processus (kB) ; le détail par artefact est servi par /metrics/memory
     """
     
     # Vérification de chaque artefact pour déterminer si l'API est opérationnelle
-    global_status = all([preprocessor, classifier, kmeans_model, pca_model])
+    bundle = model_registry.primary()
+    global_status = bundle is not None and all([bundle.preprocessor, bundle.classifier, bundle.kmeans, bundle.pca])
 
     return {
         "status": "Online", "message": "API de Clustering Analytics opérationnelle." if global_status else "degraded",
         "artifacts": {
-            "preprocessor": bool(preprocessor),   # Chargement des transformations
-            "classifier": bool(classifier),       # Modèle supervisé
-            "kmeans": bool(kmeans_model),         # Modèle non supervisé
-            "pca": bool(pca_model),               # Réduction de dimension
-        }
+            "preprocessor": bool(bundle and bundle.preprocessor),   # Chargement des transformations
+            "classifier": bool(bundle and bundle.classifier),       # Modèle supervisé
+            "kmeans": bool(bundle and bundle.kmeans),               # Modèle non supervisé
+            "pca": bool(bundle and bundle.pca),                     # Réduction de dimension
+        },
+        "model_info": bundle.model_info() if bundle else None,
+        "artifact_manager": artifact_manager.describe(),
+        "model_registry": model_registry.describe(),
+        "inference_engine": bundle.engine.describe() if bundle else None,
+        # Totaux du processus (smaps_rollup, peu coûteux) ; détail par artefact : /metrics/memory
+        "memory": process_memory(),
+        "scoring_executor": scoring_executor.describe(),
+        # Version du schéma SQLite (migrations.py)
+        "schema_version": SCHEMA_VERSION
     }
 
+@app.get("/metrics/coalescer", summary="Histogrammes du coalesceur de requêtes", tags=["Santé & Métadonnées"])
+def coalescer_metrics():
+    """
+    Taille des lots et temps d'attente en file (ms) du coalesceur /predict-cluster.
+    Permet de régler COALESCER_WINDOW_MS / COALESCER_MAX_BATCH (p99 vs débit).
+    """
+    if not coalescer:
+        return {"status": "success", "data": {"enabled": False}}
+    return {"status": "success", "data": coalescer.stats()}
+
+# Dernier relevé détaillé : (version, instant monotone, données)
+_memory_stats: Dict[str, tuple] = {}
+
+
+@app.get("/metrics/memory", summary="Mémoire résidente / partagée par artefact", tags=["Santé & Métadonnées"])
+def memory_metrics(refresh: bool = Query(False, description="Ignore le relevé en cache")):
+    """
+    Pages projetées depuis chaque fichier .joblib (résidentes, partagées, privées, kB), tableaux
+    NumPy projetés / copiés et totaux du processus. L'analyse de /proc/self/smaps coûte plusieurs
+    dizaines de ms : le relevé est gardé MEMORY_STATS_TTL secondes (ou jusqu'au changement de version).
+    """
+    bundle = model_registry.primary()
+    if bundle is None:
+        raise HTTPException(status_code=500, detail="Artefacts manquants")
+    now = time.monotonic()
+    cached = _memory_stats.get("primary")
+    if refresh or cached is None or cached[0] != bundle.version or now - cached[1] > MEMORY_STATS_TTL:
+        cached = (bundle.version, now, bundle.memory_usage())
+        _memory_stats["primary"] = cached
+    return {"status": "success", "version": cached[0], "age_s": round(now - cached[1], 3), "data": cached[2]}
+
 @app.post("/save-prediction", tags=["Prédiction"], summary="Sauvegarde une prédiction en DB")
-def save_prediction(data: dict, db: Session = Depends(get_db)):
+def save_prediction(
+    data: dict,
+    sync: bool = Query(False, description="Insertion immédiate (retourne l'ID) au lieu de l'écriture par lots"),
+    db: Session = Depends(get_db),
+):
+    """
+    Par défaut, la prédiction est mise en file et écrite par lots (prediction_log.py) :
+    la réponse n'attend pas le commit. `sync=true` insère et valide immédiatement.
+    """
     try:
         # --- 1. PLACER LA SÉCURITÉ ICI ---
-        cluster_raw = data.get("predicted_cluster")
-        # Si cluster_raw est None, on met -1, sinon on convertit en int
-        cluster_val = int(cluster_raw) if cluster_raw is not None else -1
-        
-        # Utilisation de timezone.utc pour éviter le warning
-        now = datetime.now(timezone.utc)
-        
-        # --- 2. UTILISER cluster_val ICI ---
-        pred = Prediction(
-            payload=data.get("payload"),
-            # payload_json=json.dumps(data.get("payload")),
-            predicted_cluster=cluster_val, # On utilise la variable sécurisée
-            confidence=float(data.get("confidence", 0.0)),
-            timestamp=now,
+        # Si predicted_cluster est None, on met -1, sinon on convertit en int
+        # Version du modèle : celle fournie, sinon la version primaire actuelle
+        primary = model_registry.primary()
+        record = prediction_record(
+            data.get("payload"),
+            data.get("predicted_cluster"),
+            data.get("confidence", 0.0),
             pc1=data.get("pc1"),
-            pc2=data.get("pc2")
+            pc2=data.get("pc2"),
+            model_version=data.get("model_version") or (primary.version if primary else None),
         )
-        
+        now = record["timestamp"]
+
+        if not sync:
+            prediction_log.add([record])
+            return {"status": "success", "id": None, "buffered": True, "timestamp": now.isoformat()}
+
+        # --- 2. INSERTION IMMÉDIATE ---
+        pred = Prediction(**record)
         db.add(pred)
         db.commit()
         db.refresh(pred)
-        return {"status": "success", "id": pred.id, "timestamp": now.isoformat()}
-        
+        return {"status": "success", "id": pred.id, "buffered": False, "timestamp": now.isoformat()}
+
+    except PredictionLogFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         db.rollback()
         logger.error(f"Erreur sauvegarde SQLite : {e}")
@@ -376,6 +629,173 @@ def save_prediction(data: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erreur base de données : {str(e)}")
 
 
+@app.get("/metrics/prediction-log", summary="État du journal des prédictions (écriture par lots)", tags=["Santé & Métadonnées"])
+def prediction_log_metrics():
+    return {"status": "success", "data": {**prediction_log.stats(), "rollup": prediction_rollup.stats()}}
+
+
+@app.post("/admin/predictions/rollup", summary="Agrégation + rétention des prédictions immédiate", tags=["Santé & Métadonnées"])
+def run_prediction_rollup():
+    """Exécute tout de suite le cycle du thread d'agrégation (agrégats, puis purge des lignes expirées)."""
+    try:
+        return {"status": "success", "data": prediction_rollup.run_once()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur d'agrégation : {str(e)}")
+
+
+@app.get("/predictions/timeseries", summary="Tendance des prédictions (agrégats horaires / journaliers)", tags=["Visualisation"])
+def predictions_timeseries(
+    granularity: str = Query("hour", pattern="^(hour|day)$", description="Taille des tranches : hour ou day"),
+    start: Optional[datetime] = Query(None, description="Début (UTC, défaut : 48 tranches avant `end`)"),
+    end: Optional[datetime] = Query(None, description="Fin exclue (UTC, défaut : maintenant)"),
+    cluster: Optional[int] = Query(None, description="Limite la série à un segment"),
+    db: Session = Depends(get_db),
+):
+    """
+    Série lue dans la table prediction_rollups (pas dans predictions) : nombre de
+    prédictions par cluster, confiance moyenne et histogramme (10 tranches), moyenne
+    des entrées numériques. Les prédictions au-delà du watermark (agrégation toutes
+    les PREDICTION_ROLLUP_INTERVAL s) n'apparaissent pas encore (`pending`).
+    """
+    step = GRANULARITIES[granularity]
+    end = bucket_ceil(end, granularity) if end else bucket_floor(datetime.now(timezone.utc), granularity) + step
+    start = bucket_floor(start, granularity) if start else end - 48 * step
+    if start >= end:
+        raise HTTPException(status_code=400, detail="`start` doit précéder `end`.")
+    if (end - start) / step > TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Plus de {TIMESERIES_MAX_BUCKETS} tranches demandées.")
+    try:
+        watermark = get_watermark(db)
+        latest = db.execute(select(func.max(Prediction.id))).scalar() or 0
+        return {
+            "status": "success",
+            "granularity": granularity,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "watermark": watermark,
+            "pending": max(latest - watermark, 0),
+            "data": read_timeseries(db, granularity, start, end, cluster),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur SQL : {str(e)}")
+
+
+
+@app.post("/admin/reload", summary="Rechargement à chaud des artefacts ML", tags=["Santé & Métadonnées"])
+async def reload_artifacts(force: bool = Query(False, description="Réactive le bundle même si la version est identique")):
+    """
+    Charge la version présente dans Data/ en arrière-plan, la valide puis la substitue
+    atomiquement à la version active. Les requêtes en cours terminent avec l'ancienne version.
+    Une version invalide est refusée (422) et la version active reste en service.
+    """
+    try:
+        result = await scoring_executor.run(artifact_manager.reload, force)
+    except ArtifactValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Version refusée : {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Rechargement impossible : {e}")
+    return {"status": "success", **result, "model_info": get_model_info(get_bundle())}
+
+
+@app.get("/admin/models", summary="Versions du registre de modèles", tags=["Santé & Métadonnées"])
+def list_models():
+    """Version live, primaire et shadow, versions chargées en mémoire et archivées dans Data/versions/."""
+    return {"status": "success", "data": model_registry.describe()}
+
+
+@app.post("/admin/models/{version_id}/load", summary="Charge une version archivée en mémoire", tags=["Santé & Métadonnées"])
+async def load_model_version(version_id: str):
+    try:
+        bundle = await scoring_executor.run(model_registry.load, version_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ArtifactValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Version refusée : {e}")
+    return {"status": "success", "model_info": get_model_info(bundle)}
+
+
+@app.post("/admin/models/primary", summary="Choisit la version qui sert les requêtes", tags=["Santé & Métadonnées"])
+async def set_primary_model(version_id: Optional[str] = Query(None, description="Version à promouvoir (vide = version live de Data/)")):
+    try:
+        bundle = await scoring_executor.run(model_registry.set_primary, version_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ArtifactValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Version refusée : {e}")
+    return {"status": "success", "model_info": get_model_info(bundle), "data": model_registry.describe()}
+
+
+@app.post("/admin/models/shadow", summary="Active ou désactive le scoring shadow", tags=["Santé & Métadonnées"])
+async def set_shadow_model(version_id: Optional[str] = Query(None, description="Version à scorer en shadow (vide = désactivé)")):
+    try:
+        await scoring_executor.run(model_registry.set_shadow, version_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ArtifactValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Version refusée : {e}")
+    return {"status": "success", "data": model_registry.describe()}
+
+
+@app.get("/metrics/shadow", summary="Accord et écart de latence des versions shadow", tags=["Santé & Métadonnées"])
+def shadow_metrics():
+    """Par version shadow, type de scoring et version primaire : taux d'accord et écart de latence (ms)."""
+    return {"status": "success", "data": model_registry.shadow_stats()}
+
+
+# -------------------------------------------------------------------------
+# Jobs de scoring en arrière-plan
+# -------------------------------------------------------------------------
+@app.post("/jobs", status_code=202, summary="Soumet un job de scoring en arrière-plan", tags=["Jobs"])
+def submit_job(
+    kind: str = Query("cluster_clients", description="Type de job (cluster_clients : labels KMeans de client_data)"),
+    only_missing: bool = Query(False, description="Ne scorer que les clients sans cluster"),
+    chunk_size: Optional[int] = Query(None, ge=100, le=100_000, description="Clients par lot (défaut : JOB_CHUNK_SIZE)"),
+):
+    """
+    Retourne immédiatement l'identifiant du job ; le scoring est réalisé par lots dans un
+    pool de processus locaux. Suivre la progression avec GET /jobs/{job_id}.
+    """
+    try:
+        job = job_manager.submit(kind, {"only_missing": only_missing, "chunk_size": chunk_size})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "job": job}
+
+
+@app.get("/jobs", summary="Derniers jobs de scoring", tags=["Jobs"])
+def list_jobs(limit: int = Query(20, ge=1, le=200)):
+    return {"status": "success", "data": job_manager.list(limit), "manager": job_manager.describe()}
+
+
+@app.get("/jobs/{job_id}", summary="Progression d'un job (débit, ETA)", tags=["Jobs"])
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job inconnu : {job_id}")
+    return {"status": "success", "job": job}
+
+
+@app.post("/jobs/{job_id}/cancel", summary="Annule un job (après le lot en cours)", tags=["Jobs"])
+def cancel_job(job_id: str):
+    try:
+        job = job_manager.cancel(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job inconnu : {job_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "success", "job": job}
+
+
+@app.post("/jobs/{job_id}/resume", summary="Reprend un job annulé ou en échec", tags=["Jobs"])
+def resume_job(job_id: str):
+    try:
+        job = job_manager.resume(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job inconnu : {job_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "success", "job": job}
+
 
 @app.get("/metadata", summary="Métadonnées complètes du modèle", tags=["Santé & Métadonnées"])
 def get_metadata():
@@ -401,10 +821,12 @@ def get_metadata():
         Un objet JSON contenant les métadonnées complètes du modèle.
     """
     
-    # `metadata` est supposé avoir été chargé au démarrage de l'application
+    # Métadonnées du bundle actif (rechargées avec les artefacts)
+    bundle = get_bundle()
     return {
         "status": "success",
-        "metadata": metadata
+        "metadata": bundle.metadata,
+        "model_info": get_model_info(bundle)
     }
 
 
@@ -413,37 +835,139 @@ def get_metadata():
 # =============================================================================
 
 @app.get("/pca", summary="Coordonnées PCA pré-calculées (pour le frontend)", tags=["Visualisation"])
-def get_pca_coords(limit: int = Query(1000, ge=1, le=5000)):
-    """Retourne un échantillon des points PCA avec leur cluster (PC1, PC2, cluster)"""
-    if not PCA_COORDS_PATH.exists():
+def get_pca_coords(
+    request: Request,
+    limit: int = Query(1000, ge=1, le=100000, description="Nombre maximal de points retournés"),
+    cursor: int = Query(0, ge=0, description="Curseur de pagination (valeur next_cursor de la page précédente)"),
+    cluster: Optional[int] = Query(None, ge=0, description="Filtre sur un cluster"),
+    sample: bool = Query(False, description="Échantillon aléatoire stratifié par cluster au lieu d'une page"),
+    seed: Optional[int] = Query(None, description="Graine de l'échantillonnage (reproductible)")
+):
+    """
+    Retourne des points PCA avec leur cluster (PC1, PC2, cluster) depuis le stockage en mémoire.
+
+    - par défaut : pagination par curseur (`cursor` / `next_cursor`)
+    - `sample=true` : échantillon représentatif de `limit` points, stratifié par cluster
+    - `Accept: application/vnd.apache.arrow.stream` (ou msgpack / x-npy) : corps binaire colonne par colonne
+    """
+    try:
+        if sample:
+            selection = pca_store.sample(limit, seed=seed, cluster=cluster)
+        else:
+            selection = pca_store.page(cursor=cursor, limit=limit, cluster=cluster)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Fichier pca_coords.csv introuvable")
-    df = pd.read_csv(PCA_COORDS_PATH).head(limit)
-    return {"status": "success", "data": df.to_dict(orient="records")}
+
+    media_type = negotiate(request)
+    if media_type != JSON:
+        return columnar_response(selection.columns(), media_type, meta={
+            "status": "success", "total": selection.total, "next_cursor": selection.next_cursor
+        })
+
+    return {
+        "status": "success",
+        "total": selection.total,
+        "next_cursor": selection.next_cursor,
+        "data": selection.records()
+    }
+
+
+@app.get("/pca/viewport", summary="Points PCA dans une fenêtre (zoom)", tags=["Visualisation"])
+def get_pca_viewport(
+    request: Request,
+    xmin: float = Query(..., description="Borne minimale sur PC1"),
+    xmax: float = Query(..., description="Borne maximale sur PC1"),
+    ymin: float = Query(..., description="Borne minimale sur PC2"),
+    ymax: float = Query(..., description="Borne maximale sur PC2"),
+    limit: int = Query(5000, ge=1, le=100000, description="Nombre maximal de points (sous-échantillon au-delà)"),
+    seed: Optional[int] = Query(None, description="Graine du sous-échantillonnage")
+):
+    """Retourne les points de la zone affichée par le frontend, via l'index spatial en grille."""
+    if xmin > xmax or ymin > ymax:
+        raise HTTPException(status_code=400, detail="Fenêtre invalide : xmin > xmax ou ymin > ymax")
+    try:
+        selection = pca_store.viewport(xmin, xmax, ymin, ymax, limit=limit, seed=seed)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Fichier pca_coords.csv introuvable")
+
+    media_type = negotiate(request)
+    if media_type != JSON:
+        return columnar_response(selection.columns(), media_type, meta={
+            "status": "success", "total": selection.total
+        })
+
+    return {"status": "success", "total": selection.total, "data": selection.records()}
+
+
+@app.get("/pca/nearest", summary="Clients historiques les plus proches d'un point PCA", tags=["Visualisation"])
+def get_pca_nearest(
+    pc1: float = Query(..., description="Coordonnée PC1 du point projeté"),
+    pc2: float = Query(..., description="Coordonnée PC2 du point projeté"),
+    k: int = Query(10, ge=1, le=1000, description="Nombre de voisins")
+):
+    """
+    Retourne les k clients historiques les plus proches (distance euclidienne dans le plan PCA),
+    par exemple pour situer un nouveau client projeté via /apply-pca.
+    """
+    try:
+        selection = pca_store.nearest(pc1, pc2, k=k)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Fichier pca_coords.csv introuvable")
+
+    data = selection.records()
+    for point in data:
+        point["distance"] = ((point["PC1"] - pc1) ** 2 + (point["PC2"] - pc2) ** 2) ** 0.5
+    return {"status": "success", "data": data}
+
+
+@app.get("/pca/density", summary="Densité PCA agrégée par cellule et par cluster", tags=["Visualisation"])
+def get_pca_density(
+    shape: str = Query("square", pattern="^(square|hex)$", description="Forme des cellules : square ou hex"),
+    resolution: int = Query(64, ge=4, le=1024, description="Nombre de cellules en largeur (par tuile si z est fourni)"),
+    z: Optional[int] = Query(None, ge=0, le=16, description="Niveau de zoom (mode tuiles) : 2^z × 2^z tuiles"),
+    tx: int = Query(0, ge=0, description="Colonne de la tuile"),
+    ty: int = Query(0, ge=0, description="Rangée de la tuile")
+):
+    """
+    Agrège le nuage PCA côté serveur (hexbin ou grille carrée) avec l'effectif de chaque cluster
+    par cellule. La taille de la réponse dépend de la résolution, pas du nombre de clients.
+    Résultats mis en cache par version des points et du modèle.
+    """
+    try:
+        result = pca_store.density(
+            shape=shape, resolution=resolution, z=z, tx=tx, ty=ty,
+            model_version=get_bundle().version
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Fichier pca_coords.csv introuvable")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"status": "success", "data": result}
 
 
 @app.get("/segments/stats", summary="Statistiques par segment (Données réelles)", tags=["Visualisation"])
-def segment_stats(db: Session = Depends(get_db)):
-    """Calcule les stats en temps réel depuis la base de données SQL."""
+def segment_stats(
+    rebuild: bool = Query(False, description="Recalcule les agrégats depuis client_data (vérification)"),
+    db: Session = Depends(get_db),
+):
+    """
+    Stats par segment lues dans la table matérialisée segment_aggregates (O(k)) :
+    effectif, revenu moyen, et moyenne / variance de chaque colonne monétaire et
+    comportementale. `rebuild=true` refait le GROUP BY complet et indique la dérive.
+    """
     try:
-        # Requête SQL : GROUP BY cluster_kmeans, COUNT(*), AVG(income)
-        stats = db.query(
-            ClientData.cluster_kmeans.label("cluster"),
-            func.count(ClientData.id).label("count"),
-            func.avg(ClientData.income).label("avg_income")
-        ).group_by(ClientData.cluster_kmeans).all()
-
-        # Transformation en format dictionnaire pour le JSON
-        result = [
-            {
-                "cluster": s.cluster if s.cluster is not None else -1,
-                "count": s.count,
-                "avg_income": round(s.avg_income, 2) if s.avg_income else 0
-            }
-            for s in stats
-        ]
-
-        return {"status": "success", "data": result}
+        drift = None
+        if rebuild:
+            drift = rebuild_segment_aggregates(db)
+            db.commit()
+        response = {"status": "success", "data": read_segment_stats(db)}
+        if rebuild:
+            response["rebuilt"] = True
+            response["drift_cells"] = drift
+        return response
     except Exception as e:
+        db.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur SQL : {str(e)}")
 
 
@@ -510,35 +1034,232 @@ def get_segment_info(cluster: int) -> Dict[str, Any]:
 
 @app.post("/predict-cluster", response_model=PredictClusterResponse,
           summary="Prédiction supervisée d’un seul client", tags=["Prédiction"])
-def predict_cluster(req: ClientSchema):
+async def predict_cluster(
+    req: ClientSchema,
+    log: bool = Query(False, description="Journalise la prédiction (table predictions, écriture par lots)"),
+):
     """
     Prédit le cluster d’un client avec un classifieur supervisé (LogisticRegression)
     → Très haute précision grâce à l'entraînement sur les vrais labels KMeans
+
+    Si COALESCER_ENABLED=1, la requête est regroupée avec ses voisines
+    concurrentes en un seul lot vectorisé (voir /metrics/coalescer).
+    Avec `log=true`, la prédiction est aussi journalisée (remplace l'appel à /save-prediction).
     """
-    if not preprocessor or not classifier:
-        raise HTTPException(status_code=500, detail="Artefacts manquants")
+    bundle = get_bundle()
+
+    if coalescer and coalescer.running:
+        try:
+            # Le lot est scoré avec le bundle actif au moment du flush
+            cluster, probability, bundle = await coalescer.submit(req.dict())
+        except CoalescerFull as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    else:
+        # Hors de la boucle asyncio : le classifieur de repli (non compilé) peut être lent
+        cluster, probability = await scoring_executor.run(score_single, req.dict(), bundle)
+
+    model_info = get_model_info(bundle)
+    logged = None
+    if log:
+        logged = log_predictions([
+            prediction_record(req.dict(), cluster, probability, model_version=model_info.get("version"))
+        ])
+
+    return PredictClusterResponse(cluster=cluster, probability=probability, model_info=model_info, logged=logged)
+
+
+
+@app.post("/predict-cluster/batch",
+          summary="Prédiction supervisée vectorisée d'un lot de clients", tags=["Prédiction"])
+def predict_cluster_batch(
+    clients: List[ClientSchema] = Body(..., embed=True),
+    log: bool = Query(False, description="Journalise les prédictions (table predictions, écriture par lots)"),
+):
+    """
+    Prédit le cluster de plusieurs milliers de clients en un seul appel.
+
+    Une seule transformation de la matrice complète et une seule matrice de
+    probabilités : le cluster (argmax) et la confiance en sont tous deux extraits.
+    Le débit dépend de la taille du lot, pas du nombre de requêtes HTTP.
+    """
+    bundle = get_bundle()
 
-    df = pd.DataFrame([req.dict()])
-    X = preprocessor.transform(df)
-    cluster = int(classifier.predict(X)[0])
+    if not clients:
+        raise HTTPException(status_code=400, detail="La liste de clients fournie est vide.")
+
+    records = [c.dict() for c in clients]
+    started = time.perf_counter()
+    scores = score_records(records, bundle)
+    dispatch_shadow("classifier", records, [c for c, _ in scores], bundle, started)
+    results = [
+        {"client_index": i, "cluster": cluster, "probability": probability}
+        for i, (cluster, probability) in enumerate(scores)
+    ]
 
-    probability = None
-    if hasattr(classifier, "predict_proba"):
-        probs = classifier.predict_proba(X)[0]
-        probability = float(probs[list(classifier.classes_).index(cluster)])
+    model_info = get_model_info(bundle)
+    response = {
+        "status": "success",
+        "total_clients": len(results),
+        "results": results,
+        "model_info": model_info
+    }
+    if log:
+        response["logged"] = log_predictions([
+            prediction_record(record, cluster, probability, model_version=model_info.get("version"))
+            for record, (cluster, probability) in zip(records, scores)
+        ])
+    return response
 
-    model_info = {k: metadata.get(k) for k in ["classifier", "cv_accuracy", "test_accuracy", "kmeans_k", "created_at"]}
 
-    return PredictClusterResponse(cluster=cluster, probability=probability, model_info=model_info)
 
 
+# -------------------------------------------------------------------------
+# Helpers de calcul (exécutés dans le ScoringExecutor, hors boucle asyncio)
+# -------------------------------------------------------------------------
+def build_client_frame(clients: List[ClientSchema], bundle: ArtifactBundle) -> pd.DataFrame:
+    """
+    Convertit les clients Pydantic en DataFrame et normalise les variables catégorielles
+    (catégories du modèle, passe vectorisée, même normaliseur que /predict-cluster).
+    """
+    df = pd.DataFrame([c.dict() for c in clients])
+    return bundle.engine.normalize_frame(df)
+
+
+def build_columnar_frame(body: Dict[str, Any], bundle: ArtifactBundle) -> pd.DataFrame:
+    """Valide un corps colonne par colonne (tableau par tableau) et normalise les catégories."""
+    return bundle.engine.normalize_frame(parse_columns(body, ClientSchema))
+
+
+async def resolve_client_frame(request: Request, clients: Optional[List[ClientSchema]],
+                               bundle: ArtifactBundle) -> pd.DataFrame:
+    """
+    DataFrame client d'un endpoint de lot : `{"clients": [...]}` validé par Pydantic,
+    ou corps colonne par colonne `{"Age": [...], "Income": [...], ...}` (voir columnar.py).
+    """
+    if clients is not None:
+        return await scoring_executor.run(build_client_frame, clients, bundle)
+
+    try:
+        body = await request.json()
+    except ValueError:
+        # Corps vide ou JSON invalide (json.JSONDecodeError, UnicodeDecodeError)
+        raise HTTPException(status_code=422, detail=[{
+            "loc": ["body"], "msg": "Corps JSON invalide ou vide", "type": "json_invalid"
+        }])
+    if not is_columnar(body, ClientSchema):
+        raise HTTPException(status_code=422, detail=[{
+            "loc": ["body", "clients"], "msg": "Champ 'clients' ou colonnes de features attendus", "type": "missing"
+        }])
+    try:
+        return await scoring_executor.run(build_columnar_frame, body, bundle)
+    except ColumnarValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+
+
+def predict_kmeans_labels(df: pd.DataFrame, bundle: ArtifactBundle):
+    """Scaling + Encoding puis KMeans sur un morceau de clients."""
+    return bundle.kmeans.predict(bundle.engine.transform(df))
+
+
+def project_pca(df: pd.DataFrame, n_components: int, bundle: ArtifactBundle):
+    """Coordonnées PCA (et cluster KMeans si disponible) pour un morceau de clients."""
+    X_trans = bundle.engine.transform(df)
+    coords = bundle.pca.transform(X_trans)[:, :n_components]
+    clusters = bundle.kmeans.predict(X_trans) if bundle.kmeans else None
+    return coords, clusters
+
+
+def save_kmeans_labels(db: Session, df: pd.DataFrame, labels) -> None:
+    """Met à jour la colonne cluster_kmeans des clients identifiés par leur ID."""
+    logger.info(f"💾 Mise à jour de la base de données pour {len(df)} clients...")
+    ids = df["id"].tolist() if "id" in df.columns else [None] * len(df)
+    known = [(int(i), int(c)) for i, c in zip(ids, labels) if i is not None and not pd.isna(i)]
+    # Agrégats de segments mis à jour dans la même transaction (delta ancien → nouveau cluster)
+    with track_reassignment(db, [i for i, _ in known]):
+        for client_id, cluster_id in known:
+            # On utilise l'ID pour une mise à jour précise
+            db.query(ClientData).filter(ClientData.id == client_id).update(
+                {"cluster_kmeans": cluster_id}
+            )
+    db.commit()
+    logger.info("✅ Mise à jour SQLite terminée avec succès.")
+
+
+def cluster_results(labels, offset: int = 0) -> List[Dict[str, Any]]:
+    """Réponse enrichie avec la logique métier, un dictionnaire par client (/cluster)."""
+    results = []
+    for i, cluster_id in enumerate(np.asarray(labels).tolist(), start=offset):
+        # get_segment_info est une fonction utilitaire renvoyant le label, la couleur, etc.
+        segment = get_segment_info(cluster_id)
+        results.append({
+            "client_index": i,
+            "cluster": int(cluster_id),
+            "segment": segment["label"],
+            "short_label": segment["short_label"],
+            "color": segment["color"],
+            "priority": segment["priority"],
+            "strategy": segment["strategy"],
+            "recommended_action": segment["action"]
+        })
+    return results
+
+
+def kmeans_outlier_threshold(bundle: ArtifactBundle) -> Optional[float]:
+    """Distance au centroïde au-delà de laquelle un client est atypique (OUTLIER_FACTOR × rayon RMS d'entraînement)."""
+    kmeans = bundle.kmeans
+    n_train = len(getattr(kmeans, "labels_", []))
+    if not n_train or getattr(kmeans, "inertia_", None) is None:
+        return None
+    return OUTLIER_FACTOR * float(np.sqrt(kmeans.inertia_ / n_train))
+
+
+def score_all(df: pd.DataFrame, n_components: int, bundle: ArtifactBundle):
+    """
+    Une seule transformation pour toutes les sorties d'un morceau de clients :
+    (cluster supervisé, probabilité, label KMeans, distances aux centroïdes, coordonnées PCA).
+    """
+    X = bundle.engine.transform(df)
+    clusters, probabilities = bundle.engine.predict_matrix(X)
+    distances = bundle.kmeans.transform(X)
+    kmeans_labels = distances.argmin(axis=1)
+    coords = bundle.pca.transform(X)[:, :n_components]
+    return clusters, probabilities, kmeans_labels, distances, coords
+
+
+def outlier_flags(distances: np.ndarray, threshold: Optional[float]) -> np.ndarray:
+    """True si la distance au centroïde le plus proche dépasse le seuil d'outlier."""
+    if threshold is None:
+        return np.zeros(len(distances), dtype=bool)
+    return distances.min(axis=1) > threshold
+
+
+def score_results(clusters, probabilities, kmeans_labels, distances, outliers, coords,
+                  offset: int = 0) -> List[Dict[str, Any]]:
+    """Un dictionnaire par client (/score)."""
+    clusters = np.asarray(clusters).tolist()
+    probabilities = probabilities.tolist() if probabilities is not None else [None] * len(clusters)
+    return [
+        {
+            "client_index": i,
+            "cluster": int(cluster),
+            "probability": probability,
+            "kmeans_cluster": int(kmeans_cluster),
+            "distances": client_distances,
+            "is_outlier": bool(is_outlier),
+            "pca": client_coords,
+        }
+        for i, (cluster, probability, kmeans_cluster, client_distances, is_outlier, client_coords) in enumerate(zip(
+            clusters, probabilities, kmeans_labels.tolist(), distances.tolist(), outliers.tolist(), coords.tolist()
+        ), start=offset)
+    ]
 
 
 @app.post("/cluster", 
           summary="Clustering KMeans (batch) avec persistance optionnelle", 
           tags=["Prédiction"])
 async def assign_cluster(
-    clients: List[ClientSchema] = Body(..., embed=True),
+    request: Request,
+    clients: Optional[List[ClientSchema]] = Body(None, embed=True),
     save_to_db: bool = Query(False, description="Si True, met à jour la colonne cluster_kmeans dans SQLite"),
     db: Session = Depends(get_db)
 ):
@@ -546,7 +1267,8 @@ async def assign_cluster(
     Réalise un clustering KMeans sur une liste de clients et enrichit la réponse avec des données métier.
 
     Args:
-        clients (List[ClientSchema]): Liste des objets clients validés par Pydantic.
+        clients (List[ClientSchema]): Liste des objets clients validés par Pydantic. Le corps peut
+            aussi être colonne par colonne : {"Age": [...], "Income": [...], ...} (un tableau par feature).
         save_to_db (bool, optional): Flag pour déclencher la mise à jour de la table 'client_data'. Defaults to False.
         db (Session): Session SQLAlchemy injectée par FastAPI.
 
@@ -556,73 +1278,57 @@ async def assign_cluster(
     Raises:
         HTTPException: 500 si les modèles ne sont pas chargés ou si le calcul échoue.
     """
-    # Vérification de la présence des artefacts ML
-    if not kmeans_model or not preprocessor:
+    # Vérification de la présence des artefacts ML (bundle figé pour toute la requête)
+    bundle = model_registry.primary()
+    if not bundle or not bundle.kmeans or not bundle.preprocessor:
         logger.error("Tentative d'accès au clustering sans modèles chargés.")
         raise HTTPException(status_code=500, detail="KMeans ou préprocesseur non disponible")
 
-    if not clients:
+    df = await resolve_client_frame(request, clients, bundle)
+    if df.empty:
         raise HTTPException(status_code=400, detail="La liste de clients fournie est vide.")
 
-    # Conversion de la liste Pydantic en DataFrame pandas pour le preprocessing
-    df = pd.DataFrame([c.dict() for c in clients])
-
-    # Nettoyage des variables catégorielles (Gestion des valeurs hors-dictionnaire)
-    allowed_edu = ["Basic", "2n Cycle", "Graduation", "Master", "PhD"]
-    allowed_marital = ["Single", "Married", "Divorced", "Together", "Widow"]
-
-    df["Education"] = df["Education"].astype(str).apply(lambda x: x if x in allowed_edu else "Other")
-    df["Marital_Status"] = df["Marital_Status"].astype(str).apply(lambda x: x if x in allowed_marital else "Other")
-
     try:
-        # Transformation des données (Scaling + Encoding) et Prédiction
-        X_transformed = preprocessor.transform(df)
-        raw_clusters = kmeans_model.predict(X_transformed)
-        
+        # Transformation (Scaling + Encoding) et prédiction hors de la boucle asyncio,
+        # par morceaux parallèles pour les gros lots
+        started = time.perf_counter()
+        raw_clusters = await scoring_executor.map_chunks(predict_kmeans_labels, df, bundle)
+        dispatch_shadow("kmeans", df, raw_clusters, bundle, started)
+
         # --- LOGIQUE DE PERSISTANCE ---
         if save_to_db:
-            logger.info(f"💾 Mise à jour de la base de données pour {len(clients)} clients...")
-            for i, cluster_id in enumerate(raw_clusters):
-                c_data = clients[i].dict()
-                # On utilise l'ID pour une mise à jour précise
-                if "id" in c_data and c_data["id"] is not None:
-                    db.query(ClientData).filter(ClientData.id == c_data["id"]).update(
-                        {"cluster_kmeans": int(cluster_id)}
-                    )
-            db.commit()
-            logger.info("✅ Mise à jour SQLite terminée avec succès.")
+            await scoring_executor.run(save_kmeans_labels, db, df, raw_clusters)
 
     except Exception as e:
         db.rollback()
         logger.error(f"Erreur lors du cycle clustering/update : {str(e)}")
         raise HTTPException(status_code=500, detail="Erreur interne lors du traitement des données")
 
-    # Construction de la réponse enrichie avec la logique métier
-    results = []
-    for i, cluster_id in enumerate(raw_clusters.tolist()):
-        # get_segment_info est une fonction utilitaire renvoyant le label, la couleur, etc.
-        segment = get_segment_info(cluster_id)
-        results.append({
-            "client_index": i,
-            "cluster": int(cluster_id),
-            "segment": segment["label"],
-            "short_label": segment["short_label"],
-            "color": segment["color"],
-            "priority": segment["priority"],
-            "strategy": segment["strategy"],
-            "recommended_action": segment["action"]
-        })
+    # Réponse binaire colonne par colonne si le client la demande (Accept)
+    media_type = negotiate(request)
+    if media_type != JSON:
+        return columnar_response(
+            {
+                "cluster": raw_clusters.astype("int32"),
+                "segment": [get_segment_info(int(c))["label"] for c in raw_clusters],
+            },
+            media_type,
+            meta={"status": "success", "total_clients": len(df), "updated_in_db": save_to_db,
+                  "model_info": get_model_info(bundle)},
+        )
 
     return {
         "status": "success",
-        "total_clients": len(clients),
+        "total_clients": len(df),
         "updated_in_db": save_to_db,
-        "results": results
+        "results": cluster_results(raw_clusters),
+        "model_info": get_model_info(bundle)
     }
 
 @app.post("/apply-pca", summary="Projection PCA en temps réel sur de nouveaux clients", tags=["Visualisation"])
 async def apply_pca(
-    clients: List[ClientSchema] = Body(..., embed=True),
+    request: Request,
+    clients: Optional[List[ClientSchema]] = Body(None, embed=True),
     n_components: int = Query(2, ge=1, le=50, description="Nombre de composantes principales à retourner")
 ):
     """
@@ -634,28 +1340,39 @@ async def apply_pca(
     
     Exemple de corps :
     [ {client1}, {client2}, ... ] + ?n_components=2 en query param
+
+    Ou colonne par colonne (gros lots) :
+    {"Age": [...], "Income": [...], "Education": [...], ...}
     """
-    if not pca_model or not preprocessor:
+    bundle = model_registry.primary()
+    if not bundle or not bundle.pca or not bundle.preprocessor:
         raise HTTPException(status_code=500, detail="PCA ou préprocesseur non chargé")
 
-    try:
-        df = pd.DataFrame([c.dict() for c in clients])
+    df = await resolve_client_frame(request, clients, bundle)
+    if df.empty:
+        raise HTTPException(status_code=400, detail="La liste de clients fournie est vide.")
 
-        allowed_edu = ["Basic", "2n Cycle", "Graduation", "Master", "PhD"]
-        allowed_marital = ["Single", "Married", "Divorced", "Together", "Widow"]
+    try:
+        pca_coords, clusters = await scoring_executor.map_chunks(project_pca, df, n_components, bundle)
 
-        df["Education"] = df["Education"].astype(str).apply(lambda x: x if x in allowed_edu else "Other")
-        df["Marital_Status"] = df["Marital_Status"].astype(str).apply(lambda x: x if x in allowed_marital else "Other")
+        media_type = negotiate(request)
+        if media_type != JSON:
+            columns = {f"PC{i + 1}": pca_coords[:, i] for i in range(pca_coords.shape[1])}
+            if clusters is not None:
+                columns["cluster"] = clusters.astype("int32")
+            return columnar_response(columns, media_type, meta={
+                "status": "success", "n_components": n_components, "model_info": get_model_info(bundle)
+            })
 
-        X_trans = preprocessor.transform(df)
-        pca_coords = pca_model.transform(X_trans)[:, :n_components].tolist()
-        clusters = kmeans_model.predict(X_trans).tolist() if kmeans_model else None
+        pca_coords = pca_coords.tolist()
+        clusters = clusters.tolist() if clusters is not None else None
 
         return {
             "status": "success",
             "n_components": n_components,
             "pca_components": pca_coords,
-            "clusters": clusters
+            "clusters": clusters,
+            "model_info": get_model_info(bundle)
         }
 
     except Exception as e:
@@ -664,6 +1381,310 @@ async def apply_pca(
     
 
 
+@app.post("/score", summary="Scoring complet en une passe (cluster, confiance, KMeans, distances, PCA)",
+          tags=["Prédiction"])
+async def score_clients(
+    request: Request,
+    clients: Optional[List[ClientSchema]] = Body(None, embed=True),
+    n_components: int = Query(2, ge=1, le=50, description="Nombre de composantes principales à retourner")
+):
+    """
+    Remplace l'enchaînement /predict-cluster + /cluster + /apply-pca : le payload est
+    validé une fois et transformé une seule fois, puis toutes les sorties sont calculées
+    à partir de la même matrice :
+
+    - `cluster` / `probability` : classifieur supervisé
+    - `kmeans_cluster` : centroïde le plus proche
+    - `distances` : distance à chaque centroïde, `is_outlier` si la plus petite dépasse
+      `outlier_threshold` (OUTLIER_FACTOR × rayon quadratique moyen d'entraînement)
+    - `pca` : coordonnées dans l'espace PCA réduit
+
+    Accepte `{"clients": [...]}` ou un corps colonne par colonne (`{"Age": [...], ...}`).
+    """
+    bundle = get_bundle()
+    if not bundle.kmeans or not bundle.pca:
+        raise HTTPException(status_code=500, detail="KMeans ou PCA non chargé")
+
+    df = await resolve_client_frame(request, clients, bundle)
+    if df.empty:
+        raise HTTPException(status_code=400, detail="La liste de clients fournie est vide.")
+
+    try:
+        clusters, probabilities, kmeans_labels, distances, coords = await scoring_executor.map_chunks(
+            score_all, df, n_components, bundle
+        )
+    except Exception as e:
+        logger.error(f"Erreur dans /score : {e}")
+        raise HTTPException(status_code=500, detail="Erreur lors du scoring")
+
+    threshold = kmeans_outlier_threshold(bundle)
+    outliers = outlier_flags(distances, threshold)
+    model_info = get_model_info(bundle)
+
+    # Réponse binaire colonne par colonne si le client la demande (Accept)
+    media_type = negotiate(request)
+    if media_type != JSON:
+        columns = {"cluster": np.asarray(clusters).astype("int32")}
+        if probabilities is not None:
+            columns["probability"] = probabilities
+        columns["kmeans_cluster"] = kmeans_labels.astype("int32")
+        for k in range(distances.shape[1]):
+            columns[f"distance_{k}"] = distances[:, k]
+        columns["is_outlier"] = outliers
+        for i in range(coords.shape[1]):
+            columns[f"PC{i + 1}"] = coords[:, i]
+        return columnar_response(columns, media_type, meta={
+            "status": "success", "total_clients": len(df),
+            "outlier_threshold": threshold, "model_info": model_info
+        })
+
+    results = score_results(clusters, probabilities, kmeans_labels, distances, outliers, coords)
+
+    return {
+        "status": "success",
+        "total_clients": len(results),
+        "outlier_threshold": threshold,
+        "results": results,
+        "model_info": model_info
+    }
+
+
+# -------------------------------------------------------------------------
+# Lots en streaming (/cluster/stream, /score/stream)
+# -------------------------------------------------------------------------
+client_list_adapter = TypeAdapter(List[ClientSchema])
+
+
+def build_batch_frame(batch: List[Dict[str, Any]], bundle: ArtifactBundle) -> pd.DataFrame:
+    """Validation Pydantic d'un lot d'enregistrements bruts puis DataFrame normalisé."""
+    return build_client_frame(client_list_adapter.validate_python(batch), bundle)
+
+
+def cluster_stream_batch(df: pd.DataFrame, offset: int, bundle: ArtifactBundle,
+                         save_to_db: bool, with_results: bool) -> bytes:
+    """Labels KMeans d'un lot, persistance optionnelle, lignes NDJSON de résultat."""
+    labels = predict_kmeans_labels(df, bundle)
+    if save_to_db:
+        db = SessionLocal()
+        try:
+            save_kmeans_labels(db, df, labels)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    if with_results:
+        return b"".join(ndjson_line(r) for r in cluster_results(labels, offset))
+    return ndjson_line({"status": "progress", "processed": offset + len(df), "updated_in_db": save_to_db})
+
+
+def score_stream_batch(df: pd.DataFrame, offset: int, bundle: ArtifactBundle, n_components: int,
+                       threshold: Optional[float]) -> bytes:
+    """Scoring complet d'un lot (même calcul que /score), lignes NDJSON de résultat."""
+    clusters, probabilities, kmeans_labels, distances, coords = score_all(df, n_components, bundle)
+    outliers = outlier_flags(distances, threshold)
+    return b"".join(
+        ndjson_line(r)
+        for r in score_results(clusters, probabilities, kmeans_labels, distances, outliers, coords, offset)
+    )
+
+
+async def stream_batches(request: Request, bundle: ArtifactBundle, score_batch, *args):
+    """
+    Lit le corps par morceaux, valide et score chaque lot de STREAM_CHUNK_SIZE clients
+    dans le pool, et renvoie les résultats au fil de l'eau (NDJSON).
+
+    Les erreurs survenues après l'envoi des en-têtes sont signalées par une dernière
+    ligne {"status": "error", ...} : les lots précédents restent valides.
+    """
+    records = iter_records(request.stream(), ndjson=is_ndjson(request.headers.get("content-type")))
+    processed = 0
+    batches = 0
+    try:
+        async for batch in iter_batches(records):
+            try:
+                df = await scoring_executor.run(build_batch_frame, batch, bundle)
+            except ValidationError as e:
+                # loc[0] = position dans le lot → position dans la requête
+                errors = e.errors(include_url=False, include_context=False, include_input=False)
+                for err in errors:
+                    err["loc"] = [err["loc"][0] + processed, *err["loc"][1:]]
+                yield ndjson_line({"status": "error", "offset": processed, "detail": errors})
+                return
+            yield await scoring_executor.run(score_batch, df, processed, bundle, *args)
+            processed += len(df)
+            batches += 1
+    except StreamParseError as e:
+        yield ndjson_line({"status": "error", "offset": processed, "detail": str(e)})
+        return
+    except Exception as e:
+        logger.error(f"Erreur dans le scoring en streaming : {e}")
+        yield ndjson_line({"status": "error", "offset": processed, "detail": "Erreur interne lors du traitement du lot"})
+        return
+
+    yield ndjson_line({
+        "status": "success", "total_clients": processed, "batches": batches, "model_info": get_model_info(bundle)
+    })
+
+
+@app.post("/cluster/stream", summary="Clustering KMeans en streaming (corps lu et scoré par lots)",
+          tags=["Prédiction"])
+async def assign_cluster_stream(
+    request: Request,
+    save_to_db: bool = Query(False, description="Si True, met à jour la colonne cluster_kmeans dans SQLite (lot par lot)"),
+    results: bool = Query(True, description="Si False, une ligne de progression par lot au lieu d'une ligne par client"),
+):
+    """
+    Variante de /cluster pour les très gros lots : la mémoire utilisée est bornée par
+    STREAM_CHUNK_SIZE, pas par la taille de la requête.
+
+    Corps : NDJSON (`Content-Type: application/x-ndjson`, un client par ligne), tableau
+    JSON ou `{"clients": [...]}`. Réponse : NDJSON, une ligne par client (mêmes champs
+    que /cluster) puis une ligne finale `{"status": "success", "total_clients": ...}`.
+
+    La réponse commence avant la fin de l'envoi du corps : avec `results=true`, le client
+    doit lire la réponse pendant l'envoi (HTTP full duplex, ex. httpx / aiohttp). Un client
+    qui envoie tout avant de lire (requests) utilise `results=false`.
+    """
+    bundle = model_registry.primary()
+    if not bundle or not bundle.kmeans or not bundle.preprocessor:
+        raise HTTPException(status_code=500, detail="KMeans ou préprocesseur non disponible")
+
+    return BodyStreamingResponse(
+        stream_batches(request, bundle, cluster_stream_batch, save_to_db, results),
+        media_type=NDJSON,
+    )
+
+
+@app.post("/score/stream", summary="Scoring complet en streaming (corps lu et scoré par lots)",
+          tags=["Prédiction"])
+async def score_clients_stream(
+    request: Request,
+    n_components: int = Query(2, ge=1, le=50, description="Nombre de composantes principales à retourner"),
+):
+    """
+    Variante de /score pour les très gros lots : corps lu par morceaux (NDJSON, tableau
+    JSON ou `{"clients": [...]}`), lots de STREAM_CHUNK_SIZE clients scorés au fil de
+    l'eau, réponse NDJSON (une ligne par client, mêmes champs que /score, puis une ligne
+    finale de synthèse).
+    """
+    bundle = get_bundle()
+    if not bundle.kmeans or not bundle.pca:
+        raise HTTPException(status_code=500, detail="KMeans ou PCA non chargé")
+
+    return BodyStreamingResponse(
+        stream_batches(request, bundle, score_stream_batch, n_components, kmeans_outlier_threshold(bundle)),
+        media_type=NDJSON,
+    )
+
+
+# -------------------------------------------------------------------------
+# Fichiers CSV / Parquet (/score/file)
+# -------------------------------------------------------------------------
+CLIENT_FEATURES = [name for name in ClientSchema.model_fields if name != "id"]
+
+
+def training_income_mean(bundle: ArtifactBundle) -> Optional[float]:
+    """Moyenne d'Income à l'entraînement (imputation de load_and_prep), lue dans le StandardScaler."""
+    scaler = getattr(bundle.preprocessor, "named_transformers_", {}).get("num")
+    names = list(getattr(scaler, "feature_names_in_", []))
+    if "Income" not in names:
+        return None
+    return float(scaler.mean_[names.index("Income")])
+
+
+def score_file_chunk(chunk: pd.DataFrame, bundle: ArtifactBundle, income_fill: Optional[float]) -> pd.DataFrame:
+    """
+    Dérive Age / Customer_Seniority comme clustering.load_and_prep, score les lignes complètes
+    et ajoute cluster, confidence, PC1, PC2 (vides pour les lignes incomplètes).
+    """
+    features = derive_features(feature_frame(chunk), income_fill=income_fill)
+    features = features[CLIENT_FEATURES]
+    valid = features.notna().all(axis=1).to_numpy()
+
+    n = len(chunk)
+    clusters = np.zeros(n, dtype=np.int64)
+    confidence = np.full(n, np.nan)
+    coords = np.full((n, 2), np.nan)
+    if valid.any():
+        X = bundle.engine.transform(features[valid])
+        predicted, probabilities = bundle.engine.predict_matrix(X)
+        clusters[valid] = predicted
+        if probabilities is not None:
+            confidence[valid] = probabilities
+        coords[valid] = bundle.pca.transform(X)[:, :2]
+
+    out = chunk.copy()
+    out["cluster"] = pd.arrays.IntegerArray(clusters, ~valid)
+    out["confidence"] = confidence
+    out["PC1"] = coords[:, 0]
+    out["PC2"] = coords[:, 1]
+    return out
+
+
+@app.post("/score/file", summary="Scoring d'un fichier CSV / Parquet (résultat en streaming)",
+          tags=["Prédiction"])
+def score_file(
+    file: UploadFile = File(..., description="Export clients (CSV ou Parquet)"),
+    output: Optional[str] = Query(None, pattern="^(csv|parquet)$", description="Format de sortie (défaut : celui du fichier)"),
+    sep: str = Query(";", min_length=1, max_length=1, description="Séparateur CSV (entrée et sortie)"),
+):
+    """
+    Score un export marketing brut (ex. `Data/marketing_campaign_clean.csv` : `Year_Birth`,
+    `Dt_Customer`, ...) ou un fichier déjà au format ClientSchema, sans conversion préalable.
+
+    Le fichier est lu par blocs de UPLOAD_CHUNK_SIZE lignes : Age et Customer_Seniority sont
+    dérivés comme à l'entraînement (clustering.derive_features, Income manquant remplacé par
+    la moyenne d'entraînement), chaque bloc est scoré puis renvoyé aussitôt. La réponse est le
+    fichier d'origine avec les colonnes `cluster`, `confidence`, `PC1`, `PC2` ajoutées (vides
+    pour les lignes incomplètes). La mémoire utilisée ne dépend pas de la taille du fichier.
+    """
+    bundle = get_bundle()
+    if not bundle.pca:
+        raise HTTPException(status_code=500, detail="PCA non chargé")
+
+    fmt = detect_format(file.filename, file.content_type)
+    out_fmt = output or fmt
+    if PARQUET in (fmt, out_fmt) and not parquet_available():
+        raise HTTPException(status_code=415, detail="Parquet indisponible (pyarrow non installé)")
+
+    chunks = iter_chunks(file.file, fmt, sep=sep)
+    try:
+        try:
+            first = next(chunks, None)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Fichier illisible : {e}")
+        if first is None:
+            raise HTTPException(status_code=400, detail="Le fichier ne contient aucune ligne.")
+
+        # Colonnes vérifiées sur le premier bloc, avant l'envoi des en-têtes
+        derived = derive_features(feature_frame(first.head(1)))
+        missing = [col for col in CLIENT_FEATURES if col not in derived.columns]
+        if missing:
+            raise HTTPException(status_code=422, detail=f"Colonnes manquantes : {missing}")
+    except HTTPException:
+        chunks.close()
+        raise
+
+    income_fill = training_income_mean(bundle)
+
+    def generate():
+        writer = ChunkWriter(out_fmt, sep=sep)
+        try:
+            for chunk in itertools.chain([first], chunks):
+                yield writer.write(score_file_chunk(chunk, bundle, income_fill))
+            yield writer.close()
+        finally:
+            file.file.close()
+
+    stem = Path(file.filename or "clients").stem
+    return StreamingResponse(
+        generate(),
+        media_type=MEDIA_TYPES[out_fmt],
+        headers={"Content-Disposition": f'attachment; filename="{stem}_scored.{out_fmt}"'},
+    )
+
+
 # -----------------------------
 #  SCHEMA Pydantic d'entrée
 # -----------------------------
@@ -0,0 +1,126 @@
+"""
+memstats.py
+-----------
+Mesure de la mémoire résidente et partagée (Linux, /proc/self/smaps).
+
+Avec ARTIFACT_MMAP=1, les tableaux NumPy des artefacts joblib sont projetés en
+mémoire depuis les fichiers .joblib : les pages lues appartiennent au cache de
+pages du noyau et sont partagées par tous les workers uvicorn qui ouvrent le
+même fichier. smaps permet d'attribuer ces pages à chaque fichier d'artefact
+(Rss, Pss, partagé / privé). La partie copiée dans le tas du processus est
+estimée en parcourant les tableaux NumPy de l'objet.
+"""
+
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SMAPS_PATH = Path("/proc/self/smaps")
+SMAPS_ROLLUP_PATH = Path("/proc/self/smaps_rollup")
+
+_FIELDS = {
+    "Rss": "rss_kb",
+    "Pss": "pss_kb",
+    "Shared_Clean": "shared_clean_kb",
+    "Shared_Dirty": "shared_dirty_kb",
+    "Private_Clean": "private_clean_kb",
+    "Private_Dirty": "private_dirty_kb",
+}
+
+
+def _parse_fields(lines: Iterable[str]) -> Dict[str, int]:
+    out = {name: 0 for name in _FIELDS.values()}
+    for line in lines:
+        key, _, rest = line.partition(":")
+        if key in _FIELDS:
+            out[_FIELDS[key]] += int(rest.split()[0])
+    return out
+
+
+def read_smaps() -> Optional[List[Dict[str, Any]]]:
+    """Liste des projections mémoire du processus (chemin + compteurs en kB), None hors Linux."""
+    try:
+        text = SMAPS_PATH.read_text()
+    except OSError:
+        return None
+
+    mappings: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    for line in text.splitlines():
+        head = line.split(None, 5)
+        # Ligne d'en-tête : "adresse perms offset dev inode [chemin]"
+        if len(head) >= 5 and "-" in head[0] and ":" not in head[0]:
+            current = {"path": head[5].strip() if len(head) == 6 else "", "lines": []}
+            mappings.append(current)
+        elif current is not None:
+            current["lines"].append(line)
+    return [{"path": m["path"], **_parse_fields(m["lines"])} for m in mappings]
+
+
+def _with_totals(usage: Dict[str, int]) -> Dict[str, int]:
+    usage["shared_kb"] = usage["shared_clean_kb"] + usage["shared_dirty_kb"]
+    usage["private_kb"] = usage["private_clean_kb"] + usage["private_dirty_kb"]
+    return usage
+
+
+def process_memory() -> Optional[Dict[str, int]]:
+    """Totaux du processus (Rss, Pss, partagé, privé) en kB."""
+    try:
+        return _with_totals(_parse_fields(SMAPS_ROLLUP_PATH.read_text().splitlines()))
+    except OSError:
+        pass
+    mappings = read_smaps()
+    if mappings is None:
+        return None
+    totals = {name: sum(m[name] for m in mappings) for name in _FIELDS.values()}
+    return _with_totals(totals)
+
+
+def mapped_file_usage(path: Path, mappings: Optional[List[Dict[str, Any]]]) -> Optional[Dict[str, int]]:
+    """Mémoire des projections d'un fichier donné (pages mmap d'un artefact)."""
+    if mappings is None:
+        return None
+    target = str(Path(path).resolve())
+    matched = [m for m in mappings if m["path"] == target]
+    usage = {name: sum(m[name] for m in matched) for name in _FIELDS.values()}
+    usage["mappings"] = len(matched)
+    return _with_totals(usage)
+
+
+def array_footprint(obj: Any, _seen: Optional[set] = None) -> Dict[str, int]:
+    """
+    Octets des tableaux NumPy contenus dans `obj` (attributs, listes, dicts) :
+    `mapped_bytes` pour les np.memmap, `heap_bytes` pour les copies privées.
+    """
+    seen = _seen if _seen is not None else set()
+    totals = {"heap_bytes": 0, "mapped_bytes": 0}
+    if id(obj) in seen:
+        return totals
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        base = obj
+        while base.base is not None and isinstance(base.base, np.ndarray):
+            base = base.base
+        key = "mapped_bytes" if isinstance(obj, np.memmap) or isinstance(base, np.memmap) else "heap_bytes"
+        totals[key] += obj.nbytes
+        return totals
+
+    if isinstance(obj, dict):
+        children = list(obj.values())
+    elif isinstance(obj, (list, tuple)):
+        children = list(obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        children = list(vars(obj).values())
+    else:
+        return totals
+
+    for child in children:
+        sub = array_footprint(child, seen)
+        totals["heap_bytes"] += sub["heap_bytes"]
+        totals["mapped_bytes"] += sub["mapped_bytes"]
+    return totals
@@ -0,0 +1,155 @@
+"""
+migrations.py
+-------------
+Migrations versionnées du schéma SQLite (PRAGMA user_version).
+
+`Base.metadata.create_all` crée les tables manquantes mais ne modifie jamais une
+table existante : index et colonnes ajoutés après coup passent par une migration.
+Chaque migration porte un numéro croissant ; run_migrations() applique, dans une
+transaction `BEGIN IMMEDIATE`, celles dont le numéro dépasse user_version, puis
+enregistre le nouveau numéro. Plusieurs processus peuvent l'appeler en même temps :
+le premier applique, les autres relisent la version à jour et ne font rien.
+
+Index et colonnes sont aussi déclarés dans models.py (mêmes noms) : une base
+neuve les reçoit de create_all, d'où les `IF NOT EXISTS` et add_columns().
+"""
+
+import logging
+from typing import Callable, List, Tuple, Union
+
+from sqlalchemy.engine import Engine
+
+# Import relatif : le module est chargé sous Api.* (API) comme sous Backend.Api.* (scripts)
+from .models import client_natural_key
+
+logger = logging.getLogger(__name__)
+
+# Instruction SQL, ou fonction recevant le curseur (étapes conditionnelles)
+Step = Union[str, Callable[..., None]]
+
+
+def add_columns(table: str, columns: List[Tuple[str, str]]) -> Callable[..., None]:
+    """ALTER TABLE ... ADD COLUMN pour les colonnes absentes (SQLite n'a pas de IF NOT EXISTS)."""
+    def step(cursor) -> None:
+        existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        for name, sql_type in columns:
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+    return step
+
+
+# Entrées du modèle (ClientSchema) → colonnes typées de predictions
+_PREDICTION_INPUTS = [
+    ("age", "INTEGER", "Age"), ("customer_seniority", "INTEGER", "Customer_Seniority"),
+    ("education", "VARCHAR", "Education"), ("marital_status", "VARCHAR", "Marital_Status"),
+    ("income", "FLOAT", "Income"), ("kidhome", "INTEGER", "Kidhome"), ("teenhome", "INTEGER", "Teenhome"),
+    ("recency", "INTEGER", "Recency"), ("mnt_wines", "FLOAT", "MntWines"), ("mnt_fruits", "FLOAT", "MntFruits"),
+    ("mnt_meat", "FLOAT", "MntMeatProducts"), ("mnt_fish", "FLOAT", "MntFishProducts"),
+    ("mnt_sweets", "FLOAT", "MntSweetProducts"), ("mnt_gold", "FLOAT", "MntGoldProds"),
+    ("num_deals", "INTEGER", "NumDealsPurchases"), ("num_web", "INTEGER", "NumWebPurchases"),
+    ("num_catalog", "INTEGER", "NumCatalogPurchases"), ("num_store", "INTEGER", "NumStorePurchases"),
+    ("num_web_visits", "INTEGER", "NumWebVisitsMonth"),
+]
+
+# Prédictions déjà journalisées : colonnes typées extraites du JSON, en SQL
+_BACKFILL_PREDICTION_INPUTS = (
+    "UPDATE predictions SET "
+    + ", ".join(f"{column} = json_extract(payload, '$.{key}')" for column, _, key in _PREDICTION_INPUTS)
+    + " WHERE payload IS NOT NULL AND json_valid(payload) AND json_type(payload) = 'object'"
+)
+
+def _backfill_client_natural_keys(cursor) -> None:
+    """
+    Empreinte de clé naturelle des clients existants. Les doublons déjà en base
+    (même clé) la laissent à NULL, sauf le plus ancien : l'index unique peut être créé.
+    """
+    seen = {row[0] for row in cursor.execute("SELECT natural_key FROM client_data WHERE natural_key IS NOT NULL")}
+    updates = []
+    rows = cursor.execute(
+        "SELECT id, income, year_birth, dt_customer FROM client_data WHERE natural_key IS NULL ORDER BY id"
+    ).fetchall()
+    for client_id, income, year_birth, dt_customer in rows:
+        key = client_natural_key(income, year_birth, dt_customer)
+        if key not in seen:
+            seen.add(key)
+            updates.append((key, client_id))
+    cursor.executemany("UPDATE client_data SET natural_key = ? WHERE id = ?", updates)
+    if len(rows) > len(updates):
+        logger.warning(f"{len(rows) - len(updates)} clients en doublon de clé naturelle (natural_key laissé à NULL)")
+
+
+# (version, description, étapes)
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "Index secondaires (segments, clé naturelle d'ingestion, PCA, profils, prédictions)", [
+        # /segments/stats (recalcul) et Crud.get_clients_by_cluster
+        "CREATE INDEX IF NOT EXISTS ix_client_data_cluster_kmeans ON client_data (cluster_kmeans)",
+        "CREATE INDEX IF NOT EXISTS ix_client_data_cluster_cah ON client_data (cluster_cah)",
+        # Dédoublonnage de Crud.bulk_upsert_clients
+        "CREATE INDEX IF NOT EXISTS ix_client_data_natural_key ON client_data (income, year_birth, dt_customer)",
+        "CREATE INDEX IF NOT EXISTS ix_pca_results_client_id ON pca_results (client_id)",
+        "CREATE INDEX IF NOT EXISTS ix_pca_results_model_type_created_at ON pca_results (model_type, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_pca_results_created_at ON pca_results (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_cluster_profiles_model_type_created_at ON cluster_profiles (model_type, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_cluster_profiles_created_at ON cluster_profiles (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_predictions_timestamp ON predictions (timestamp)",
+    ]),
+    (2, "Entrées des prédictions en colonnes typées + version du modèle", [
+        add_columns("predictions", [("model_version", "VARCHAR")]
+                    + [(column, sql_type) for column, sql_type, _ in _PREDICTION_INPUTS]),
+        _BACKFILL_PREDICTION_INPUTS,
+        "CREATE INDEX IF NOT EXISTS ix_predictions_cluster_timestamp ON predictions (predicted_cluster, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_predictions_model_version_timestamp ON predictions (model_version, timestamp)",
+    ]),
+    (3, "Empreinte unique de clé naturelle des clients (ingestion ensembliste)", [
+        add_columns("client_data", [("natural_key", "VARCHAR")]),
+        _backfill_client_natural_keys,
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_client_data_natural_key ON client_data (natural_key)",
+        # Remplacé par l'index unique : plus aucune requête ne filtre sur ces trois colonnes
+        "DROP INDEX IF EXISTS ix_client_data_natural_key",
+    ]),
+]
+
+LATEST_VERSION = max(version for version, _, _ in MIGRATIONS)
+
+
+def schema_version(engine: Engine) -> int:
+    """Version du schéma enregistrée dans la base (0 = jamais migrée)."""
+    with engine.connect() as conn:
+        return int(conn.exec_driver_sql("PRAGMA user_version").scalar() or 0)
+
+
+def run_migrations(engine: Engine) -> int:
+    """Applique les migrations en attente (tables déjà créées) ; retourne la version finale."""
+    raw = engine.raw_connection()
+    try:
+        dbapi_conn = raw.driver_connection
+        previous_isolation = dbapi_conn.isolation_level
+        # Transactions explicites : le module sqlite3 n'ouvre pas de transaction pour le DDL
+        dbapi_conn.isolation_level = None
+        cursor = dbapi_conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            current = cursor.execute("PRAGMA user_version").fetchone()[0]
+            try:
+                for version, description, statements in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    logger.info(f"Migration du schéma {version} : {description}")
+                    for statement in statements:
+                        if callable(statement):
+                            statement(cursor)
+                        else:
+                            cursor.execute(statement)
+                    # user_version fait partie de la transaction : tout ou rien
+                    cursor.execute(f"PRAGMA user_version = {int(version)}")
+                    current = version
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        finally:
+            cursor.close()
+            dbapi_conn.isolation_level = previous_isolation
+        return current
+    finally:
+        raw.close()
@@ -7,43 +7,124 @@ Inclut la documentation des colonnes pour une traçabilité métier totale.
 """
 
 from sqlalchemy import (
-    Column, Integer, String, Float, DateTime, JSON, ForeignKey
+    Column, Integer, String, Float, DateTime, JSON, ForeignKey, Boolean, Text, Index
 )
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from datetime import datetime, timezone
+from typing import Any, Iterable, List
+import hashlib
 
 # Import de la Base configurée pour SQLite dans database.py
 from Api.database import Base
 
+# Les index secondaires sont ajoutés aux bases existantes par migrations.py (mêmes noms)
+
 # =====================================================================
 #                          Prediction Model
 # =====================================================================
 class Prediction(Base):
     """
     Stocke les prédictions temps réel effectuées via l'API.
+
+    Les entrées du modèle (ClientSchema) sont stockées dans des colonnes typées,
+    mêmes noms que client_data : les analyses du trafic journalisé (revenu moyen
+    par cluster et par jour, etc.) sont de simples agrégations SQL. Le JSON brut
+    `payload` est optionnel (PREDICTION_STORE_PAYLOAD).
     """
     __tablename__ = "predictions"
+    __table_args__ = (
+        # Agrégations par segment / par version sur une plage de dates
+        Index("ix_predictions_cluster_timestamp", "predicted_cluster", "timestamp"),
+        Index("ix_predictions_model_version_timestamp", "model_version", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    payload = Column(JSON, doc="Données d'entrée brutes envoyées à l'API")
+    payload = Column(JSON(none_as_null=True), nullable=True, doc="Données d'entrée brutes envoyées à l'API (optionnel)")
     predicted_cluster = Column(Integer, doc="ID du segment prédit par le modèle RandomForest")
     confidence = Column(Float, doc="Score de probabilité (0 à 1) du classifieur")
+    model_version = Column(String, nullable=True, doc="Version des artefacts ayant produit la prédiction")
     # timestamp = Column(DateTime, default=datetime.utcnow, doc="Date et heure de la prédiction")
     # Correction ici : Utilisation de la méthode moderne recommandée
-    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
     pc1 = Column(Float, nullable=True, doc="Coordonnée sur le premier axe principal PCA")
     pc2 = Column(Float, nullable=True, doc="Coordonnée sur le second axe principal PCA")
 
+    # ---- Entrées du modèle (ClientSchema) ----
+    age = Column(Integer, doc="Âge du client")
+    customer_seniority = Column(Integer, doc="Ancienneté du client en mois")
+    education = Column(String, doc="Niveau d'éducation du client")
+    marital_status = Column(String, doc="Statut marital du client")
+    income = Column(Float, doc="Revenu annuel du client")
+    kidhome = Column(Integer, doc="Nombre d'enfants (0-12 ans) au foyer")
+    teenhome = Column(Integer, doc="Nombre d'adolescents (13-17 ans) au foyer")
+    recency = Column(Integer, doc="Nombre de jours depuis le dernier achat")
+    mnt_wines = Column(Float, doc="Montant dépensé en vins")
+    mnt_fruits = Column(Float, doc="Montant dépensé en fruits")
+    mnt_meat = Column(Float, doc="Montant dépensé en viandes")
+    mnt_fish = Column(Float, doc="Montant dépensé en poissons")
+    mnt_sweets = Column(Float, doc="Montant dépensé en confiseries")
+    mnt_gold = Column(Float, doc="Montant dépensé en produits de luxe")
+    num_deals = Column(Integer, doc="Nombre d'achats avec réduction")
+    num_web = Column(Integer, doc="Nombre d'achats sur le site web")
+    num_catalog = Column(Integer, doc="Nombre d'achats via catalogue")
+    num_store = Column(Integer, doc="Nombre d'achats en magasin")
+    num_web_visits = Column(Integer, doc="Nombre de visites du site web par mois")
+
 
 # =====================================================================
 #                          ClientData Model
 # =====================================================================
+# Format de stockage des DateTime SQLAlchemy sur SQLite (base de l'empreinte)
+_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def _is_stored_datetime(value: str) -> bool:
+    return len(value) == 26 and value[4] == "-" and value[10] == " " and value[19] == "."
+
+
+def client_natural_key(income: Any, year_birth: Any, dt_customer: Any) -> str:
+    """
+    Empreinte (sha1) de la clé naturelle (income, year_birth, dt_customer) sur laquelle
+    l'ingestion dédoublonne. Valeurs normalisées (float, int, date à la microseconde) :
+    même empreinte depuis un DataFrame pandas ou une ligne SQLite ; valeur absente = "".
+    """
+    return client_natural_keys([income], [year_birth], [dt_customer])[0]
+
+
+def _date_part(value: Any) -> str:
+    if value is None or value != value:
+        return ""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).strftime(_DATETIME_FORMAT)
+    return value.strftime(_DATETIME_FORMAT)
+
+
+def client_natural_keys(incomes: Iterable[Any], years: Iterable[Any], dates: Iterable[Any]) -> List[str]:
+    """Empreintes de client_natural_key calculées colonne par colonne (ingestion en masse)."""
+    # NaN / NaT ne sont pas égaux à eux-mêmes
+    incomes = ["" if v is None or v != v else repr(float(v)) for v in incomes]
+    years = ["" if v is None or v != v else str(int(v)) for v in years]
+    # Chaîne déjà au format de stockage (lecture SQLite, Crud) : pas de reparsing
+    dates = [v if isinstance(v, str) and _is_stored_datetime(v) else _date_part(v) for v in dates]
+    sha1 = hashlib.sha1
+    return [sha1(f"{i}|{y}|{d}".encode()).hexdigest() for i, y, d in zip(incomes, years, dates)]
+
+
+def _natural_key_default(context) -> str:
+    params = context.get_current_parameters()
+    return client_natural_key(params.get("income"), params.get("year_birth"), params.get("dt_customer"))
+
+
 class ClientData(Base):
     """
     Modèle représentant un client dans le dataset marketing historique.
     """
     __tablename__ = "client_data"
+    __table_args__ = (
+        # Clé naturelle sur laquelle l'ingestion dédoublonne (Crud.bulk_upsert_clients, ON CONFLICT)
+        Index("uq_client_data_natural_key", "natural_key", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
 
@@ -55,6 +136,8 @@ class ClientData(Base):
 
     # ---- Informations temporelles ----
     dt_customer = Column(DateTime, doc="Date d'inscription du client dans la base")
+    natural_key = Column(String, nullable=True, default=_natural_key_default,
+                         doc="Empreinte de (income, year_birth, dt_customer), voir client_natural_key")
     age = Column(Integer, doc="Âge calculé au moment de l'analyse")
     customer_seniority = Column(Integer, doc="Ancienneté du client en mois")
 
@@ -79,8 +162,8 @@ class ClientData(Base):
     num_web_visits = Column(Integer, doc="Nombre de visites sur le site web par mois")
 
     # ---- Résultats de clustering ----
-    cluster_kmeans = Column(Integer, nullable=True, doc="Cluster attribué par l'algorithme K-Means")
-    cluster_cah = Column(Integer, nullable=True, doc="Cluster attribué par la Classification Ascendante Hiérarchique")
+    cluster_kmeans = Column(Integer, nullable=True, index=True, doc="Cluster attribué par l'algorithme K-Means")
+    cluster_cah = Column(Integer, nullable=True, index=True, doc="Cluster attribué par la Classification Ascendante Hiérarchique")
 
     # Relation vers les résultats PCA
     pca_results = relationship("PCAResult", back_populates="customer", cascade="all, delete-orphan")
@@ -94,6 +177,9 @@ class ClusterProfile(Base):
     Contient les statistiques agrégées pour chaque segment marketing.
     """
     __tablename__ = "cluster_profiles"
+    __table_args__ = (
+        Index("ix_cluster_profiles_model_type_created_at", "model_type", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     model_type = Column(String, doc="Type de modèle source (ex: kmeans)")
@@ -101,7 +187,7 @@ class ClusterProfile(Base):
     profile_data = Column(JSON, doc="Dictionnaire JSON des moyennes et KPIs du segment")
     # created_at = Column(DateTime, default=datetime.utcnow, doc="Date de création du profil")
     # Correction ici aussi
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
 
 
 # =====================================================================
@@ -112,16 +198,98 @@ class PCAResult(Base):
     Coordonnées PCA d'un client pour la visualisation 2D.
     """
     __tablename__ = "pca_results"
+    __table_args__ = (
+        Index("ix_pca_results_model_type_created_at", "model_type", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    client_id = Column(Integer, ForeignKey("client_data.id"), doc="Référence vers le client")
+    client_id = Column(Integer, ForeignKey("client_data.id"), index=True, doc="Référence vers le client")
 
     pc1 = Column(Float, doc="Première composante principale")
     pc2 = Column(Float, doc="Deuxième composante principale")
     model_type = Column(String, default="kmeans", doc="Modèle utilisé pour la projection")
     # created_at = Column(DateTime, default=datetime.utcnow)
     # Correction ici aussi
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
 
     # Relation inverse vers ClientData
-    customer = relationship("ClientData", back_populates="pca_results")
\ No newline at end of file
+    customer = relationship("ClientData", back_populates="pca_results")
+
+
+# =====================================================================
+#                          ScoringJob Model
+# =====================================================================
+class ScoringJob(Base):
+    """
+    Job de scoring en arrière-plan (voir jobs.py) : état, progression et point de reprise.
+    """
+    __tablename__ = "scoring_jobs"
+
+    id = Column(String, primary_key=True, doc="Identifiant du job (uuid hex)")
+    kind = Column(String, nullable=False, doc="Type de job (ex: cluster_clients)")
+    status = Column(String, nullable=False, index=True, doc="queued, running, succeeded, failed, cancelled")
+    params = Column(JSON, doc="Paramètres de soumission (taille des lots, filtre...)")
+
+    total_rows = Column(Integer, default=0, doc="Nombre de lignes à scorer")
+    processed_rows = Column(Integer, default=0, doc="Lignes traitées (scorées ou ignorées)")
+    skipped_rows = Column(Integer, default=0, doc="Lignes ignorées (features manquantes)")
+    last_id = Column(Integer, default=0, doc="Dernier client_data.id traité (point de reprise)")
+
+    cancel_requested = Column(Boolean, default=False, doc="Annulation demandée (prise en compte entre deux lots)")
+    error = Column(Text, nullable=True, doc="Message d'erreur si le job a échoué")
+    model_version = Column(String, nullable=True, doc="Version des artefacts utilisée")
+    worker_pid = Column(Integer, nullable=True, doc="PID du processus qui exécute le job")
+
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = Column(DateTime, nullable=True, doc="Début de l'exécution en cours (reprise comprise)")
+    start_processed_rows = Column(Integer, default=0, doc="processed_rows au début de l'exécution en cours")
+    heartbeat_at = Column(DateTime, nullable=True, doc="Dernier signe de vie du worker")
+    finished_at = Column(DateTime, nullable=True)
+
+
+# =====================================================================
+#                       SegmentAggregate Model
+# =====================================================================
+class SegmentAggregate(Base):
+    """
+    Agrégats matérialisés par segment K-Means (voir segments.py), tenus à jour par deltas.
+    Une ligne par (cluster, colonne) ; la ligne `feature="*"` porte l'effectif du segment.
+    """
+    __tablename__ = "segment_aggregates"
+
+    cluster = Column(Integer, primary_key=True, autoincrement=False, doc="cluster_kmeans (-1 = non attribué)")
+    feature = Column(String, primary_key=True, doc="Colonne de client_data agrégée ('*' = effectif)")
+    count = Column(Integer, nullable=False, default=0, doc="Nombre de valeurs non nulles")
+    total = Column(Float, nullable=False, default=0.0, doc="Somme des valeurs")
+    total_sq = Column(Float, nullable=False, default=0.0, doc="Somme des carrés des valeurs")
+
+
+# =====================================================================
+#                       PredictionRollup Model
+# =====================================================================
+class PredictionRollup(Base):
+    """
+    Agrégats des prédictions journalisées par tranche horaire et journalière
+    (voir prediction_rollups.py), conservés après la purge des lignes brutes.
+    Une ligne par (granularité, tranche, cluster, métrique) :
+      - `*` : nombre de prédictions et somme des confiances ;
+      - `confidence:<k>` : prédictions dont la confiance tombe dans le k-ième dixième ;
+      - nom de colonne de predictions : nombre de valeurs non nulles et leur somme.
+    """
+    __tablename__ = "prediction_rollups"
+
+    granularity = Column(String, primary_key=True, doc="'hour' ou 'day'")
+    bucket_start = Column(DateTime, primary_key=True, doc="Début de la tranche (UTC)")
+    predicted_cluster = Column(Integer, primary_key=True, autoincrement=False, doc="Segment prédit")
+    metric = Column(String, primary_key=True, doc="'*', 'confidence:<k>' ou colonne agrégée")
+    count = Column(Integer, nullable=False, default=0, doc="Nombre de prédictions / de valeurs non nulles")
+    total = Column(Float, nullable=False, default=0.0, doc="Somme des valeurs (confiance pour '*')")
+
+
+class RollupWatermark(Base):
+    """Dernier identifiant de predictions déjà agrégé (les lignes au-delà restent à traiter)."""
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String, primary_key=True, doc="Table source agrégée")
+    last_id = Column(Integer, nullable=False, default=0, doc="Dernier id agrégé")
+    updated_at = Column(DateTime, nullable=True, doc="Dernière avancée du watermark")
@@ -0,0 +1,450 @@
+"""
+pca_store.py
+------------
+Stockage en mémoire des coordonnées PCA pré-calculées (Data/pca_coords.csv).
+
+Le CSV est chargé une seule fois dans des tableaux compacts (float32 pour
+PC1/PC2, uint8 pour le cluster) puis rechargé automatiquement si le fichier
+change sur disque (nouvel entraînement via clustering.py).
+
+Fonctionnalités :
+  - pagination par curseur (éventuellement filtrée par cluster)
+  - échantillonnage aléatoire stratifié par cluster, reproductible (seed)
+  - index spatial en grille : requêtes par fenêtre (viewport) et k plus proches voisins
+  - agrégation de densité (grille carrée ou hexagonale) par cluster, avec tuiles de zoom
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class GridIndex:
+    """
+    Index spatial en grille uniforme sur le plan (PC1, PC2).
+
+    Les points sont triés par cellule (format CSR : `order` + `offsets`), ce qui
+    permet de ne parcourir que les cellules touchées par une requête.
+    Mémoire : un tableau int64 de n lignes + (nx·ny + 1) offsets.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, target_per_cell: int = 32):
+        n = len(x)
+        self.xmin = float(x.min()) if n else 0.0
+        self.xmax = float(x.max()) if n else 1.0
+        self.ymin = float(y.min()) if n else 0.0
+        self.ymax = float(y.max()) if n else 1.0
+
+        # ~target_per_cell points par cellule en moyenne, bornée pour les très gros volumes
+        side = int(np.clip(np.sqrt(max(n, 1) / target_per_cell), 1, 4096))
+        self.nx = self.ny = side
+        self.cell_w = max(self.xmax - self.xmin, 1e-9) / self.nx
+        self.cell_h = max(self.ymax - self.ymin, 1e-9) / self.ny
+
+        cells = self._cell_ids(x, y)
+        self.order = np.argsort(cells, kind="stable")
+        counts = np.bincount(cells, minlength=self.nx * self.ny)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def _col(self, x) -> np.ndarray:
+        return np.clip(((np.asarray(x) - self.xmin) / self.cell_w).astype(np.int64), 0, self.nx - 1)
+
+    def _row(self, y) -> np.ndarray:
+        return np.clip(((np.asarray(y) - self.ymin) / self.cell_h).astype(np.int64), 0, self.ny - 1)
+
+    def _cell_ids(self, x, y) -> np.ndarray:
+        return self._row(y) * self.nx + self._col(x)
+
+    def _rows_in_cells(self, c0: int, c1: int, r0: int, r1: int) -> np.ndarray:
+        """Lignes de toutes les cellules du rectangle [c0, c1] × [r0, r1] (bornes incluses)."""
+        parts = []
+        for r in range(r0, r1 + 1):
+            # Les cellules d'une même rangée sont contiguës dans `order`
+            start = self.offsets[r * self.nx + c0]
+            stop = self.offsets[r * self.nx + c1 + 1]
+            if stop > start:
+                parts.append(self.order[start:stop])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def query_box(self, x: np.ndarray, y: np.ndarray, xmin: float, xmax: float, ymin: float, ymax: float) -> np.ndarray:
+        """Index des points dans la boîte [xmin, xmax] × [ymin, ymax], triés."""
+        if xmin > self.xmax or xmax < self.xmin or ymin > self.ymax or ymax < self.ymin:
+            return np.empty(0, dtype=np.int64)
+        c0, c1 = int(self._col(xmin)), int(self._col(xmax))
+        r0, r1 = int(self._row(ymin)), int(self._row(ymax))
+        rows = self._rows_in_cells(c0, c1, r0, r1)
+        # Filtrage exact (les cellules de bord débordent de la boîte)
+        px, py = x[rows], y[rows]
+        mask = (px >= xmin) & (px <= xmax) & (py >= ymin) & (py <= ymax)
+        return np.sort(rows[mask])
+
+    def _rows_in_new_cells(self, old: Optional[tuple], new: tuple) -> np.ndarray:
+        """
+        Lignes des cellules du rectangle `new` (c0, c1, r0, r1) absentes de `old`,
+        qui doit y être inclus (None : tout le rectangle).
+        """
+        c0, c1, r0, r1 = new
+        if old is None:
+            spans = [(np.arange(r0, r1 + 1), c0, c1)]
+        else:
+            oc0, oc1, or0, or1 = old
+            spans = [(np.arange(r0, or0), c0, c1), (np.arange(or1 + 1, r1 + 1), c0, c1)]
+            middle = np.arange(or0, or1 + 1)
+            if c0 < oc0:
+                spans.append((middle, c0, oc0 - 1))
+            if oc1 < c1:
+                spans.append((middle, oc1 + 1, c1))
+        # Un segment [start, stop) de `order` par rangée
+        starts = np.concatenate([self.offsets[rows * self.nx + a] for rows, a, _ in spans])
+        stops = np.concatenate([self.offsets[rows * self.nx + b + 1] for rows, _, b in spans])
+        return self._gather(starts, stops)
+
+    def _gather(self, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+        """Concatène les segments order[start:stop] sans boucle Python par segment."""
+        lengths = stops - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return self.order[shift + np.arange(total)]
+
+    def nearest(self, x: np.ndarray, y: np.ndarray, qx: float, qy: float, k: int) -> np.ndarray:
+        """
+        Index des k points les plus proches de (qx, qy), du plus proche au plus lointain.
+
+        1. Anneaux de cellules autour de la cellule de la requête (rayon doublé à chaque
+           tour, seules les nouvelles cellules sont lues) jusqu'à réunir k candidats.
+        2. Le k-ième candidat borne la distance cherchée : on lit les cellules non visitées
+           situées à moins de cette distance (grille rognée). Une requête hors de l'étendue
+           des données ne lit que la bordure utile, sans parcourir la grille anneau par anneau.
+        """
+        n = len(x)
+        k = min(k, n)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        cand = np.empty(0, dtype=np.int64)
+        cand_d2 = np.empty(0, dtype=np.float64)
+
+        def merge(rows: np.ndarray) -> None:
+            nonlocal cand, cand_d2
+            if not len(rows):
+                return
+            d2 = (x[rows].astype(np.float64) - qx) ** 2 + (y[rows].astype(np.float64) - qy) ** 2
+            cand = np.concatenate([cand, rows])
+            cand_d2 = np.concatenate([cand_d2, d2])
+            if len(cand) > k:
+                keep = np.argpartition(cand_d2, k - 1)[:k]
+                cand, cand_d2 = cand[keep], cand_d2[keep]
+
+        cx, cy = int(self._col(qx)), int(self._row(qy))
+        full = (0, self.nx - 1, 0, self.ny - 1)
+        scanned = None
+        ring = 0
+        while True:
+            rect = (max(cx - ring, 0), min(cx + ring, self.nx - 1), max(cy - ring, 0), min(cy + ring, self.ny - 1))
+            merge(self._rows_in_new_cells(scanned, rect))
+            scanned = rect
+            if len(cand) >= k or rect == full:
+                break
+            ring = ring * 2 if ring else 1
+
+        # Tout point plus proche que le k-ième candidat est dans une cellule à moins de `radius`
+        radius = float(np.sqrt(cand_d2.max()))
+        c0, c1 = int(self._col(qx - radius)), int(self._col(qx + radius))
+        r0, r1 = int(self._row(qy - radius)), int(self._row(qy + radius))
+        cols, rows = np.meshgrid(np.arange(c0, c1 + 1), np.arange(r0, r1 + 1))
+        cols, rows = cols.ravel(), rows.ravel()
+        unseen = ~((cols >= scanned[0]) & (cols <= scanned[1]) & (rows >= scanned[2]) & (rows <= scanned[3]))
+        cols, rows = cols[unseen], rows[unseen]
+        # Distance de la requête au rectangle de chaque cellule (0 si elle le contient)
+        left = self.xmin + cols * self.cell_w
+        bottom = self.ymin + rows * self.cell_h
+        dx = np.maximum(np.maximum(left - qx, qx - (left + self.cell_w)), 0.0)
+        dy = np.maximum(np.maximum(bottom - qy, qy - (bottom + self.cell_h)), 0.0)
+        # Légère tolérance : les bornes de cellules sont recalculées en flottants
+        close = dx ** 2 + dy ** 2 <= cand_d2.max() * (1 + 1e-9) + 1e-12
+        cells = rows[close] * self.nx + cols[close]
+        if len(cells):
+            merge(self._gather(self.offsets[cells], self.offsets[cells + 1]))
+        return cand[np.argsort(cand_d2, kind="stable")]
+
+def _bin_square(x: np.ndarray, y: np.ndarray, x0: float, y0: float, width: float, height: float, nx: int):
+    """Cellules carrées : nx colonnes, autant de rangées que nécessaire pour couvrir la hauteur."""
+    size = width / nx
+    ny = max(1, int(np.ceil(height / size)))
+    col = np.clip(((x - x0) / size).astype(np.int64), 0, nx - 1)
+    row = np.clip(((y - y0) / size).astype(np.int64), 0, ny - 1)
+    cell = row * nx + col
+    centers_x = x0 + (np.arange(nx * ny) % nx + 0.5) * size
+    centers_y = y0 + (np.arange(nx * ny) // nx + 0.5) * size
+    return cell, centers_x, centers_y
+
+
+def _bin_hex(x: np.ndarray, y: np.ndarray, x0: float, y0: float, width: float, height: float, nx: int):
+    """
+    Cellules hexagonales (même construction que matplotlib.hexbin) : deux réseaux
+    rectangulaires décalés, chaque point rejoint le centre le plus proche.
+    """
+    sx = width / nx
+    sy = sx * np.sqrt(3.0)
+    ny = max(1, int(np.ceil(height / sy)))
+    n1 = (nx + 1) * (ny + 1)
+
+    i1 = np.clip(np.round((x - x0) / sx), 0, nx).astype(np.int64)
+    j1 = np.clip(np.round((y - y0) / sy), 0, ny).astype(np.int64)
+    i2 = np.clip(np.floor((x - x0) / sx), 0, nx - 1).astype(np.int64)
+    j2 = np.clip(np.floor((y - y0) / sy), 0, ny - 1).astype(np.int64)
+
+    d1 = (x - (x0 + i1 * sx)) ** 2 + (y - (y0 + j1 * sy)) ** 2
+    d2 = (x - (x0 + (i2 + 0.5) * sx)) ** 2 + (y - (y0 + (j2 + 0.5) * sy)) ** 2
+    cell = np.where(d1 <= d2, j1 * (nx + 1) + i1, n1 + j2 * nx + i2)
+
+    k1 = np.arange(n1)
+    k2 = np.arange(nx * ny)
+    centers_x = np.concatenate([x0 + (k1 % (nx + 1)) * sx, x0 + (k2 % nx + 0.5) * sx])
+    centers_y = np.concatenate([y0 + (k1 // (nx + 1)) * sy, y0 + (k2 // nx + 0.5) * sy])
+    return cell, centers_x, centers_y
+
+
+class _Snapshot:
+    """Version immuable des points : remplacée en bloc lors d'un rechargement."""
+
+    def __init__(self, df: pd.DataFrame, mtime_ns: int):
+        self.pc1 = df["PC1"].to_numpy(dtype=np.float32)
+        self.pc2 = df["PC2"].to_numpy(dtype=np.float32)
+        self.cluster = df["cluster"].to_numpy(dtype=np.uint8)
+        self.mtime_ns = mtime_ns
+        self.size = len(self.pc1)
+        # Index des lignes de chaque cluster (ordre du fichier)
+        self.by_cluster: Dict[int, np.ndarray] = {
+            int(c): np.flatnonzero(self.cluster == c) for c in np.unique(self.cluster)
+        }
+        self.grid = GridIndex(self.pc1, self.pc2)
+
+
+@dataclass
+class PointSelection:
+    """Résultat d'une requête : lignes sélectionnées dans un snapshot donné."""
+    snapshot: _Snapshot
+    rows: np.ndarray
+    total: int
+    next_cursor: Optional[int] = None
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Colonnes compactes (float32 / uint8) des points sélectionnés."""
+        snap = self.snapshot
+        return {
+            "PC1": snap.pc1[self.rows],
+            "PC2": snap.pc2[self.rows],
+            "cluster": snap.cluster[self.rows],
+        }
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Liste de dicts {PC1, PC2, cluster} (format JSON historique de /pca)."""
+        cols = self.columns()
+        return [
+            {"PC1": x, "PC2": y, "cluster": c}
+            for x, y, c in zip(cols["PC1"].tolist(), cols["PC2"].tolist(), cols["cluster"].tolist())
+        ]
+
+
+class PCAPointStore:
+    """Points PCA en mémoire avec rechargement à chaud sur modification du fichier."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+        self._density_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self.density_cache_size = 256
+
+    # ------------------------------------------------------------------
+    # Chargement
+    # ------------------------------------------------------------------
+    def snapshot(self) -> _Snapshot:
+        """Retourne la version courante, en rechargeant le CSV si son mtime a changé."""
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Fichier {self.path.name} introuvable")
+
+        current = self._snapshot
+        if current is not None and current.mtime_ns == mtime_ns:
+            return current
+
+        with self._lock:
+            if self._snapshot is None or self._snapshot.mtime_ns != mtime_ns:
+                df = pd.read_csv(
+                    self.path,
+                    usecols=["PC1", "PC2", "cluster"],
+                    dtype={"PC1": "float32", "PC2": "float32", "cluster": "uint8"},
+                )
+                self._snapshot = _Snapshot(df, mtime_ns)
+                logger.info(f"📍 {self._snapshot.size} points PCA chargés depuis {self.path.name}")
+            return self._snapshot
+
+    @property
+    def version(self) -> Optional[int]:
+        """Identifiant de version des points (mtime du CSV), utile pour les caches."""
+        return self._snapshot.mtime_ns if self._snapshot else None
+
+    # ------------------------------------------------------------------
+    # Requêtes
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _candidates(snap: _Snapshot, cluster: Optional[int]) -> Optional[np.ndarray]:
+        """Index des lignes candidates (None = toutes les lignes)."""
+        if cluster is None:
+            return None
+        return snap.by_cluster.get(int(cluster), np.empty(0, dtype=np.int64))
+
+    def page(self, cursor: int = 0, limit: int = 1000, cluster: Optional[int] = None) -> PointSelection:
+        """Page de points à partir d'un curseur (next_cursor=None en fin de parcours)."""
+        snap = self.snapshot()
+        candidates = self._candidates(snap, cluster)
+        total = snap.size if candidates is None else len(candidates)
+
+        start = max(0, cursor)
+        stop = min(total, start + limit)
+        rows = np.arange(start, stop) if candidates is None else candidates[start:stop]
+        next_cursor = stop if stop < total else None
+        return PointSelection(snap, rows, total, next_cursor)
+
+    def sample(self, n: int, seed: Optional[int] = None, cluster: Optional[int] = None) -> PointSelection:
+        """Échantillon aléatoire stratifié par cluster (allocation proportionnelle), reproductible via seed."""
+        snap = self.snapshot()
+        rng = np.random.default_rng(seed)
+
+        strata = (
+            {int(cluster): self._candidates(snap, cluster)} if cluster is not None
+            else snap.by_cluster
+        )
+        total = sum(len(idx) for idx in strata.values())
+        if n >= total:
+            rows = np.concatenate(list(strata.values())) if strata else np.empty(0, dtype=np.int64)
+            return PointSelection(snap, np.sort(rows), total)
+
+        # Allocation proportionnelle + méthode des plus forts restes
+        sizes = np.array([len(idx) for idx in strata.values()], dtype=np.float64)
+        quotas = sizes * n / total
+        alloc = np.floor(quotas).astype(np.int64)
+        remainder = n - alloc.sum()
+        if remainder:
+            alloc[np.argsort(alloc - quotas)[:remainder]] += 1
+
+        parts = [
+            rng.choice(idx, size=k, replace=False)
+            for idx, k in zip(strata.values(), alloc) if k > 0
+        ]
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        return PointSelection(snap, np.sort(rows), total)
+
+    def viewport(
+        self, xmin: float, xmax: float, ymin: float, ymax: float,
+        limit: int = 5000, seed: Optional[int] = None
+    ) -> PointSelection:
+        """
+        Points situés dans une fenêtre (PC1 ∈ [xmin, xmax], PC2 ∈ [ymin, ymax]).
+        Au-delà de `limit`, un sous-échantillon aléatoire uniforme est retourné.
+        """
+        snap = self.snapshot()
+        rows = snap.grid.query_box(snap.pc1, snap.pc2, xmin, xmax, ymin, ymax)
+        total = len(rows)
+        if total > limit:
+            rows = np.sort(np.random.default_rng(seed).choice(rows, size=limit, replace=False))
+        return PointSelection(snap, rows, total)
+
+    def density(
+        self,
+        shape: str = "square",
+        resolution: int = 64,
+        z: Optional[int] = None,
+        tx: int = 0,
+        ty: int = 0,
+        model_version: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Agrège le plan PCA en cellules (carrées ou hexagonales) avec comptage par cluster.
+
+        - sans `z` : toute l'étendue, `resolution` cellules en largeur
+        - avec `z` : tuile (tx, ty) d'un découpage 2^z × 2^z de l'étendue, pour un
+          zoom progressif côté frontend ; `resolution` cellules en largeur par tuile
+
+        Les résultats sont mis en cache par (version des points, version du modèle, paramètres).
+        """
+        snap = self.snapshot()
+        key = (snap.mtime_ns, model_version, shape, resolution, z, tx, ty)
+        with self._lock:
+            cached = self._density_cache.get(key)
+            if cached is not None:
+                self._density_cache.move_to_end(key)
+                return cached
+
+        grid = snap.grid
+        x0, y0 = grid.xmin, grid.ymin
+        width = max(grid.xmax - grid.xmin, 1e-9)
+        height = max(grid.ymax - grid.ymin, 1e-9)
+
+        if z is None:
+            rows = np.arange(snap.size)
+        else:
+            n_tiles = 2 ** z
+            if not (0 <= tx < n_tiles and 0 <= ty < n_tiles):
+                raise ValueError(f"Tuile ({tx}, {ty}) hors du niveau de zoom {z}")
+            width, height = width / n_tiles, height / n_tiles
+            x0, y0 = x0 + tx * width, y0 + ty * height
+            rows = grid.query_box(snap.pc1, snap.pc2, x0, x0 + width, y0, y0 + height)
+            # Tuiles semi-ouvertes : un point sur une frontière n'appartient qu'à une tuile
+            px, py = snap.pc1[rows], snap.pc2[rows]
+            keep = ((px < x0 + width) | (tx == n_tiles - 1)) & ((py < y0 + height) | (ty == n_tiles - 1))
+            rows = rows[keep]
+
+        x = snap.pc1[rows].astype(np.float64)
+        y = snap.pc2[rows].astype(np.float64)
+        binner = _bin_hex if shape == "hex" else _bin_square
+        cell, centers_x, centers_y = binner(x, y, x0, y0, width, height, resolution)
+
+        # Comptage (cellule, cluster) en une seule passe
+        n_clusters = int(snap.cluster.max()) + 1 if snap.size else 0
+        n_cells = len(centers_x)
+        joint = np.bincount(
+            cell * n_clusters + snap.cluster[rows], minlength=n_cells * n_clusters
+        ).reshape(n_cells, n_clusters) if n_clusters else np.zeros((n_cells, 0), dtype=np.int64)
+        counts = joint.sum(axis=1)
+        occupied = np.flatnonzero(counts)
+
+        result = {
+            "shape": "hex" if shape == "hex" else "square",
+            "resolution": resolution,
+            "tile": {"z": z, "tx": tx, "ty": ty} if z is not None else None,
+            "bounds": {"xmin": x0, "xmax": x0 + width, "ymin": y0, "ymax": y0 + height},
+            "total_points": int(len(rows)),
+            "cells": {
+                "x": centers_x[occupied].tolist(),
+                "y": centers_y[occupied].tolist(),
+                "count": counts[occupied].tolist(),
+                "by_cluster": {str(c): joint[occupied, c].tolist() for c in range(n_clusters)},
+            },
+        }
+
+        with self._lock:
+            self._density_cache[key] = result
+            while len(self._density_cache) > self.density_cache_size:
+                self._density_cache.popitem(last=False)
+        return result
+
+    def nearest(self, pc1: float, pc2: float, k: int = 10) -> PointSelection:
+        """Les k clients historiques les plus proches d'un point projeté (distance euclidienne)."""
+        snap = self.snapshot()
+        rows = snap.grid.nearest(snap.pc1, snap.pc2, pc1, pc2, k)
+        return PointSelection(snap, rows, snap.size)
@@ -0,0 +1,302 @@
+"""
+prediction_log.py
+-----------------
+Journalisation différée (write-behind) des prédictions dans la table `predictions`.
+
+Les endpoints ne font qu'ajouter l'enregistrement à une file en mémoire ; un thread
+d'écriture les insère par lots (un `executemany`, une transaction, un fsync) dès que :
+  - PREDICTION_LOG_BATCH enregistrements sont en attente, ou
+  - PREDICTION_LOG_INTERVAL_MS se sont écoulées depuis le plus ancien.
+
+À l'arrêt de l'API, la file est vidée avant la fin du processus. Un crash brutal
+perd au plus les enregistrements en attente (au plus un intervalle de flush) : la
+journalisation n'est pas transactionnelle avec la réponse HTTP.
+
+Un lot en échec (base verrouillée, disque plein...) est retenté avec un délai
+exponentiel, puis remis en tête de file tant qu'il y a de la place, un nombre
+limité de fois. Les enregistrements finalement abandonnés sont écrits dans le log.
+
+Les entrées du modèle sont écrites dans les colonnes typées de `predictions`
+(PREDICTION_INPUT_FEATURES) ; le JSON brut n'est conservé qu'avec
+PREDICTION_STORE_PAYLOAD=1.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from Api.database import SessionLocal
+from Api.models import Prediction
+
+logger = logging.getLogger(__name__)
+
+# Taille maximale d'un lot inséré en une transaction
+PREDICTION_LOG_BATCH = int(os.getenv("PREDICTION_LOG_BATCH", "500"))
+# Délai maximal avant l'écriture d'un enregistrement en attente
+PREDICTION_LOG_INTERVAL_MS = float(os.getenv("PREDICTION_LOG_INTERVAL_MS", "200"))
+# Profondeur maximale de la file (au-delà : PredictionLogFull)
+PREDICTION_LOG_MAX_QUEUE = int(os.getenv("PREDICTION_LOG_MAX_QUEUE", "50000"))
+# Tentatives supplémentaires d'un lot en échec, avec un délai doublé à chaque fois
+PREDICTION_LOG_RETRIES = int(os.getenv("PREDICTION_LOG_RETRIES", "3"))
+PREDICTION_LOG_RETRY_BACKOFF_MS = float(os.getenv("PREDICTION_LOG_RETRY_BACKOFF_MS", "50"))
+# Nombre de remises en tête de file d'un lot après épuisement des tentatives (puis abandon)
+PREDICTION_LOG_MAX_REQUEUES = int(os.getenv("PREDICTION_LOG_MAX_REQUEUES", "5"))
+# Conserver aussi le JSON d'entrée brut (colonne payload)
+PREDICTION_STORE_PAYLOAD = os.getenv("PREDICTION_STORE_PAYLOAD", "0") == "1"
+
+# Features du modèle (ClientSchema) → colonnes typées de predictions
+PREDICTION_INPUT_FEATURES = {
+    "Age": Prediction.age,
+    "Customer_Seniority": Prediction.customer_seniority,
+    "Income": Prediction.income,
+    "Kidhome": Prediction.kidhome,
+    "Teenhome": Prediction.teenhome,
+    "Recency": Prediction.recency,
+    "MntWines": Prediction.mnt_wines,
+    "MntFruits": Prediction.mnt_fruits,
+    "MntMeatProducts": Prediction.mnt_meat,
+    "MntFishProducts": Prediction.mnt_fish,
+    "MntSweetProducts": Prediction.mnt_sweets,
+    "MntGoldProds": Prediction.mnt_gold,
+    "NumDealsPurchases": Prediction.num_deals,
+    "NumWebPurchases": Prediction.num_web,
+    "NumCatalogPurchases": Prediction.num_catalog,
+    "NumStorePurchases": Prediction.num_store,
+    "NumWebVisitsMonth": Prediction.num_web_visits,
+    "Education": Prediction.education,
+    "Marital_Status": Prediction.marital_status,
+}
+
+
+class PredictionLogFull(Exception):
+    """La file de journalisation a atteint PREDICTION_LOG_MAX_QUEUE."""
+
+
+def _typed(value: Any, python_type: type) -> Any:
+    """Valeur convertie au type de la colonne ; None si absente ou invalide."""
+    if value is None:
+        return None
+    try:
+        if python_type is int:
+            return int(float(value))
+        if python_type is float:
+            value = float(value)
+            return value if math.isfinite(value) else None
+        return str(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def prediction_record(payload: Any, cluster: Optional[int], confidence: Optional[float],
+                      pc1: Optional[float] = None, pc2: Optional[float] = None,
+                      timestamp: Optional[datetime] = None,
+                      model_version: Optional[str] = None) -> Dict[str, Any]:
+    """Ligne de la table predictions (horodatée à la prédiction, pas à l'écriture)."""
+    inputs = payload if isinstance(payload, dict) else {}
+    record = {
+        "payload": payload if PREDICTION_STORE_PAYLOAD else None,
+        "predicted_cluster": int(cluster) if cluster is not None else -1,
+        "confidence": float(confidence) if confidence is not None else 0.0,
+        "model_version": model_version,
+        "timestamp": timestamp or datetime.now(timezone.utc),
+        "pc1": pc1,
+        "pc2": pc2,
+    }
+    for feature, column in PREDICTION_INPUT_FEATURES.items():
+        record[column.key] = _typed(inputs.get(feature), column.type.python_type)
+    return record
+
+
+def write_predictions(records: List[Dict[str, Any]]) -> None:
+    """Insère un lot d'enregistrements en une transaction (executemany)."""
+    db = SessionLocal()
+    try:
+        db.execute(insert(Prediction), records)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class PredictionWriteBuffer:
+    """File en mémoire + thread d'écriture par lots, vidée proprement à l'arrêt."""
+
+    def __init__(self, batch_size: int = PREDICTION_LOG_BATCH, interval_ms: float = PREDICTION_LOG_INTERVAL_MS,
+                 max_queue: int = PREDICTION_LOG_MAX_QUEUE, writer=write_predictions,
+                 retries: int = PREDICTION_LOG_RETRIES, retry_backoff_ms: float = PREDICTION_LOG_RETRY_BACKOFF_MS,
+                 max_requeues: int = PREDICTION_LOG_MAX_REQUEUES):
+        self.batch_size = max(1, batch_size)
+        self.interval = interval_ms / 1000.0
+        self.max_queue = max_queue
+        self._writer = writer
+        self.retries = max(0, retries)
+        self.backoff = retry_backoff_ms / 1000.0
+        self.max_requeues = max(0, max_requeues)
+
+        self._pending: deque = deque()
+        self._oldest: Optional[float] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        # Lot remis en tête de file : (nombre d'enregistrements, remises déjà faites)
+        self._front: Optional[Tuple[int, int]] = None
+        self._retry_at: Optional[float] = None
+
+        self.written = 0
+        self.failed = 0
+        self.retried = 0
+        self.requeued = 0
+        self.batches = 0
+        self.last_batch_ms: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Journal des prédictions démarré (lot={self.batch_size}, "
+            f"intervalle={self.interval * 1000:.0f} ms, file max={self.max_queue})"
+        )
+
+    def stop(self, timeout: Optional[float] = 30.0) -> None:
+        """Arrête le thread après avoir écrit tous les enregistrements en attente."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.error(f"Journal des prédictions : {len(self._pending)} enregistrements non écrits à l'arrêt")
+        self._thread = None
+
+    def add(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Met des enregistrements en file (écriture directe si le thread ne tourne pas)."""
+        records = list(records)
+        if not records:
+            return 0
+        if not self.running:
+            self._write(records)
+            return len(records)
+        with self._cond:
+            if len(self._pending) + len(records) > self.max_queue:
+                raise PredictionLogFull(f"File de journalisation pleine ({self.max_queue})")
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.extend(records)
+            # Lot complet, ou premier en attente : le thread écrit ou arme son délai
+            self._cond.notify()
+        return len(records)
+
+    def _take_batch(self) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """
+        Attend un lot complet ou l'expiration du délai ; None quand l'arrêt est terminé.
+        Renvoie (lot, remises déjà faites) : un lot remis en tête est repris tel quel.
+        """
+        with self._cond:
+            while True:
+                if self._pending:
+                    if self._retry_at is not None and not self._stopping:
+                        remaining = self._retry_at - time.monotonic()
+                        if remaining > 0:
+                            self._cond.wait(remaining)
+                            continue
+                    if self._stopping or self._front is not None or len(self._pending) >= self.batch_size:
+                        break
+                    remaining = self._oldest + self.interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+            if self._front is not None:
+                count, requeues = self._front
+                self._front = self._retry_at = None
+            else:
+                count, requeues = min(self.batch_size, len(self._pending)), 0
+            batch = [self._pending.popleft() for _ in range(count)]
+            # Les suivants attendent au plus un intervalle à partir de maintenant
+            self._oldest = time.monotonic() if self._pending else None
+            return batch, requeues
+
+    def _run(self) -> None:
+        while True:
+            taken = self._take_batch()
+            if taken is None:
+                return
+            self._write(*taken)
+
+    def _write(self, batch: List[Dict[str, Any]], requeues: int = 0) -> None:
+        started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                self._writer(batch)
+                break
+            except Exception as e:
+                error = e
+                if attempt < self.retries:
+                    self.retried += 1
+                    logger.warning(
+                        f"Journal des prédictions : échec d'écriture de {len(batch)} enregistrements "
+                        f"(tentative {attempt + 1}/{self.retries + 1}) : {e}"
+                    )
+                    time.sleep(self.backoff * 2 ** attempt)
+        else:
+            self._give_up(batch, requeues, error)
+            return
+        self.written += len(batch)
+        self.batches += 1
+        self.last_batch_ms = (time.perf_counter() - started) * 1000.0
+
+    def _give_up(self, batch: List[Dict[str, Any]], requeues: int, error: Exception) -> None:
+        """Tentatives épuisées : remise en tête de file si possible, sinon abandon journalisé."""
+        # Seul le thread d'écriture remet en file ; pas pendant l'arrêt, pour que la vidange se termine
+        if threading.current_thread() is self._thread and requeues < self.max_requeues:
+            with self._cond:
+                if not self._stopping and len(self._pending) + len(batch) <= self.max_queue:
+                    self._pending.extendleft(reversed(batch))
+                    self._front = (len(batch), requeues + 1)
+                    self._retry_at = time.monotonic() + self.backoff * 2 ** self.retries
+                    self._oldest = time.monotonic()
+                    self.requeued += len(batch)
+                    logger.warning(
+                        f"Journal des prédictions : {len(batch)} enregistrements remis en tête de file "
+                        f"({requeues + 1}/{self.max_requeues}) : {error}"
+                    )
+                    return
+        self.failed += len(batch)
+        logger.error(f"Journal des prédictions : abandon de {len(batch)} enregistrements : {error}")
+        logger.error(f"Enregistrements abandonnés : {json.dumps(batch, default=str)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "batch_size": self.batch_size,
+            "interval_ms": self.interval * 1000.0,
+            "max_queue": self.max_queue,
+            "queue_depth": len(self._pending),
+            "written": self.written,
+            "failed": self.failed,
+            "retried": self.retried,
+            "requeued": self.requeued,
+            "batches": self.batches,
+            "mean_batch_size": round(self.written / self.batches, 1) if self.batches else None,
+            "last_batch_ms": round(self.last_batch_ms, 3) if self.last_batch_ms is not None else None,
+        }
@@ -0,0 +1,391 @@
+"""
+prediction_rollups.py
+---------------------
+Agrégats horaires et journaliers des prédictions journalisées, et rétention de la table brute.
+
+Un cycle (thread PredictionRollupWorker, toutes les PREDICTION_ROLLUP_INTERVAL s) :
+
+  1. rollup_predictions : les lignes de `predictions` au-delà du watermark
+     (RollupWatermark, dernier id agrégé) sont agrégées par lots de
+     PREDICTION_ROLLUP_BATCH ids — une requête GROUP BY (heure, cluster, dixième
+     de confiance) par lot — et ajoutées à `prediction_rollups` (upsert additif).
+     Agrégats et watermark avancent dans la même transaction : une ligne n'est
+     jamais comptée deux fois, même avec plusieurs workers uvicorn ;
+  2. prune_predictions : les lignes déjà agrégées (id < watermark) plus vieilles que
+     PREDICTION_RETENTION_DAYS sont supprimées par lots de PREDICTION_PRUNE_BATCH,
+     une courte transaction par lot : le journal des prédictions n'attend jamais
+     plus d'un lot ;
+  3. les agrégats horaires plus vieux que PREDICTION_ROLLUP_HOURLY_RETENTION_DAYS
+     sont purgés de la même façon (les journaliers sont conservés).
+
+read_timeseries sert /predictions/timeseries depuis `prediction_rollups` : le coût
+dépend du nombre de tranches demandées, pas du volume de prédictions.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, cast, delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from Api.database import SessionLocal, begin_immediate
+from Api.models import Prediction, PredictionRollup, RollupWatermark
+from Api.prediction_log import PREDICTION_INPUT_FEATURES
+
+logger = logging.getLogger(__name__)
+
+# Période du cycle agrégation + rétention (s, 0 = désactivé)
+PREDICTION_ROLLUP_INTERVAL = float(os.getenv("PREDICTION_ROLLUP_INTERVAL", "60"))
+# Prédictions agrégées par transaction
+PREDICTION_ROLLUP_BATCH = int(os.getenv("PREDICTION_ROLLUP_BATCH", "20000"))
+# Conservation des lignes brutes déjà agrégées (jours, 0 = illimitée)
+PREDICTION_RETENTION_DAYS = float(os.getenv("PREDICTION_RETENTION_DAYS", "30"))
+# Conservation des agrégats horaires (jours, 0 = illimitée)
+PREDICTION_ROLLUP_HOURLY_RETENTION_DAYS = float(os.getenv("PREDICTION_ROLLUP_HOURLY_RETENTION_DAYS", "90"))
+# Lignes supprimées par transaction, et pause entre deux lots
+PREDICTION_PRUNE_BATCH = int(os.getenv("PREDICTION_PRUNE_BATCH", "1000"))
+PREDICTION_PRUNE_PAUSE_MS = float(os.getenv("PREDICTION_PRUNE_PAUSE_MS", "20"))
+# Nombre maximal de tranches par requête /predictions/timeseries
+TIMESERIES_MAX_BUCKETS = int(os.getenv("TIMESERIES_MAX_BUCKETS", "2000"))
+
+WATERMARK = "predictions"
+GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+# Ligne portant le nombre de prédictions et la somme des confiances
+ROWS = "*"
+CONFIDENCE_BINS = 10
+
+# Colonnes numériques de predictions agrégées (somme et nombre de valeurs)
+ROLLUP_FEATURES = {
+    column.key: column
+    for column in PREDICTION_INPUT_FEATURES.values()
+    if column.type.python_type in (int, float)
+}
+
+# (granularité, tranche, cluster, métrique) → [count, total]
+Rollups = Dict[Tuple[str, datetime, int, str], List[float]]
+
+
+def _utcnow() -> datetime:
+    # SQLite ne conserve pas le fuseau : horodatages des prédictions en UTC naïf
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _bin_label(k: int) -> str:
+    return f"confidence:{k}"
+
+
+# -------------------------------------------------------------------------
+# Agrégation
+# -------------------------------------------------------------------------
+def get_watermark(db: Session) -> int:
+    return db.execute(select(RollupWatermark.last_id).where(RollupWatermark.name == WATERMARK)).scalar() or 0
+
+
+def _set_watermark(db: Session, last_id: int) -> None:
+    stmt = insert(RollupWatermark).values(name=WATERMARK, last_id=last_id, updated_at=_utcnow())
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[RollupWatermark.name],
+        set_={"last_id": stmt.excluded.last_id, "updated_at": stmt.excluded.updated_at},
+    ))
+
+
+def _batch_end(db: Session, watermark: int, batch_size: int) -> Optional[int]:
+    """Dernier id du prochain lot (au plus batch_size lignes après le watermark)."""
+    last = db.execute(
+        select(Prediction.id).where(Prediction.id > watermark)
+        .order_by(Prediction.id).offset(batch_size - 1).limit(1)
+    ).scalar()
+    if last is None:
+        last = db.execute(select(func.max(Prediction.id)).where(Prediction.id > watermark)).scalar()
+    return last
+
+
+def _aggregate_query(low: int, high: int):
+    hour = func.strftime("%Y-%m-%d %H:00:00", Prediction.timestamp).label("hour")
+    confidence = func.coalesce(Prediction.confidence, 0.0)
+    confidence_bin = func.min(func.max(cast(confidence * CONFIDENCE_BINS, Integer), 0), CONFIDENCE_BINS - 1)
+    columns = [
+        hour,
+        func.coalesce(Prediction.predicted_cluster, -1),
+        confidence_bin.label("bin"),
+        func.count(Prediction.id),
+        func.sum(confidence),
+    ]
+    for column in ROLLUP_FEATURES.values():
+        columns += [func.count(column), func.coalesce(func.sum(column), 0)]
+    return (
+        select(*columns)
+        .where(Prediction.id > low, Prediction.id <= high, Prediction.timestamp.is_not(None))
+        .group_by("hour", columns[1], "bin")
+    )
+
+
+def _collect(db: Session, low: int, high: int) -> Rollups:
+    out: Rollups = {}
+
+    def add(key, count, total):
+        cell = out.setdefault(key, [0, 0.0])
+        cell[0] += count
+        cell[1] += float(total)
+
+    for row in db.execute(_aggregate_query(low, high)):
+        hour = datetime.fromisoformat(row[0])
+        cluster, k, count, confidence_total = int(row[1]), int(row[2]), row[3], row[4]
+        for granularity, bucket in (("hour", hour), ("day", hour.replace(hour=0))):
+            add((granularity, bucket, cluster, ROWS), count, confidence_total)
+            add((granularity, bucket, cluster, _bin_label(k)), count, 0.0)
+            for i, feature in enumerate(ROLLUP_FEATURES):
+                values, total = row[5 + 2 * i], row[6 + 2 * i]
+                if values:
+                    add((granularity, bucket, cluster, feature), values, total)
+    return out
+
+
+def _apply(db: Session, rollups: Rollups) -> None:
+    if not rollups:
+        return
+    stmt = insert(PredictionRollup)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[PredictionRollup.granularity, PredictionRollup.bucket_start,
+                            PredictionRollup.predicted_cluster, PredictionRollup.metric],
+            set_={
+                "count": PredictionRollup.count + stmt.excluded.count,
+                "total": PredictionRollup.total + stmt.excluded.total,
+            },
+        ),
+        [
+            {"granularity": g, "bucket_start": b, "predicted_cluster": c, "metric": m,
+             "count": int(v[0]), "total": v[1]}
+            for (g, b, c, m), v in rollups.items()
+        ],
+    )
+
+
+def rollup_predictions(batch_size: int = PREDICTION_ROLLUP_BATCH) -> Dict[str, int]:
+    """Agrège les prédictions au-delà du watermark, un lot par transaction."""
+    rolled, batches = 0, 0
+    while True:
+        db = SessionLocal()
+        try:
+            # Verrou d'écriture avant de lire le watermark : deux workers ne partent pas du même état
+            begin_immediate(db)
+            watermark = get_watermark(db)
+            high = _batch_end(db, watermark, max(1, batch_size))
+            if high is None:
+                db.rollback()
+                return {"rolled_up": rolled, "batches": batches, "watermark": watermark}
+            _apply(db, _collect(db, watermark, high))
+            rolled += db.execute(
+                select(func.count(Prediction.id)).where(Prediction.id > watermark, Prediction.id <= high)
+            ).scalar()
+            _set_watermark(db, high)
+            db.commit()
+            batches += 1
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+# -------------------------------------------------------------------------
+# Rétention
+# -------------------------------------------------------------------------
+def _delete_in_batches(table, key, condition, batch_size: int, pause_s: float) -> int:
+    """Supprime les lignes vérifiant `condition` par lots, une courte transaction par lot."""
+    deleted = 0
+    while True:
+        db = SessionLocal()
+        try:
+            chunk = select(key).where(condition).limit(batch_size)
+            count = db.execute(
+                delete(table).where(key.in_(chunk)).execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        deleted += count
+        if count < batch_size:
+            return deleted
+        # Laisse passer les écritures du journal des prédictions entre deux lots
+        time.sleep(pause_s)
+
+
+def prune_predictions(retention_days: float = PREDICTION_RETENTION_DAYS,
+                      hourly_retention_days: float = PREDICTION_ROLLUP_HOURLY_RETENTION_DAYS,
+                      batch_size: int = PREDICTION_PRUNE_BATCH,
+                      pause_ms: float = PREDICTION_PRUNE_PAUSE_MS) -> Dict[str, int]:
+    """Purge les prédictions brutes déjà agrégées et les agrégats horaires expirés."""
+    batch_size, pause_s = max(1, batch_size), pause_ms / 1000.0
+    now = _utcnow()
+    result = {"pruned_predictions": 0, "pruned_hourly_rollups": 0}
+
+    if retention_days > 0:
+        with SessionLocal() as db:
+            watermark = get_watermark(db)
+        # id < watermark : la dernière ligne agrégée reste, les ids ne repartent pas de 1
+        result["pruned_predictions"] = _delete_in_batches(
+            Prediction, Prediction.id,
+            (Prediction.id < watermark) & (Prediction.timestamp < now - timedelta(days=retention_days)),
+            batch_size, pause_s,
+        )
+
+    if hourly_retention_days > 0:
+        cutoff = now - timedelta(days=hourly_retention_days)
+        with SessionLocal() as db:
+            expired = db.execute(
+                select(PredictionRollup.bucket_start).distinct()
+                .where(PredictionRollup.granularity == "hour", PredictionRollup.bucket_start < cutoff)
+            ).scalars().all()
+        # Clé primaire composite : suppression par tranche horaire entière
+        for bucket in expired:
+            with SessionLocal() as db:
+                result["pruned_hourly_rollups"] += db.execute(
+                    delete(PredictionRollup).where(
+                        PredictionRollup.granularity == "hour", PredictionRollup.bucket_start == bucket
+                    ).execution_options(synchronize_session=False)
+                ).rowcount
+                db.commit()
+            time.sleep(pause_s)
+    return result
+
+
+def run_rollup_cycle() -> Dict[str, Any]:
+    started = time.perf_counter()
+    result = rollup_predictions()
+    result.update(prune_predictions())
+    result["duration_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+    return result
+
+
+class PredictionRollupWorker:
+    """Thread qui exécute run_rollup_cycle toutes les `interval` secondes."""
+
+    def __init__(self, interval: float = PREDICTION_ROLLUP_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.cycles = 0
+        self.last_cycle: Optional[Dict[str, Any]] = None
+        self.last_run_at: Optional[str] = None
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="prediction-rollup", daemon=True)
+        self._thread.start()
+        logger.info(f"Agrégation des prédictions toutes les {self.interval:g} s")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+        self._thread = None
+
+    def run_once(self) -> Dict[str, Any]:
+        # Un seul cycle à la fois dans le processus (thread périodique ou déclenchement manuel)
+        with self._lock:
+            try:
+                result = run_rollup_cycle()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Agrégation des prédictions en échec : {e}")
+                raise
+            self.cycles += 1
+            self.last_cycle = result
+            self.last_run_at = datetime.now(timezone.utc).isoformat()
+            self.last_error = None
+            return result
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_s": self.interval,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "cycles": self.cycles,
+            "last_run_at": self.last_run_at,
+            "last_cycle": self.last_cycle,
+            "last_error": self.last_error,
+        }
+
+
+# -------------------------------------------------------------------------
+# Lecture
+# -------------------------------------------------------------------------
+def read_timeseries(db: Session, granularity: str, start: datetime, end: datetime,
+                    cluster: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Tranches [start, end) lues dans prediction_rollups, dans l'ordre chronologique."""
+    query = select(PredictionRollup).where(
+        PredictionRollup.granularity == granularity,
+        PredictionRollup.bucket_start >= start,
+        PredictionRollup.bucket_start < end,
+    )
+    if cluster is not None:
+        query = query.where(PredictionRollup.predicted_cluster == cluster)
+
+    buckets: Dict[datetime, Dict[str, Any]] = {}
+    for r in db.execute(query).scalars():
+        b = buckets.setdefault(r.bucket_start, {
+            "count": 0, "confidence_total": 0.0, "clusters": {},
+            "confidence_histogram": [0] * CONFIDENCE_BINS, "features": {},
+        })
+        if r.metric == ROWS:
+            b["count"] += r.count
+            b["confidence_total"] += r.total
+            b["clusters"][str(r.predicted_cluster)] = r.count
+        elif r.metric.startswith("confidence:"):
+            b["confidence_histogram"][int(r.metric.split(":", 1)[1])] += r.count
+        else:
+            cell = b["features"].setdefault(r.metric, [0, 0.0])
+            cell[0] += r.count
+            cell[1] += r.total
+
+    series = []
+    for bucket_start in sorted(buckets):
+        b = buckets[bucket_start]
+        series.append({
+            "bucket_start": bucket_start.isoformat(),
+            "count": b["count"],
+            "clusters": b["clusters"],
+            "avg_confidence": round(b["confidence_total"] / b["count"], 4) if b["count"] else None,
+            "confidence_histogram": b["confidence_histogram"],
+            "features": {
+                name: round(total / count, 4)
+                for name, (count, total) in sorted(b["features"].items()) if count
+            },
+        })
+    return series
+
+
+def _naive_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo is not None else value
+
+
+def bucket_floor(value: datetime, granularity: str) -> datetime:
+    """Début de la tranche contenant `value` (UTC naïf)."""
+    value = _naive_utc(value).replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularity == "day" else value
+
+
+def bucket_ceil(value: datetime, granularity: str) -> datetime:
+    """Première limite de tranche >= `value` (borne de fin exclue)."""
+    floor = bucket_floor(value, granularity)
+    return floor if floor == _naive_utc(value) else floor + GRANULARITIES[granularity]
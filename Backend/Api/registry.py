@@ -0,0 +1,318 @@
+"""
+registry.py
+-----------
+Registre multi-versions des artefacts ML et scoring "shadow".
+
+Plusieurs bundles (voir artifacts.py) sont gardés en mémoire sous leur identifiant
+de version :
+  - la version "live" de Data/ (rechargée à chaud par l'ArtifactManager),
+  - les versions archivées par clustering.py dans Data/versions/<version>/.
+
+Les requêtes sont servies par la version primaire. Une version shadow peut être
+scorée sur le même trafic, hors du chemin de la requête (pool de threads dédié,
+distinct du pool de scoring), pour mesurer par version le taux d'accord avec la
+primaire et l'écart de latence avant de la promouvoir.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from Api.artifacts import ArtifactBundle, ArtifactManager, load_bundle, validate_bundle
+from Api.batching import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal de versions archivées gardées en mémoire (hors version live)
+MODEL_REGISTRY_MAX = int(os.getenv("MODEL_REGISTRY_MAX", "4"))
+# Fraction des requêtes rejouées sur la version shadow
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "1.0"))
+# Nombre maximal de scorings shadow en attente (au-delà, ils sont abandonnés)
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "8"))
+# Threads du pool shadow (séparé du pool de scoring : le shadow ne retarde pas les requêtes)
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", "1"))
+
+
+# -------------------------------------------------------------------------
+# Scoreurs : même calcul que l'endpoint d'origine, avec un bundle donné
+# -------------------------------------------------------------------------
+def score_classifier(bundle: ArtifactBundle, records) -> np.ndarray:
+    """Clusters du classifieur supervisé (/predict-cluster, /predict-cluster/batch)."""
+    clusters, _ = bundle.engine.predict_matrix(bundle.engine.vectorize(records))
+    return np.asarray(clusters)
+
+
+def score_kmeans(bundle: ArtifactBundle, df) -> np.ndarray:
+    """Labels KMeans (/cluster) pour un DataFrame client déjà nettoyé."""
+    return bundle.kmeans.predict(bundle.engine.transform(df))
+
+
+SCORERS: Dict[str, Callable[[ArtifactBundle, Any], np.ndarray]] = {
+    "classifier": score_classifier,
+    "kmeans": score_kmeans,
+}
+
+
+def match_kmeans_labels(shadow: ArtifactBundle, primary: ArtifactBundle) -> Optional[np.ndarray]:
+    """
+    Table label shadow → label primaire pour comparer deux versions.
+
+    Les numéros de cluster d'un réentraînement sont arbitraires : les centroïdes sont
+    appariés par l'algorithme hongrois (distance euclidienne totale minimale). Un
+    cluster shadow sans équivalent (k différents) reçoit -1. None si les centroïdes
+    ne vivent pas dans le même espace de features.
+    """
+    shadow_centers = np.asarray(shadow.kmeans.cluster_centers_)
+    primary_centers = np.asarray(primary.kmeans.cluster_centers_)
+    if shadow_centers.shape[1] != primary_centers.shape[1]:
+        return None
+    cost = np.linalg.norm(shadow_centers[:, None, :] - primary_centers[None, :, :], axis=2)
+    rows, cols = linear_sum_assignment(cost)
+    mapping = np.full(len(shadow_centers), -1, dtype=np.int64)
+    mapping[rows] = cols
+    return mapping
+
+
+class _ShadowStats:
+    """Compteurs d'accord et de latence d'une version shadow pour un type de scoring."""
+
+    def __init__(self):
+        self.requests = 0
+        self.rows = 0
+        # Lignes effectivement comparées (aucune si les clusters ne peuvent être appariés)
+        self.compared = 0
+        self.agree = 0
+        self.errors = 0
+        self.primary_ms = 0.0
+        self.shadow_ms = 0.0
+        self.delta_ms_hist = Histogram([-50, -10, -5, -1, -0.1, 0.1, 1, 5, 10, 50])
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "rows": self.rows,
+            "agreement_rate": round(self.agree / self.compared, 6) if self.compared else None,
+            "errors": self.errors,
+            "mean_primary_ms": round(self.primary_ms / self.requests, 4) if self.requests else None,
+            "mean_shadow_ms": round(self.shadow_ms / self.requests, 4) if self.requests else None,
+            "latency_delta_ms": self.delta_ms_hist.snapshot(),
+        }
+
+
+class ModelRegistry:
+    """Versions chargées, routage primaire / shadow et statistiques de comparaison."""
+
+    def __init__(
+        self,
+        manager: ArtifactManager,
+        versions_dir: Optional[Path] = None,
+        max_versions: int = MODEL_REGISTRY_MAX,
+        sample_rate: float = SHADOW_SAMPLE_RATE,
+        max_pending: int = SHADOW_MAX_PENDING,
+    ):
+        self.manager = manager
+        self.versions_dir = Path(versions_dir) if versions_dir else manager.directory / "versions"
+        self.max_versions = max(1, max_versions)
+        self.sample_rate = sample_rate
+        self.max_pending = max_pending
+
+        self._bundles: "OrderedDict[str, ArtifactBundle]" = OrderedDict()
+        self._lock = threading.Lock()
+        # None = version live de Data/ (suit le rechargement à chaud)
+        self.primary_id: Optional[str] = None
+        self.shadow_id: Optional[str] = None
+
+        self._pending = 0
+        self.dropped = 0
+        self._stats: Dict[tuple, _ShadowStats] = {}
+        # Appariement des clusters KMeans par couple (shadow, primaire)
+        self._label_maps: Dict[tuple, Optional[np.ndarray]] = {}
+        self._pool = ThreadPoolExecutor(max_workers=max(1, SHADOW_WORKERS), thread_name_prefix="shadow")
+
+    # ------------------------------------------------------------------
+    # Versions
+    # ------------------------------------------------------------------
+    def available(self) -> List[str]:
+        """Versions archivées présentes sur disque (Data/versions/<version>/)."""
+        if not self.versions_dir.is_dir():
+            return []
+        return sorted(p.name for p in self.versions_dir.iterdir() if (p / "model_metadata.json").exists())
+
+    def load(self, version_id: str) -> ArtifactBundle:
+        """Charge et valide une version archivée (sans changer le routage)."""
+        with self._lock:
+            if version_id in self._bundles:
+                self._bundles.move_to_end(version_id)
+                return self._bundles[version_id]
+
+        directory = self.versions_dir / version_id
+        if not (directory / "model_metadata.json").exists():
+            raise KeyError(f"Version inconnue : {version_id}")
+        # L'identifiant du registre est le nom du dossier, quelle que soit la version déclarée
+        bundle = replace(load_bundle(directory), version=version_id)
+        validate_bundle(bundle)
+
+        with self._lock:
+            self._bundles[version_id] = bundle
+            self._evict()
+        logger.info(f"Version {version_id} chargée dans le registre")
+        return bundle
+
+    def _evict(self) -> None:
+        """Libère les versions les plus anciennes non utilisées au-delà de max_versions."""
+        for version_id in list(self._bundles):
+            if len(self._bundles) <= self.max_versions:
+                break
+            if version_id not in (self.primary_id, self.shadow_id):
+                del self._bundles[version_id]
+                logger.info(f"Version {version_id} déchargée du registre")
+
+    def unload(self, version_id: str) -> None:
+        with self._lock:
+            if version_id in (self.primary_id, self.shadow_id):
+                raise ValueError(f"La version {version_id} est en service (primaire ou shadow)")
+            self._bundles.pop(version_id, None)
+
+    def get(self, version_id: Optional[str]) -> Optional[ArtifactBundle]:
+        live = self.manager.current
+        if version_id is None or (live is not None and live.version == version_id):
+            return live
+        return self._bundles.get(version_id)
+
+    # ------------------------------------------------------------------
+    # Routage
+    # ------------------------------------------------------------------
+    def primary(self) -> Optional[ArtifactBundle]:
+        """Bundle qui sert les requêtes (à récupérer une seule fois par requête)."""
+        return self.get(self.primary_id)
+
+    def shadow(self) -> Optional[ArtifactBundle]:
+        return self.get(self.shadow_id) if self.shadow_id else None
+
+    def set_primary(self, version_id: Optional[str]) -> ArtifactBundle:
+        """Route le trafic vers une version (None = version live de Data/)."""
+        bundle = self.manager.current if version_id is None else self.get(version_id) or self.load(version_id)
+        self.primary_id = None if version_id is None or bundle is self.manager.current else version_id
+        if self.shadow_id is not None and self.shadow() is bundle:
+            self.shadow_id = None
+        logger.info(f"Version primaire : {bundle.version}")
+        return bundle
+
+    def set_shadow(self, version_id: Optional[str]) -> Optional[ArtifactBundle]:
+        """Active (ou désactive avec None) le scoring shadow d'une version."""
+        if version_id is None:
+            self.shadow_id = None
+            return None
+        bundle = self.get(version_id) or self.load(version_id)
+        self.shadow_id = version_id
+        logger.info(f"Version shadow : {bundle.version}")
+        return bundle
+
+    # ------------------------------------------------------------------
+    # Scoring shadow
+    # ------------------------------------------------------------------
+    def wants_shadow(self) -> bool:
+        """True si la requête courante doit être rejouée sur la version shadow."""
+        if self.shadow_id is None:
+            return False
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            if self._pending >= self.max_pending:
+                # On protège la latence de production : le shadow est abandonné
+                self.dropped += 1
+                return False
+            self._pending += 1
+        return True
+
+    def submit_shadow(self, kind: str, payload: Any, primary_labels, primary_version: str, primary_ms: float) -> None:
+        """Planifie run_shadow dans le pool shadow (après un wants_shadow() positif)."""
+        try:
+            self._pool.submit(self.run_shadow, kind, payload, primary_labels, primary_version, primary_ms)
+        except RuntimeError:
+            # Pool arrêté (extinction en cours)
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _comparable_labels(self, kind: str, labels, bundle: ArtifactBundle, primary_version: str) -> Optional[np.ndarray]:
+        """
+        Labels shadow exprimés dans la numérotation primaire, ou None si non comparables.
+
+        Vaut pour les deux scoreurs : le classifieur d'une version prédit les labels du
+        KMeans de cette même version.
+        """
+        labels = np.asarray(labels)
+        key = (bundle.version, primary_version)
+        if key not in self._label_maps:
+            primary = self.get(primary_version)
+            self._label_maps[key] = match_kmeans_labels(bundle, primary) if primary is not None else None
+        mapping = self._label_maps[key]
+        return mapping[labels] if mapping is not None else None
+
+    def run_shadow(self, kind: str, payload: Any, primary_labels, primary_version: str, primary_ms: float) -> None:
+        """Score `payload` avec la version shadow et compare aux labels primaires (exécuté dans le pool)."""
+        try:
+            bundle = self.shadow()
+            if bundle is None or bundle.version == primary_version:
+                return
+            stats = self._stats.setdefault((bundle.version, primary_version, kind), _ShadowStats())
+            try:
+                started = time.perf_counter()
+                labels = SCORERS[kind](bundle, payload)
+                shadow_ms = (time.perf_counter() - started) * 1000.0
+            except Exception as e:
+                logger.error(f"Erreur de scoring shadow ({bundle.version}) : {e}")
+                with self._lock:
+                    stats.errors += 1
+                return
+
+            comparable = self._comparable_labels(kind, labels, bundle, primary_version)
+            agree = int(np.sum(comparable == np.asarray(primary_labels))) if comparable is not None else 0
+            with self._lock:
+                stats.requests += 1
+                stats.rows += len(labels)
+                stats.compared += len(labels) if comparable is not None else 0
+                stats.agree += agree
+                stats.primary_ms += primary_ms
+                stats.shadow_ms += shadow_ms
+                stats.delta_ms_hist.observe(shadow_ms - primary_ms)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    # ------------------------------------------------------------------
+    # Introspection
+    # ------------------------------------------------------------------
+    def shadow_stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"shadow_version": shadow, "primary_version": primary, "kind": kind, **stats.snapshot()}
+                for (shadow, primary, kind), stats in self._stats.items()
+            ]
+
+    def describe(self) -> Dict[str, Any]:
+        primary = self.primary()
+        live = self.manager.current
+        return {
+            "live_version": live.version if live else None,
+            "primary_version": primary.version if primary else None,
+            "shadow_version": self.shadow_id,
+            "loaded_versions": list(self._bundles),
+            "available_versions": self.available(),
+            "shadow_sample_rate": self.sample_rate,
+            "shadow_pending": self._pending,
+            "shadow_dropped": self.dropped,
+        }
@@ -0,0 +1,249 @@
+"""
+segments.py
+-----------
+Statistiques par segment matérialisées (table `segment_aggregates`, endpoint /segments/stats).
+
+Pour chaque cluster K-Means et chaque colonne monétaire ou comportementale de
+client_data, la table conserve le nombre de valeurs, leur somme et la somme de
+leurs carrés : moyenne et variance s'en déduisent sans relire les clients.
+
+La table est tenue à jour par deltas, dans la transaction qui modifie les clients :
+
+  - track_reassignment(db, ids) : autour d'une mise à jour de cluster_kmeans
+    (/cluster?save_to_db=true, /cluster/stream, jobs de scoring) — contributions
+    des clients concernés retirées de l'ancien segment, ajoutées au nouveau ;
+  - record_new_clients(db, ids) : clients insérés (ingestion), segment -1 ;
+  - rebuild_segment_aggregates(db) : recalcul complet (force_update_db.py,
+    vérification via /segments/stats?rebuild=true).
+
+Le coût d'un delta est proportionnel au nombre de clients modifiés ; la lecture des
+statistiques est en O(k) quelle que soit la taille de client_data.
+"""
+
+import math
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+# Import relatif : le module est chargé sous Api.* (API) comme sous Backend.Api.* (scripts)
+from .database import begin_immediate
+from .models import ClientData, SegmentAggregate
+
+# Segment des clients sans cluster_kmeans
+UNASSIGNED = -1
+# Ligne portant l'effectif du segment
+ROWS = "*"
+# Clients par requête IN (...) (limite de variables SQLite)
+_ID_CHUNK = 10000
+# Suite d'ids consécutifs au-delà de laquelle un BETWEEN remplace la liste IN (...)
+_MIN_RUN = 64
+
+# Colonnes monétaires et comportementales agrégées
+SEGMENT_FEATURES = {
+    "income": ClientData.income,
+    "recency": ClientData.recency,
+    "mnt_wines": ClientData.mnt_wines,
+    "mnt_fruits": ClientData.mnt_fruits,
+    "mnt_meat": ClientData.mnt_meat,
+    "mnt_fish": ClientData.mnt_fish,
+    "mnt_sweets": ClientData.mnt_sweets,
+    "mnt_gold": ClientData.mnt_gold,
+    "num_deals": ClientData.num_deals,
+    "num_web": ClientData.num_web,
+    "num_catalog": ClientData.num_catalog,
+    "num_store": ClientData.num_store,
+    "num_web_visits": ClientData.num_web_visits,
+}
+
+# (cluster, feature) → [count, total, total_sq]
+Contributions = Dict[Tuple[int, str], List[float]]
+
+
+# -------------------------------------------------------------------------
+# Contributions des clients
+# -------------------------------------------------------------------------
+def _aggregate_query():
+    columns = [
+        func.coalesce(ClientData.cluster_kmeans, UNASSIGNED).label("cluster"),
+        func.count(ClientData.id),
+    ]
+    for column in SEGMENT_FEATURES.values():
+        columns += [
+            func.count(column),
+            func.coalesce(func.sum(column), 0),
+            func.coalesce(func.sum(column * column), 0),
+        ]
+    return select(*columns).group_by("cluster")
+
+
+def _collect(db: Session, query, out: Contributions) -> Contributions:
+    for row in db.execute(query):
+        cluster = int(row[0])
+        cell = out.setdefault((cluster, ROWS), [0, 0.0, 0.0])
+        cell[0] += row[1]
+        for i, feature in enumerate(SEGMENT_FEATURES):
+            count, total, total_sq = row[2 + 3 * i: 5 + 3 * i]
+            cell = out.setdefault((cluster, feature), [0, 0.0, 0.0])
+            cell[0] += count
+            cell[1] += float(total)
+            cell[2] += float(total_sq)
+    return out
+
+
+def _id_filters(ids: Sequence[int]) -> Iterator[Any]:
+    """Filtres couvrant `ids` (triés, uniques) : BETWEEN par suite consécutive, IN pour le reste."""
+    if isinstance(ids, range) and ids.step == 1:
+        if ids:
+            yield ClientData.id.between(ids.start, ids.stop - 1)
+        return
+    scattered: List[int] = []
+    start = 0
+    for i in range(1, len(ids) + 1):
+        if i < len(ids) and ids[i] == ids[i - 1] + 1:
+            continue
+        if i - start >= _MIN_RUN:
+            yield ClientData.id.between(ids[start], ids[i - 1])
+        else:
+            scattered.extend(ids[start:i])
+        start = i
+    for k in range(0, len(scattered), _ID_CHUNK):
+        yield ClientData.id.in_(scattered[k:k + _ID_CHUNK])
+
+
+def contributions(db: Session, ids: Sequence[int]) -> Contributions:
+    """Agrégats des clients `ids` (triés, uniques), groupés par leur cluster_kmeans actuel."""
+    out: Contributions = {}
+    for condition in _id_filters(ids):
+        _collect(db, _aggregate_query().where(condition), out)
+    return out
+
+
+def _apply(db: Session, after: Contributions, before: Contributions) -> None:
+    """Ajoute (after - before) aux agrégats stockés (upsert, cellules inchangées ignorées)."""
+    rows = []
+    for key in set(after) | set(before):
+        new = after.get(key, (0, 0.0, 0.0))
+        old = before.get(key, (0, 0.0, 0.0))
+        delta = [n - o for n, o in zip(new, old)]
+        if any(delta):
+            rows.append({"cluster": key[0], "feature": key[1], "count": int(delta[0]),
+                         "total": delta[1], "total_sq": delta[2]})
+    if not rows:
+        return
+    stmt = insert(SegmentAggregate)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[SegmentAggregate.cluster, SegmentAggregate.feature],
+            set_={
+                "count": SegmentAggregate.count + stmt.excluded.count,
+                "total": SegmentAggregate.total + stmt.excluded.total,
+                "total_sq": SegmentAggregate.total_sq + stmt.excluded.total_sq,
+            },
+        ),
+        rows,
+    )
+    # Cellule vidée : supprimée plutôt que laissée avec un résidu d'arrondi
+    db.execute(delete(SegmentAggregate).where(SegmentAggregate.count == 0))
+
+
+# -------------------------------------------------------------------------
+# Mises à jour incrémentales
+# -------------------------------------------------------------------------
+@contextmanager
+def track_reassignment(db: Session, ids: Iterable[Any]) -> Iterator[None]:
+    """
+    Encadre une mise à jour de cluster_kmeans des clients `ids` et reporte le delta.
+
+    Les deux lectures et l'upsert se font dans la transaction de l'appelant, qui
+    valide le tout. Le verrou d'écriture est pris avant la première lecture : deux
+    réaffectations concurrentes des mêmes clients ne partent pas du même état.
+    """
+    ids = sorted({int(i) for i in ids})
+    begin_immediate(db)
+    before = contributions(db, ids)
+    yield
+    db.flush()
+    _apply(db, contributions(db, ids), before)
+
+
+def record_new_clients(db: Session, ids: Iterable[Any]) -> None:
+    """Ajoute aux agrégats des clients qui viennent d'être insérés (flush fait ; `ids` peut être un range)."""
+    ids = ids if isinstance(ids, range) and ids.step == 1 else sorted({int(i) for i in ids})
+    _apply(db, contributions(db, ids), {})
+
+
+def _stored(db: Session) -> Contributions:
+    return {
+        (a.cluster, a.feature): [a.count, a.total, a.total_sq]
+        for a in db.execute(select(SegmentAggregate)).scalars()
+    }
+
+
+def _same(a: List[float], b: List[float]) -> bool:
+    return a[0] == b[0] and all(math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-6) for x, y in zip(a[1:], b[1:]))
+
+
+def rebuild_segment_aggregates(db: Session) -> int:
+    """
+    Recalcul complet depuis client_data (sans commit).
+    Retourne le nombre de cellules qui différaient des agrégats stockés (dérive).
+    """
+    previous = _stored(db)
+    rebuilt = {key: v for key, v in _collect(db, _aggregate_query(), {}).items() if v[0]}
+    db.execute(delete(SegmentAggregate))
+    if rebuilt:
+        db.execute(insert(SegmentAggregate), [
+            {"cluster": c, "feature": f, "count": int(v[0]), "total": v[1], "total_sq": v[2]}
+            for (c, f), v in rebuilt.items()
+        ])
+    zero = [0, 0.0, 0.0]
+    return sum(
+        not _same(previous.get(key, zero), rebuilt.get(key, zero))
+        for key in set(previous) | set(rebuilt)
+    )
+
+
+def ensure_segment_aggregates(db: Session) -> bool:
+    """Construit les agrégats s'ils sont absents (base existante) ; True si reconstruits."""
+    if db.execute(select(SegmentAggregate.cluster).limit(1)).first() is not None:
+        return False
+    if db.execute(select(ClientData.id).limit(1)).first() is None:
+        return False
+    rebuild_segment_aggregates(db)
+    db.commit()
+    return True
+
+
+# -------------------------------------------------------------------------
+# Lecture
+# -------------------------------------------------------------------------
+def _moments(count: int, total: float, total_sq: float) -> Dict[str, Any]:
+    if count <= 0:
+        return {"count": 0, "mean": None, "variance": None}
+    mean = total / count
+    # Variance d'échantillon (ddof=1, comme pandas) ; bornée à 0 (arrondis des deltas)
+    variance = max(total_sq - count * mean * mean, 0.0) / (count - 1) if count > 1 else 0.0
+    return {"count": int(count), "mean": round(mean, 4), "variance": round(variance, 4)}
+
+
+def read_segment_stats(db: Session) -> List[Dict[str, Any]]:
+    """Statistiques par segment lues dans segment_aggregates (O(k), k = nombre de segments)."""
+    stored = _stored(db)
+    clusters = sorted({c for c, f in stored if f == ROWS and stored[(c, f)][0] > 0})
+    result = []
+    for cluster in clusters:
+        features = {
+            feature: _moments(*stored.get((cluster, feature), (0, 0.0, 0.0)))
+            for feature in SEGMENT_FEATURES
+        }
+        income = features["income"]["mean"]
+        result.append({
+            "cluster": cluster,
+            "count": int(stored[(cluster, ROWS)][0]),
+            "avg_income": round(income, 2) if income else 0,
+            "features": features,
+        })
+    return result
@@ -0,0 +1,133 @@
+"""
+serialization.py
+----------------
+Négociation de contenu pour les réponses tabulaires (/pca, /apply-pca, /cluster).
+
+JSON reste le format par défaut. Un client peut demander via l'en-tête Accept
+un corps binaire colonne par colonne, beaucoup moins coûteux à produire et à
+parser qu'une liste de dictionnaires :
+
+  - application/vnd.apache.arrow.stream : flux Arrow IPC (pyarrow, optionnel)
+  - application/msgpack                 : {"meta": ..., "columns": {nom: {dtype, shape, data}}} (msgpack, optionnel)
+  - application/x-npy                   : tableau NumPy structuré au format .npy (toujours disponible)
+
+Pour les formats binaires, les métadonnées de la réponse (status, total,
+next_cursor...) sont transmises en JSON dans l'en-tête X-Response-Meta.
+"""
+
+import io
+import json
+import logging
+from typing import Any, Dict, Optional
+
+import numpy as np
+from fastapi import Request
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    pa = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    msgpack = None
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/msgpack"
+NPY = "application/x-npy"
+JSON = "application/json"
+
+META_HEADER = "X-Response-Meta"
+
+_ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    "application/octet-stream+npy": NPY,
+}
+
+
+def available_formats() -> Dict[str, bool]:
+    """Formats binaires utilisables dans cet environnement."""
+    return {ARROW_STREAM: pa is not None, MSGPACK: msgpack is not None, NPY: True}
+
+
+def negotiate(request: Request) -> str:
+    """
+    Choisit le format de réponse à partir de l'en-tête Accept (ordre + q-values).
+    Retourne JSON si aucun format binaire disponible n'est demandé.
+    """
+    accept = request.headers.get("accept", "")
+    available = available_formats()
+    candidates = []
+    for position, part in enumerate(accept.split(",")):
+        fields = [f.strip() for f in part.split(";")]
+        media = _ALIASES.get(fields[0].lower(), fields[0].lower())
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0 and (media == JSON or available.get(media)):
+            candidates.append((-q, position, media))
+    if not candidates:
+        return JSON
+    return min(candidates)[2]
+
+
+def _to_structured(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Assemble des colonnes de même longueur en un tableau NumPy structuré."""
+    arrays = {name: np.asarray(col) for name, col in columns.items()}
+    n = len(next(iter(arrays.values()))) if arrays else 0
+    dtype = [(name, arr.dtype if arr.dtype != object else "U64") for name, arr in arrays.items()]
+    out = np.empty(n, dtype=dtype)
+    for name, arr in arrays.items():
+        out[name] = arr
+    return out
+
+
+def encode_columns(columns: Dict[str, np.ndarray], media_type: str, meta: Dict[str, Any]) -> bytes:
+    """Sérialise des colonnes dans le format binaire demandé."""
+    if media_type == ARROW_STREAM:
+        table = pa.table({name: np.asarray(col) for name, col in columns.items()})
+        table = table.replace_schema_metadata({"meta": json.dumps(meta)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    if media_type == MSGPACK:
+        packed = {}
+        for name, col in columns.items():
+            arr = np.asarray(col)
+            if arr.dtype == object or arr.dtype.kind == "U":
+                packed[name] = {"dtype": "str", "shape": list(arr.shape), "data": arr.tolist()}
+            else:
+                arr = np.ascontiguousarray(arr)
+                packed[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "data": arr.tobytes()}
+        return msgpack.packb({"meta": meta, "columns": packed}, use_bin_type=True)
+
+    if media_type == NPY:
+        buffer = io.BytesIO()
+        np.save(buffer, _to_structured(columns), allow_pickle=False)
+        return buffer.getvalue()
+
+    raise ValueError(f"Format non supporté : {media_type}")
+
+
+def columnar_response(
+    columns: Dict[str, np.ndarray], media_type: str, meta: Optional[Dict[str, Any]] = None
+) -> Response:
+    """Réponse HTTP binaire colonne par colonne (format déjà négocié, différent de JSON)."""
+    meta = meta or {}
+    body = encode_columns(columns, media_type, meta)
+    return Response(
+        content=body,
+        media_type=media_type,
+        headers={META_HEADER: json.dumps(meta, ensure_ascii=True), "Vary": "Accept"},
+    )
@@ -0,0 +1,170 @@
+"""
+streaming.py
+------------
+Lecture incrémentale des gros lots de clients (endpoints /cluster/stream, /score/stream).
+
+Le corps de la requête est lu par morceaux depuis la socket et découpé en
+enregistrements au fil de l'eau, sans jamais matérialiser le corps complet :
+
+  - NDJSON (`Content-Type: application/x-ndjson`) : un client JSON par ligne ;
+  - tableau JSON `[{...}, {...}]` ou `{"clients": [{...}, ...]}` : les objets du
+    tableau sont décodés un par un (json.JSONDecoder.raw_decode).
+
+Les enregistrements sont regroupés en lots de STREAM_CHUNK_SIZE clients : la
+mémoire de pointe est bornée par la taille d'un lot, pas par celle de la requête.
+"""
+
+import codecs
+import json
+import os
+import re
+from typing import Any, AsyncIterator, Dict, List
+
+from starlette.responses import StreamingResponse
+
+# Nombre de clients validés et scorés ensemble
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "5000"))
+# Taille maximale d'un enregistrement (protège contre un objet non terminé)
+STREAM_MAX_RECORD_BYTES = int(os.getenv("STREAM_MAX_RECORD_BYTES", str(1 << 20)))
+
+NDJSON = "application/x-ndjson"
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[\s,]*")
+_CLIENTS_PREFIX = re.compile(r'\s*\{\s*"clients"\s*:\s*\[')
+_ARRAY_PREFIX = re.compile(r"\s*\[")
+
+
+class StreamParseError(ValueError):
+    """Corps de requête illisible (JSON invalide, enregistrement trop long...)."""
+
+
+def is_ndjson(content_type: str) -> bool:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return media_type in (NDJSON, "application/ndjson", "application/jsonl")
+
+
+async def _iter_text(byte_chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Décodage UTF-8 incrémental (un caractère peut être coupé entre deux morceaux)."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in byte_chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _as_record(obj: Any, index: int) -> Dict[str, Any]:
+    if not isinstance(obj, dict):
+        raise StreamParseError(f"Enregistrement {index} : objet JSON attendu")
+    return obj
+
+
+async def _iter_ndjson(text_chunks: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+    buffer = ""
+    index = 0
+    async for text in text_chunks:
+        buffer += text
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                try:
+                    yield _as_record(json.loads(line), index)
+                except json.JSONDecodeError as e:
+                    raise StreamParseError(f"Ligne {index + 1} : JSON invalide ({e.msg})")
+                index += 1
+        if len(buffer) > STREAM_MAX_RECORD_BYTES:
+            raise StreamParseError(f"Ligne {index + 1} : enregistrement trop long")
+    if buffer.strip():
+        try:
+            yield _as_record(json.loads(buffer), index)
+        except json.JSONDecodeError as e:
+            raise StreamParseError(f"Ligne {index + 1} : JSON invalide ({e.msg})")
+
+
+async def _iter_json_array(text_chunks: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+    buffer = ""
+    pos = 0
+    started = False
+    done = False
+    index = 0
+    async for text in text_chunks:
+        if done:
+            continue
+        # Compactage : on ne garde que la partie non encore décodée
+        buffer = buffer[pos:] + text
+        pos = 0
+
+        if not started:
+            match = _CLIENTS_PREFIX.match(buffer) or _ARRAY_PREFIX.match(buffer)
+            if match is None:
+                if len(buffer) > 64 or buffer.lstrip()[:1] not in ("", "{", "["):
+                    raise StreamParseError('Tableau JSON ou {"clients": [...]} attendu')
+                continue
+            pos = match.end()
+            started = True
+
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == "]":
+                done = True
+                break
+            try:
+                obj, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Objet incomplet : on attend le morceau suivant
+                if len(buffer) - pos > STREAM_MAX_RECORD_BYTES:
+                    raise StreamParseError(f"Enregistrement {index} : JSON invalide ou trop long")
+                break
+            yield _as_record(obj, index)
+            index += 1
+            pos = end
+
+    if not started:
+        raise StreamParseError('Tableau JSON ou {"clients": [...]} attendu')
+    if not done:
+        raise StreamParseError("Corps JSON tronqué (']' final manquant)")
+
+
+async def iter_records(byte_chunks: AsyncIterator[bytes], ndjson: bool) -> AsyncIterator[Dict[str, Any]]:
+    """Enregistrements clients du corps de requête, décodés au fil de la lecture."""
+    text_chunks = _iter_text(byte_chunks)
+    parser = _iter_ndjson if ndjson else _iter_json_array
+    async for record in parser(text_chunks):
+        yield record
+
+
+async def iter_batches(records: AsyncIterator[Dict[str, Any]], size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Regroupe les enregistrements en lots de `size` clients."""
+    batch: List[Dict[str, Any]] = []
+    async for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse dont le générateur lit encore le corps de la requête.
+
+    Avant la spec ASGI 2.4 (uvicorn annonce 2.3), Starlette écoute la déconnexion en
+    appelant receive() en parallèle du générateur : les morceaux du corps seraient
+    consommés par cet écouteur. Ici, seul le générateur lit receive() ; une déconnexion
+    du client interrompt request.stream() (ClientDisconnect).
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def ndjson_line(obj: Dict[str, Any]) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
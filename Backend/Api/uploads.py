@@ -0,0 +1,169 @@
+"""
+uploads.py
+----------
+Lecture et écriture par morceaux des fichiers clients importés (endpoint /score/file).
+
+  - Entrée : CSV (séparateur `;` par défaut, comme Data/marketing_campaign_clean.csv)
+    ou Parquet, lus par blocs de UPLOAD_CHUNK_SIZE lignes. Les colonnes CSV sont lues
+    en texte (restituées à l'identique), les features sont converties avec des types
+    explicites (FEATURE_DTYPES).
+  - Sortie : le même fichier, colonnes ajoutées, produit bloc par bloc (CSV ou Parquet
+    écrit groupe de lignes par groupe de lignes).
+
+La mémoire utilisée dépend de UPLOAD_CHUNK_SIZE, pas de la taille du fichier.
+"""
+
+import io
+import os
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet optionnel
+    pa = None
+    pq = None
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", "20000"))
+
+CSV = "csv"
+PARQUET = "parquet"
+MEDIA_TYPES = {CSV: "text/csv", PARQUET: "application/vnd.apache.parquet"}
+
+# Types des colonnes utilisées pour le scoring (export brut ou colonnes déjà dérivées)
+FEATURE_DTYPES: Dict[str, str] = {
+    "Year_Birth": "float64",
+    "Age": "float64",
+    "Customer_Seniority": "float64",
+    "Income": "float64",
+    "Kidhome": "float64",
+    "Teenhome": "float64",
+    "Recency": "float64",
+    "MntWines": "float64",
+    "MntFruits": "float64",
+    "MntMeatProducts": "float64",
+    "MntFishProducts": "float64",
+    "MntSweetProducts": "float64",
+    "MntGoldProds": "float64",
+    "NumDealsPurchases": "float64",
+    "NumWebPurchases": "float64",
+    "NumCatalogPurchases": "float64",
+    "NumStorePurchases": "float64",
+    "NumWebVisitsMonth": "float64",
+    "Education": "object",
+    "Marital_Status": "object",
+    "Dt_Customer": "object",
+}
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    """Format d'un fichier importé d'après son extension ou son type MIME."""
+    name = (filename or "").lower()
+    if name.endswith((".parquet", ".pq")) or "parquet" in (content_type or ""):
+        return PARQUET
+    return CSV
+
+
+# -------------------------------------------------------------------------
+# Lecture
+# -------------------------------------------------------------------------
+def iter_chunks(file: BinaryIO, fmt: str, sep: str = ";", chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Blocs de lignes du fichier (colonnes d'origine, non converties)."""
+    if fmt == PARQUET:
+        if pq is None:
+            raise RuntimeError("pyarrow n'est pas installé : import Parquet indisponible")
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+        return
+
+    # Texte brut : les colonnes hors features sont restituées sans reformatage
+    reader = pd.read_csv(file, sep=sep, dtype=str, keep_default_na=False, chunksize=chunk_size)
+    with reader:
+        for chunk in reader:
+            yield chunk
+
+
+def feature_frame(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Colonnes utiles au scoring converties aux types de FEATURE_DTYPES (valeur invalide → NaN)."""
+    out = {}
+    for col, dtype in FEATURE_DTYPES.items():
+        if col not in chunk.columns:
+            continue
+        values = chunk[col]
+        if dtype == "float64":
+            out[col] = pd.to_numeric(values.replace("", np.nan), errors="coerce").astype("float64")
+        else:
+            values = values.astype(object)
+            out[col] = values.where(values.notna() & (values != ""), None)
+    return pd.DataFrame(out, index=chunk.index)
+
+
+# -------------------------------------------------------------------------
+# Écriture
+# -------------------------------------------------------------------------
+class _DrainableSink(io.RawIOBase):
+    """Fichier en écriture seule dont on récupère les octets au fil de l'eau."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+
+class ChunkWriter:
+    """Sérialise des blocs successifs en un seul fichier CSV ou Parquet, bloc par bloc."""
+
+    def __init__(self, fmt: str, sep: str = ";"):
+        if fmt == PARQUET and pq is None:
+            raise RuntimeError("pyarrow n'est pas installé : export Parquet indisponible")
+        self.fmt = fmt
+        self.sep = sep
+        self._header = True
+        self._sink: Optional[_DrainableSink] = None
+        self._writer: Any = None
+
+    def write(self, chunk: pd.DataFrame) -> bytes:
+        if self.fmt == CSV:
+            data = chunk.to_csv(index=False, sep=self.sep, header=self._header).encode("utf-8")
+            self._header = False
+            return data
+
+        if self._writer is None:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            self._sink = _DrainableSink()
+            self._writer = pq.ParquetWriter(self._sink, table.schema)
+        else:
+            # Schéma figé par le premier bloc (colonnes entièrement vides comprises)
+            table = pa.Table.from_pandas(chunk, schema=self._writer.schema, preserve_index=False)
+        self._writer.write_table(table)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        if self._writer is None:
+            return b""
+        self._writer.close()
+        return self._sink.drain()
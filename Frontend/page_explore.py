@@ -4,7 +4,7 @@ import pandas as pd
 import plotly.express as px
 import requests
 import os
-from utils import load_all_artifacts
+from utils import load_all_artifacts, decode_api_response, preferred_accept
 
 # ==================================================================
 # CONFIGURATION GÉNÉRALE
@@ -63,13 +63,46 @@ def load_local_artifacts():
     return df
 
 def load_api_data(api_url):
-    resp = requests.get(f"{api_url.rstrip('/')}/pca", params={"limit": 3000}, timeout=20)
+    # Échantillon représentatif (stratifié par cluster) plutôt que les 3000 premières lignes
+    params = {"limit": 3000, "sample": True, "seed": 42}
+    # Corps binaire colonne par colonne (Arrow / .npy) si disponible, JSON sinon
+    resp = requests.get(f"{api_url.rstrip('/')}/pca", params=params,
+                        headers={"Accept": preferred_accept()}, timeout=20)
     resp.raise_for_status()
-    data = resp.json()["data"]
-    df = pd.DataFrame(data)
+    df, _ = decode_api_response(resp)
     df["Segment"] = df["cluster"].map(LABEL_MAP)
     return df
 
+def load_api_viewport(api_url, xmin, xmax, ymin, ymax, limit=3000):
+    """Points de la zone zoomée uniquement (index spatial côté API)."""
+    params = {"xmin": xmin, "xmax": xmax, "ymin": ymin, "ymax": ymax, "limit": limit, "seed": 42}
+    resp = requests.get(f"{api_url.rstrip('/')}/pca/viewport", params=params,
+                        headers={"Accept": preferred_accept()}, timeout=20)
+    resp.raise_for_status()
+    df, _ = decode_api_response(resp)
+    if not df.empty:
+        df["Segment"] = df["cluster"].map(LABEL_MAP)
+    return df
+
+def load_api_density(api_url, shape="hex", resolution=48):
+    """Nuage agrégé côté serveur : une ligne par cellule, cluster dominant et effectif."""
+    params = {"shape": shape, "resolution": resolution}
+    resp = requests.get(f"{api_url.rstrip('/')}/pca/density", params=params, timeout=20)
+    resp.raise_for_status()
+    cells = resp.json()["data"]["cells"]
+    df = pd.DataFrame({"PC1": cells["x"], "PC2": cells["y"], "count": cells["count"]})
+    by_cluster = pd.DataFrame(cells["by_cluster"])
+    if not df.empty and not by_cluster.empty:
+        df["cluster"] = by_cluster.idxmax(axis=1).astype(int)
+        df["Segment"] = df["cluster"].map(LABEL_MAP)
+    return df
+
+def display_density(df):
+    fig = px.scatter(df, x="PC1", y="PC2", size="count", color="Segment", color_discrete_map=COLOR_MAP,
+                     hover_data={"count": True}, size_max=18, opacity=0.8,
+                     title="Densité des segments (agrégation serveur, segment dominant par cellule)")
+    st.plotly_chart(fig, use_container_width=True)
+
 @st.cache_data(show_spinner=False)
 def load_uploaded_file(file):
     if file.name.endswith('.csv'):
@@ -137,10 +170,32 @@ def mode_segmentation():
         if "seg_df" in st.session_state:
             df = st.session_state.seg_df
 
+            # Zoom : on ne recharge que les points de la zone choisie
+            with st.expander("Zoom sur une zone du nuage PCA"):
+                x_lo, x_hi = float(df["PC1"].min()), float(df["PC1"].max())
+                y_lo, y_hi = float(df["PC2"].min()), float(df["PC2"].max())
+                x_range = st.slider("Plage PC1", x_lo, x_hi, (x_lo, x_hi), key="zoom_pc1")
+                y_range = st.slider("Plage PC2", y_lo, y_hi, (y_lo, y_hi), key="zoom_pc2")
+                if st.button("Charger la zone", key="zoom_load"):
+                    try:
+                        zoom_df = load_api_viewport(api_url, x_range[0], x_range[1], y_range[0], y_range[1])
+                        if zoom_df.empty:
+                            st.info("Aucun client dans cette zone")
+                        else:
+                            st.success(f"{len(zoom_df):,} clients dans la zone")
+                            df = zoom_df
+                    except Exception as e:
+                        st.error(f"Erreur API : {e}")
+
     if df is not None:
         tab1, tab2, tab3 = st.tabs(["Nuage PCA", "Répartition", "Profils moyens"])
         with tab1:
             display_pca(df)
+            if submode == "API FastAPI" and st.checkbox("Afficher la densité agrégée (gros volumes)", key="seg_density"):
+                try:
+                    display_density(load_api_density(api_url))
+                except Exception as e:
+                    st.error(f"Erreur API : {e}")
         with tab2:
             display_segment_distribution(df)
         with tab3:
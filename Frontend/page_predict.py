@@ -193,14 +193,17 @@ if submitted:
         confidence = None
 
         # === PRÉDICTION API ===
+        # log=true : la prédiction est journalisée côté serveur dans la même requête
+        logged = None
         if mode == "API FastAPI (recommandé)":
             try:
                 endpoint = f"{api_url.rstrip('/')}/predict-cluster"
-                r = requests.post(endpoint, json=payload, timeout=15)
+                r = requests.post(endpoint, json=payload, params={"log": "true"}, timeout=15)
                 r.raise_for_status()
                 result = r.json()
                 predicted_cluster = result.get("predicted_cluster") or result.get("cluster")
                 confidence = result.get("confidence", result.get("probability", 0.95))
+                logged = result.get("logged")
             except Exception as e:
                 st.error(f"Erreur API : {e}")
                 if 'r' in locals():
@@ -208,34 +211,39 @@ if submitted:
                 st.stop()
 
         # === ENREGISTREMENT ===
-        try:
-            from datetime import datetime, timezone
-            
-            save_endpoint = f"{api_url.rstrip('/')}/save-prediction"
-            save_payload = {
-                "payload": payload,
-                "predicted_cluster": int(predicted_cluster) if predicted_cluster is not None else -1,
-                "confidence": float(confidence) if confidence is not None else 0.0,
-                # Correction ici : Utilisation de timezone.utc
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "pc1": None,
-                "pc2": None
-            }
-            
-            req = requests.post(save_endpoint, json=save_payload, timeout=10)
-            req.raise_for_status()
-            resp = req.json()
-
-            if resp.get("status") == "success":
-                st.success("📌 Prédiction enregistrée dans la base de données.")
-            else:
-                st.warning("⚠ Problème lors de l'enregistrement côté serveur.")
-                
-        except Exception as e:
-            st.warning(f"⚠ Erreur de connexion à la base de données : {e}")
-
-
-            
+        if logged:
+            st.success("📌 Prédiction enregistrée dans la base de données.")
+        elif mode == "API FastAPI (recommandé)":
+            st.warning("⚠ Prédiction non journalisée côté serveur (file d'écriture saturée).")
+        else:
+            try:
+                from datetime import datetime, timezone
+
+                save_endpoint = f"{api_url.rstrip('/')}/save-prediction"
+                save_payload = {
+                    "payload": payload,
+                    "predicted_cluster": int(predicted_cluster) if predicted_cluster is not None else -1,
+                    "confidence": float(confidence) if confidence is not None else 0.0,
+                    # Correction ici : Utilisation de timezone.utc
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "pc1": None,
+                    "pc2": None
+                }
+
+                req = requests.post(save_endpoint, json=save_payload, timeout=10)
+                req.raise_for_status()
+                resp = req.json()
+
+                if resp.get("status") == "success":
+                    st.success("📌 Prédiction enregistrée dans la base de données.")
+                else:
+                    st.warning("⚠ Problème lors de l'enregistrement côté serveur.")
+
+            except Exception as e:
+                st.warning(f"⚠ Erreur de connexion à la base de données : {e}")
+
+
+
         # === AFFICHAGE RÉSULTAT ===
         if predicted_cluster is not None:
             segment = SEGMENTS.get(predicted_cluster, SEGMENTS[3])
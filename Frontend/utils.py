@@ -10,8 +10,15 @@ import pandas as pd
 import joblib
 import json
 import requests
-from typing import Optional, Dict, Any
+import io
+from typing import Optional, Dict, Any, List, Tuple
 import os
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
 
 
 # -------------------------------------------------------------------------
@@ -126,6 +133,50 @@ def call_predict_api(payload: Dict[str, Any], endpoint: str = "/predict-cluster"
         st.stop()
     return {}
 
+def call_predict_batch_api(clients: List[Dict[str, Any]], timeout: int = 60) -> List[Dict[str, Any]]:
+    """Prédit un lot de clients en un seul aller-retour HTTP (/predict-cluster/batch)."""
+    url = f"{get_api_url()}/predict-cluster/batch"
+    try:
+        with st.spinner(f"Prédiction de {len(clients):,} clients..."):
+            r = requests.post(url, json={"clients": clients}, timeout=timeout)
+            r.raise_for_status()
+            return r.json().get("results", [])
+    except Exception as e:
+        st.error(f"Erreur API : {e}")
+        st.stop()
+    return []
+
+
+# ============================================================
+# RÉPONSES BINAIRES COLONNE PAR COLONNE (/pca, /apply-pca, /cluster)
+# ============================================================
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+NPY = "application/x-npy"
+
+def preferred_accept() -> str:
+    """En-tête Accept : Arrow si pyarrow est installé, sinon .npy (NumPy seul), JSON en dernier recours."""
+    if pa is not None:
+        return f"{ARROW_STREAM}, {NPY};q=0.9, application/json;q=0.5"
+    return f"{NPY}, application/json;q=0.5"
+
+def decode_api_response(r: requests.Response, records_key: str = "data") -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Décode une réponse tabulaire de l'API en (DataFrame, métadonnées),
+    quel que soit le format renvoyé (Arrow, .npy ou JSON historique).
+    """
+    content_type = r.headers.get("content-type", "").split(";")[0].strip()
+    if content_type in (ARROW_STREAM, NPY):
+        meta = json.loads(r.headers.get("X-Response-Meta", "{}"))
+        if content_type == ARROW_STREAM:
+            df = pa.ipc.open_stream(r.content).read_all().to_pandas()
+        else:
+            df = pd.DataFrame(np.load(io.BytesIO(r.content), allow_pickle=False))
+        return df, meta
+
+    body = r.json()
+    records = body.pop(records_key, [])
+    return pd.DataFrame(records), body
+
 
 # ============================================================
 # UI HELPERS
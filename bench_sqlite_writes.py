@@ -0,0 +1,214 @@
+"""
+bench_sqlite_writes.py
+----------------------
+Banc d'essai de concurrence SQLite : débit d'écriture selon les réglages de database.py.
+
+Plusieurs processus (comme des workers uvicorn), chacun avec plusieurs threads,
+travaillent en même temps sur une copie de la base :
+
+  - insert : une prédiction par transaction (comme /save-prediction) ;
+  - bulk   : réaffectation de cluster_kmeans d'une fenêtre de clients, agrégats de
+             segments compris (comme /cluster?save_to_db=true), toutes les --bulk-pause s ;
+  - read   : lecture des statistiques de segments (comme /segments/stats).
+
+Chaque profil (variables SQLITE_* de database.py) est mesuré sur une copie neuve :
+transactions par seconde, latences p50 / p99 et erreurs "database is locked".
+
+Usage :
+    python bench_sqlite_writes.py                           # profils "defaut" et "tuned"
+    python bench_sqlite_writes.py --processes 4 --threads 4 --duration 10
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+CURRENT_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = CURRENT_DIR / "Backend"
+SOURCE_DB = BACKEND_DIR / "Api" / "clustering_analytics.db"
+
+# Réglages comparés (variables d'environnement lues par Backend/Api/database.py)
+PROFILES: Dict[str, Dict[str, str]] = {
+    # Comportement SQLite / sqlite3 par défaut, avant les pragmas de database.py
+    "defaut": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_BUSY_TIMEOUT_MS": "5000",
+        "SQLITE_CACHE_SIZE_KB": "2000",
+        "SQLITE_MMAP_SIZE": "0",
+    },
+    # Valeurs par défaut actuelles de database.py
+    "tuned": {},
+}
+
+# Répartition des threads de chaque processus
+THREAD_KINDS = ("insert", "insert", "bulk", "read")
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# -------------------------------------------------------------------------
+# Processus de charge
+# -------------------------------------------------------------------------
+def run_worker(duration: float, threads: int, bulk_size: int, bulk_pause: float) -> Dict[str, Any]:
+    """Charge d'un processus ; retourne latences et erreurs par type d'opération."""
+    sys.path.append(str(BACKEND_DIR))
+    from sqlalchemy import select, update
+    from sqlalchemy.exc import OperationalError
+
+    from Api.database import SessionLocal
+    from Api.models import ClientData, Prediction
+    from Api.segments import read_segment_stats, track_reassignment
+
+    with SessionLocal() as db:
+        ids = [row[0] for row in db.execute(select(ClientData.id).order_by(ClientData.id))]
+
+    stats = {kind: {"latencies": [], "locked": 0, "errors": 0} for kind in set(THREAD_KINDS)}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def insert(db, rng):
+        db.add(Prediction(payload={"bench": True}, predicted_cluster=rng.randrange(4),
+                          confidence=rng.random(), pc1=rng.random(), pc2=rng.random()))
+
+    def bulk(db, rng):
+        start = rng.randrange(max(1, len(ids) - bulk_size))
+        window = ids[start:start + bulk_size]
+        with track_reassignment(db, window):
+            db.execute(update(ClientData), [{"id": i, "cluster_kmeans": rng.randrange(4)} for i in window])
+
+    def read(db, rng):
+        read_segment_stats(db)
+
+    operations = {"insert": insert, "bulk": bulk, "read": read}
+
+    def loop(kind: str, seed: int):
+        rng = random.Random(seed)
+        latencies, locked, errors = [], 0, 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            db = SessionLocal()
+            try:
+                operations[kind](db, rng)
+                db.commit()
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            except OperationalError as e:
+                db.rollback()
+                if "locked" in str(e):
+                    locked += 1
+                else:
+                    errors += 1
+            finally:
+                db.close()
+            if kind == "bulk" and bulk_pause:
+                time.sleep(bulk_pause)
+        with lock:
+            stats[kind]["latencies"].extend(latencies)
+            stats[kind]["locked"] += locked
+            stats[kind]["errors"] += errors
+
+    workers = [
+        threading.Thread(target=loop, args=(THREAD_KINDS[i % len(THREAD_KINDS)], os.getpid() * 100 + i))
+        for i in range(threads)
+    ]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return stats
+
+
+# -------------------------------------------------------------------------
+# Orchestration
+# -------------------------------------------------------------------------
+def run_profile(name: str, overrides: Dict[str, str], args) -> Dict[str, Any]:
+    """Lance les processus de charge d'un profil sur une copie neuve de la base."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        src, dst = sqlite3.connect(str(SOURCE_DB)), sqlite3.connect(str(db_path))
+        try:
+            src.backup(dst)
+            # La copie repart en mode rollback journal : le profil choisit le sien
+            dst.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dst.close()
+            src.close()
+
+        env = {k: v for k, v in os.environ.items() if not k.startswith("SQLITE_")}
+        env.update(overrides, SQLITE_PATH=str(db_path))
+        command = [sys.executable, __file__, "--worker", "--duration", str(args.duration),
+                   "--threads", str(args.threads), "--bulk-size", str(args.bulk_size),
+                   "--bulk-pause", str(args.bulk_pause)]
+
+        # Schéma (tables + migrations) et agrégats initialisés une fois, avant la charge
+        subprocess.run(command[:2] + ["--prepare"], env=env, check=True, stderr=subprocess.DEVNULL)
+        procs = [subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                 for _ in range(args.processes)]
+        outputs = [json.loads(p.communicate()[0].decode().strip().splitlines()[-1]) for p in procs]
+
+    summary = {}
+    for kind in sorted(set(THREAD_KINDS)):
+        latencies = [v for out in outputs for v in out[kind]["latencies"]]
+        summary[kind] = {
+            "tx_per_s": round(len(latencies) / args.duration, 1),
+            "p50_ms": round(_percentile(latencies, 0.50), 2),
+            "p99_ms": round(_percentile(latencies, 0.99), 2),
+            "locked": sum(out[kind]["locked"] for out in outputs),
+            "errors": sum(out[kind]["errors"] for out in outputs),
+        }
+    return summary
+
+
+def prepare() -> None:
+    sys.path.append(str(BACKEND_DIR))
+    from Api.database import Base, SessionLocal, engine
+    from Api.migrations import run_migrations
+    from Api.segments import ensure_segment_aggregates
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    with SessionLocal() as db:
+        ensure_segment_aggregates(db)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Débit d'écriture SQLite concurrent selon les pragmas")
+    parser.add_argument("--processes", type=int, default=4, help="Processus concurrents (workers)")
+    parser.add_argument("--threads", type=int, default=4, help="Threads par processus")
+    parser.add_argument("--duration", type=float, default=10.0, help="Durée de chaque profil (s)")
+    parser.add_argument("--bulk-size", type=int, default=500, help="Clients réaffectés par transaction bulk")
+    parser.add_argument("--bulk-pause", type=float, default=0.2,
+                        help="Pause entre deux transactions bulk d'un thread (s, 0 = en continu)")
+    parser.add_argument("--profile", action="append", choices=sorted(PROFILES), help="Profil(s) à mesurer")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--prepare", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        prepare()
+    elif args.worker:
+        print(json.dumps(run_worker(args.duration, args.threads, args.bulk_size, args.bulk_pause)))
+    else:
+        print(f"{args.processes} processus × {args.threads} threads ({', '.join(THREAD_KINDS)}), "
+              f"{args.duration:g} s par profil")
+        for name in args.profile or list(PROFILES):
+            result = run_profile(name, PROFILES[name], args)
+            print(f"\n=== {name} {PROFILES[name] or '(réglages de database.py)'}")
+            print(f"{'opération':<10}{'tx/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'locked':>10}{'erreurs':>10}")
+            for kind, row in result.items():
+                print(f"{kind:<10}{row['tx_per_s']:>10}{row['p50_ms']:>10}{row['p99_ms']:>10}"
+                      f"{row['locked']:>10}{row['errors']:>10}")
@@ -22,6 +22,8 @@ sys.path.append(str(PROJECT_DIR / "Backend"))
 try:
     from Backend.Api.database import SessionLocal
     from Backend.Api.models import ClientData
+    from Backend.Api.categorical import CategoricalNormalizer
+    from Backend.Api.segments import rebuild_segment_aggregates
 except ImportError as e:
     print(f"❌ Erreur d'import Backend : {e}")
     sys.exit(1)
@@ -89,6 +91,11 @@ def force_sync():
             "Dt_Customer": c.dt_customer
         } for c in clients])
 
+        # Même normalisation catégorielle que l'API (catégories apprises par le OneHotEncoder)
+        normalizer = CategoricalNormalizer.from_preprocessor(preprocessor)
+        if normalizer:
+            df = normalizer.normalize_frame(df)
+
         # Transformation et Prédiction
         # Le preprocessor va maintenant trouver les colonnes 'Age' et 'Customer_Seniority'
         X_transformed = preprocessor.transform(df)
@@ -97,6 +104,11 @@ def force_sync():
         logger.info(f"💾 Écriture des {len(labels)} clusters dans SQLite...")
         for i, cluster_id in enumerate(labels):
             clients[i].cluster_kmeans = int(cluster_id)
+
+        # Tous les clients sont réassignés : agrégats de segments recalculés dans la même transaction
+        db.flush()
+        drift = rebuild_segment_aggregates(db)
+        logger.info(f"📊 Agrégats de segments recalculés ({drift} cellules modifiées).")
         
         db.commit()
         logger.info("✅ Base de données synchronisée avec succès !")
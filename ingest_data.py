@@ -174,8 +174,9 @@ logger = logging.getLogger("ingestion")
 
 # Maintenant on peut importer les modules Backend
 try:
-    from Backend.Api.database import SessionLocal
+    from Backend.Api.database import SessionLocal, engine
     from Backend.Api.Crud import bulk_upsert_clients
+    from Backend.Api.migrations import run_migrations
 except ImportError as e:
     logger.error(f"Erreur d'importation des modules Backend : {e}")
     sys.exit(1)
@@ -246,6 +247,8 @@ def run_ingestion(csv_path: str):
     logger.info("--- DÉMARRAGE DU PROCESSUS D'INGESTION ---")
     db = SessionLocal()
     try:
+        # Empreinte unique de la clé naturelle (income, year_birth, dt_customer) : dédoublonnage par ON CONFLICT
+        run_migrations(engine)
         df_cleaned = clean_marketing_data(csv_path)
         
         from Backend.Api.models import ClientData
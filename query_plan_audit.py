@@ -0,0 +1,202 @@
+"""
+query_plan_audit.py
+-------------------
+Audit des plans d'exécution SQLite des requêtes de Backend/Api/Crud.py.
+
+Chaque fonction publique de Crud.py est appelée avec des arguments représentatifs
+sur une copie de la base (migrations appliquées), les requêtes émises sont
+capturées, puis rejouées avec `EXPLAIN QUERY PLAN`. L'audit échoue (code de
+sortie 1) si un plan contient :
+
+  - un parcours complet de table (`SCAN <table>` sans index) ;
+  - un tri en mémoire pour un ORDER BY (`USE TEMP B-TREE FOR ORDER BY`).
+
+Une fonction de Crud.py sans scénario d'appel fait aussi échouer l'audit.
+
+Usage :
+    python query_plan_audit.py                  # copie de Backend/Api/clustering_analytics.db
+    python query_plan_audit.py --db autre.db    # copie d'une autre base
+    python query_plan_audit.py --verbose        # affiche tous les plans
+"""
+
+import argparse
+import inspect
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import pandas as pd
+
+CURRENT_DIR = Path(__file__).resolve().parent
+# Même convention d'import que l'API (package "Api")
+sys.path.append(str(CURRENT_DIR / "Backend"))
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from Api import Crud  # noqa: E402
+from Api.database import DB_PATH, Base  # noqa: E402
+from Api.migrations import run_migrations  # noqa: E402
+
+# Tables minuscules (une ligne par segment et colonne) : un parcours complet y est normal
+SMALL_TABLES = {"segment_aggregates"}
+
+_FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+_AUDITED = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+SAMPLE_CLIENT = {
+    "year_birth": 1975, "education": "PhD", "marital_status": "Married", "income": 58138.0,
+    "dt_customer": datetime(2012, 9, 4), "age": 49, "customer_seniority": 140,
+    "kidhome": 0, "teenhome": 0, "recency": 58,
+    "mnt_wines": 635.0, "mnt_fruits": 88.0, "mnt_meat": 546.0, "mnt_fish": 172.0,
+    "mnt_sweets": 88.0, "mnt_gold": 88.0,
+    "num_deals": 3, "num_web": 8, "num_catalog": 10, "num_store": 4, "num_web_visits": 7,
+}
+
+
+# -------------------------------------------------------------------------
+# Scénarios d'appel (un ou plusieurs par fonction de Crud.py)
+# -------------------------------------------------------------------------
+def _scenarios(db) -> Dict[str, List[Callable[[], Any]]]:
+    client = Crud.create_client(db, dict(SAMPLE_CLIENT))
+    db.commit()
+    duplicate = pd.DataFrame([SAMPLE_CLIENT, dict(SAMPLE_CLIENT, income=61000.0)])
+    pca_df = pd.DataFrame({"client_id": [client.id], "PC1": [0.5], "PC2": [-1.2]})
+    return {
+        "create_client": [lambda: Crud.create_client(db, dict(SAMPLE_CLIENT, income=1.0))],
+        "update_client": [lambda: Crud.update_client(db, client, {"recency": 12})],
+        # Client retiré de la session : db.get doit interroger la base (pas l'identity map)
+        "get_client_by_id": [lambda: (db.expunge(client), Crud.get_client_by_id(db, client.id))],
+        "get_clients_by_cluster": [
+            lambda: Crud.get_clients_by_cluster(db, "cluster_kmeans", 0),
+            lambda: Crud.get_clients_by_cluster(db, "cluster_cah", 0),
+        ],
+        "bulk_upsert_clients": [
+            lambda: Crud.bulk_upsert_clients(db, duplicate),
+            lambda: Crud.bulk_upsert_clients(db, duplicate.assign(id=client.id), id_col="id"),
+        ],
+        "save_cluster_profiles": [lambda: Crud.save_cluster_profiles(db, "kmeans", {0: {"income": 1.0}})],
+        "save_pca_results": [lambda: Crud.save_pca_results(db, pca_df, "kmeans", "client_id")],
+        "get_latest_cluster_profiles": [
+            lambda: Crud.get_latest_cluster_profiles(db),
+            lambda: Crud.get_latest_cluster_profiles(db, "kmeans"),
+        ],
+        "get_pca_coords": [
+            lambda: Crud.get_pca_coords(db),
+            lambda: Crud.get_pca_coords(db, "kmeans"),
+        ],
+    }
+
+
+def crud_functions() -> List[str]:
+    """Fonctions publiques définies dans Crud.py (et non importées)."""
+    return [
+        name for name, obj in inspect.getmembers(Crud, inspect.isfunction)
+        if obj.__module__ == Crud.__name__ and not name.startswith("_")
+    ]
+
+
+# -------------------------------------------------------------------------
+# Capture et analyse des plans
+# -------------------------------------------------------------------------
+def plan_problems(plan: List[str]) -> List[str]:
+    """Lignes du plan qui trahissent un parcours complet ou un tri évitable."""
+    problems = []
+    for detail in plan:
+        match = _FULL_SCAN.match(detail)
+        if match and match.group(1) not in SMALL_TABLES:
+            problems.append(detail)
+        elif detail.startswith("USE TEMP B-TREE FOR ORDER BY"):
+            problems.append(detail)
+    return problems
+
+
+def _copy_database(source: Path, target: Path) -> None:
+    """Copie cohérente (API de sauvegarde SQLite), même si la base est en cours d'utilisation."""
+    src = sqlite3.connect(str(source))
+    dst = sqlite3.connect(str(target))
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def audit(db_path: Path, verbose: bool = False) -> int:
+    """Exécute l'audit ; retourne le nombre de requêtes en échec (+ fonctions non couvertes)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        copy_path = Path(tmp) / "audit.db"
+        if db_path.exists():
+            _copy_database(db_path, copy_path)
+        engine = create_engine(f"sqlite:///{copy_path}", future=True)
+        Base.metadata.create_all(bind=engine)
+        version = run_migrations(engine)
+        print(f"Base auditée : copie de {db_path} (schéma v{version}, {_count_clients(engine)} clients)")
+
+        captured: List[Tuple[str, str, Any]] = []
+        current = {"name": None}
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if current["name"] and statement.lstrip().upper().startswith(_AUDITED):
+                params = parameters[0] if executemany and parameters else parameters
+                captured.append((current["name"], statement, params))
+
+        event.listen(engine, "before_cursor_execute", capture)
+        db = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False, future=True)()
+        try:
+            scenarios = _scenarios(db)
+            for name, calls in scenarios.items():
+                current["name"] = name
+                for call in calls:
+                    call()
+                db.commit()
+        finally:
+            current["name"] = None
+            db.close()
+            event.remove(engine, "before_cursor_execute", capture)
+
+        failures = 0
+        missing = sorted(set(crud_functions()) - set(scenarios))
+        for name in missing:
+            print(f"❌ {name} : aucun scénario d'audit (à ajouter dans _scenarios)")
+            failures += 1
+
+        seen = set()
+        with engine.connect() as conn:
+            for name, statement, params in captured:
+                if (name, statement) in seen:
+                    continue
+                seen.add((name, statement))
+                plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", params)]
+                problems = plan_problems(plan)
+                sql = " ".join(statement.split())
+                if problems:
+                    failures += 1
+                    print(f"❌ {name} : {sql[:120]}")
+                    for detail in problems:
+                        print(f"     → {detail}")
+                elif verbose:
+                    print(f"✅ {name} : {sql[:120]}")
+                    for detail in plan:
+                        print(f"     {detail}")
+        engine.dispose()
+
+    print(f"{len(seen)} requêtes auditées, {failures} problème(s).")
+    return failures
+
+
+def _count_clients(engine) -> int:
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("SELECT COUNT(*) FROM client_data").scalar() or 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN des requêtes de Crud.py")
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="Base SQLite à auditer (copiée, jamais modifiée)")
+    parser.add_argument("--verbose", action="store_true", help="Affiche aussi les plans corrects")
+    args = parser.parse_args()
+    sys.exit(1 if audit(args.db, args.verbose) else 0)
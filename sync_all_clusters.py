@@ -7,9 +7,11 @@ et demande à l'API de sauvegarder les résultats.
 """
 
 import requests
+import json
 import os
 import logging
 import sys
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -153,64 +155,117 @@ logging.basicConfig(
 
 # ... (Gardez vos imports et résolutions de chemins)
 
+# Taille des pages lues en base et envoyées au fil de l'eau
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "2000"))
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8001")
+# Délais réseau (connexion, lecture entre deux lignes de réponse) en secondes
+SYNC_CONNECT_TIMEOUT = float(os.getenv("SYNC_CONNECT_TIMEOUT", "10"))
+SYNC_READ_TIMEOUT = float(os.getenv("SYNC_READ_TIMEOUT", "300"))
+# Mode job : intervalle de polling et durée maximale d'attente
+SYNC_POLL_INTERVAL = float(os.getenv("SYNC_POLL_INTERVAL", "2"))
+SYNC_JOB_TIMEOUT = float(os.getenv("SYNC_JOB_TIMEOUT", "3600"))
+
+
+def client_to_record(c) -> dict:
+    """Mapping DB (client_data) -> ClientSchema de l'API."""
+    return {
+        "id": c.id, # On passe l'ID pour que l'API sache qui mettre à jour
+        "Age": c.age,
+        "Income": c.income,
+        "Education": c.education,
+        "Marital_Status": c.marital_status,
+        "Customer_Seniority": c.customer_seniority,
+        "Kidhome": c.kidhome,
+        "Teenhome": c.teenhome,
+        "Recency": c.recency,
+        "MntWines": c.mnt_wines,
+        "MntFruits": c.mnt_fruits,
+        "MntMeatProducts": c.mnt_meat,
+        "MntFishProducts": c.mnt_fish,
+        "MntSweetProducts": c.mnt_sweets,
+        "MntGoldProds": c.mnt_gold,
+        "NumDealsPurchases": c.num_deals,
+        "NumWebPurchases": c.num_web,
+        "NumCatalogPurchases": c.num_catalog,
+        "NumStorePurchases": c.num_store,
+        "NumWebVisitsMonth": c.num_web_visits
+    }
+
+
+def iter_ndjson_pages(db, stats: dict):
+    """
+    Corps NDJSON (un client par ligne) produit page par page (pagination par ID) :
+    ni la table complète ni le payload JSON complet ne sont gardés en mémoire.
+    """
+    last_id = 0
+    while True:
+        page = (
+            db.query(ClientData)
+            .filter(ClientData.id > last_id)
+            .order_by(ClientData.id)
+            .limit(SYNC_PAGE_SIZE)
+            .all()
+        )
+        if not page:
+            break
+        if last_id == 0:
+            # DEBUG: Vérification du premier ID
+            logger.info(f"Premier ID récupéré en base : {page[0].id}")
+        last_id = page[-1].id
+        stats["sent"] += len(page)
+        yield "".join(json.dumps(client_to_record(c)) + "\n" for c in page).encode("utf-8")
+        db.expunge_all()
+
+
 def run_global_sync():
     """
-    Extrait les clients de SQLite, les formate et appelle l'endpoint /cluster
-    pour mettre à jour les étiquettes de segmentation.
+    Extrait les clients de SQLite page par page et les envoie en streaming à
+    l'endpoint /cluster/stream, qui score et met à jour les étiquettes de
+    segmentation lot par lot.
     """
     logger.info("--- DÉMARRAGE D'UNE NOUVELLE SYNCHRONISATION ---")
     
     db = SessionLocal()
     try:
-        clients_db = db.query(ClientData).all()
-        if not clients_db:
+        total = db.query(ClientData).count()
+        if not total:
             # logger.warning("La base de données est vide.")
             logger.warning("La base de données est vide. Lancez d'abord ingest_data.py.")
             return
 
-        # DEBUG: Vérification du premier ID
-        logger.info(f"Premier ID récupéré en base : {clients_db[0].id}")
-        logger.info(f"🔍 {len(clients_db)} clients récupérés pour analyse.")
-
-        payload = {
-            "clients": [
-                {
-                    "id": c.id, # On passe l'ID pour que l'API sache qui mettre à jour
-                    "Age": c.age, 
-                    "Income": c.income,
-                    "Education": c.education,
-                    "Marital_Status": c.marital_status,
-                    "Customer_Seniority": c.customer_seniority,
-                    "Kidhome": c.kidhome,
-                    "Teenhome": c.teenhome,
-                    "Recency": c.recency,
-                    "MntWines": c.mnt_wines,
-                    "MntFruits": c.mnt_fruits,
-                    "MntMeatProducts": c.mnt_meat,
-                    "MntFishProducts": c.mnt_fish,
-                    "MntSweetProducts": c.mnt_sweets,
-                    "MntGoldProds": c.mnt_gold,
-                    "NumDealsPurchases": c.num_deals,
-                    "NumWebPurchases": c.num_web,
-                    "NumCatalogPurchases": c.num_catalog,
-                    "NumStorePurchases": c.num_store,
-                    "NumWebVisitsMonth": c.num_web_visits
-                } for c in clients_db
-            ]
-        }
-
-        # On force save_to_db=true dans l'URL
-        url = "http://127.0.0.1:8001/cluster?save_to_db=true"
-        response = requests.post(url, json=payload)
-        
-        if response.status_code == 200:
-            logger.info(f"🎉 Succès ! Réponse API : {response.json().get('status')}")
+        logger.info(f"🔍 {total} clients à analyser (pages de {SYNC_PAGE_SIZE}).")
+
+        # On force save_to_db=true ; results=false : une ligne de progression par lot
+        # (requests envoie tout le corps avant de lire la réponse)
+        url = f"{API_URL}/cluster/stream?save_to_db=true&results=false"
+        stats = {"sent": 0}
+        response = requests.post(
+            url,
+            data=iter_ndjson_pages(db, stats),
+            headers={"Content-Type": "application/x-ndjson"},
+            stream=True,
+            timeout=(SYNC_CONNECT_TIMEOUT, SYNC_READ_TIMEOUT),
+        )
+
+        if response.status_code != 200:
+            logger.error(f"❌ Échec de l'API : {response.status_code} - {response.text}")
+            return
+
+        last = None
+        for line in response.iter_lines():
+            if not line:
+                continue
+            last = json.loads(line)
+            if last.get("status") == "progress":
+                logger.info(f"⏳ {last['processed']}/{total} clients segmentés")
+
+        if last and last.get("status") == "success":
+            logger.info(f"🎉 Succès ! {last['total_clients']} clients segmentés en {last['batches']} lots.")
             logger.info("🎉 Succès ! Tous les clients ont été segmentés et mis à jour en base.")
         else:
-            logger.error(f"❌ Échec de l'API : {response.status_code} - {response.text}")
+            logger.error(f"❌ Échec de l'API : {last}")
 
     except Exception as e:
-        logger.error(f"❌ Erreur : {e}")
         logger.error(f"❌ Une erreur est survenue lors de la synchronisation : {e}")
     finally:
         db.close()
@@ -219,5 +274,51 @@ def run_global_sync():
         for handler in logging.root.handlers:
             handler.close()
 
+def run_job_sync(only_missing: bool = False):
+    """
+    Variante sans requête longue : soumet un job de scoring (/jobs) puis suit sa
+    progression par polling. Le job continue côté API même si ce script s'arrête.
+    """
+    logger.info("--- DÉMARRAGE D'UNE SYNCHRONISATION (JOB) ---")
+    timeout = (SYNC_CONNECT_TIMEOUT, 30)
+    try:
+        response = requests.post(
+            f"{API_URL}/jobs",
+            params={"kind": "cluster_clients", "only_missing": only_missing},
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        job = response.json()["job"]
+        logger.info(f"📌 Job {job['job_id']} soumis.")
+
+        deadline = time.monotonic() + SYNC_JOB_TIMEOUT
+        while job["status"] in ("queued", "running"):
+            if time.monotonic() > deadline:
+                logger.error(f"⌛ Job {job['job_id']} toujours en cours après {SYNC_JOB_TIMEOUT:.0f}s (non annulé).")
+                return
+            time.sleep(SYNC_POLL_INTERVAL)
+            response = requests.get(f"{API_URL}/jobs/{job['job_id']}", timeout=timeout)
+            response.raise_for_status()
+            job = response.json()["job"]
+            if job["status"] == "running" and job["total_rows"]:
+                eta = f", ETA {job['eta_seconds']:.0f}s" if job["eta_seconds"] is not None else ""
+                logger.info(f"⏳ {job['processed_rows']}/{job['total_rows']} clients segmentés{eta}")
+
+        if job["status"] == "succeeded":
+            logger.info(f"🎉 Succès ! {job['processed_rows']} clients segmentés ({job['skipped_rows']} ignorés).")
+        else:
+            logger.error(f"❌ Job {job['status']} : {job.get('error')}")
+
+    except Exception as e:
+        logger.error(f"❌ Une erreur est survenue lors de la synchronisation : {e}")
+    finally:
+        logger.info("--- FIN DE SESSION ---")
+        for handler in logging.root.handlers:
+            handler.close()
+
 if __name__ == "__main__":
-    run_global_sync()
\ No newline at end of file
+    # --job : job en arrière-plan suivi par polling (pas de requête HTTP longue)
+    if "--job" in sys.argv:
+        run_job_sync(only_missing="--only-missing" in sys.argv)
+    else:
+        run_global_sync()